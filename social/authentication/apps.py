@@ -1,7 +1,21 @@
 # -*- coding: utf-8 -*-
 
 from django.apps import AppConfig
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
 
 
 class AuthenticationConfig(AppConfig):
     name = 'authentication'
+
+    def ready(self):
+        from .backends import invalidate_saved_profile, invalidate_saved_user
+
+        # Saving covers logins too, which update last_login
+        for signal in (post_save, post_delete):
+            signal.connect(
+                invalidate_saved_user, sender=get_user_model(),
+                dispatch_uid='authentication.invalidate_saved_user')
+            signal.connect(
+                invalidate_saved_profile, sender=self.get_model('Profile'),
+                dispatch_uid='authentication.invalidate_saved_profile')
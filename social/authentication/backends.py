@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+USER_KEY = 'auth:user:%s'
+
+
+def invalidate_user(user_id):
+    """
+    Drops the cached user and profile. Saving or deleting either of them
+    does it; changes made through update() must call it
+    """
+    cache.delete(USER_KEY % user_id)
+
+
+def invalidate_saved_user(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+
+
+def invalidate_saved_profile(sender, instance, **kwargs):
+    invalidate_user(instance.user_id)
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    Reads the user of each request from the cache, with its profile already
+    attached. On a miss, both are loaded in one joined query
+    """
+
+    def get_user(self, user_id):
+        key = USER_KEY % user_id
+        user = cache.get(key)
+
+        if user is None:
+            UserModel = get_user_model()
+
+            try:
+                user = UserModel._default_manager.select_related(
+                    'profile').get(pk=user_id)
+            except UserModel.DoesNotExist:
+                return None
+
+            cache.set(key, user, settings.AUTH_USER_CACHE_TIMEOUT)
+
+        return user
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.7 on 2026-10-18 19:47
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0003_auto_20160620_2027'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='follower_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.7 on 2026-10-18 19:50
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0004_profile_follower_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -7,6 +7,8 @@ from django.conf import settings
 class Profile(models.Model):
 
     image = models.ImageField(upload_to='profile/%Y/%m/%d/', blank=True)
+    follower_count = models.PositiveIntegerField(default=0)
+    version = models.PositiveIntegerField(default=0)
 
     user = models.OneToOneField(
         settings.AUTH_USER_MODEL,
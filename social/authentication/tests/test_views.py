@@ -3,10 +3,14 @@
 from django.core.urlresolvers import reverse
 
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
 import os
 
+from authentication.backends import USER_KEY, CachedModelBackend
 from authentication.models import Profile
 
 
@@ -77,7 +81,8 @@ class ProfileViewTest(TestCase):
         self.assertContains(response, 'new@email.com')
         self.assertContains(response, 'changed_first_name')
         self.assertContains(response, 'changed_last_name')
-        self.assertContains(response, 'profile_test')
+        self.assertContains(
+            response, Profile.objects.get(id=self.profile.id).image.url)
 
     def test_edit_profile_without_first_name(self):
         """
@@ -105,7 +110,7 @@ class ProfileViewTest(TestCase):
         self.assertNotContains(response, 'new@email.com')
         self.assertNotContains(response, 'changed_first_name')
         self.assertNotContains(response, 'changed_last_name')
-        self.assertNotContains(response, 'profile_test')
+        self.assertFalse(Profile.objects.get(id=self.profile.id).image)
 
     def test_edit_profile_without_last_name(self):
         """
@@ -133,7 +138,7 @@ class ProfileViewTest(TestCase):
         self.assertNotContains(response, 'new@email.com')
         self.assertNotContains(response, 'changed_first_name')
         self.assertNotContains(response, 'changed_last_name')
-        self.assertNotContains(response, 'profile_test')
+        self.assertFalse(Profile.objects.get(id=self.profile.id).image)
 
     def test_edit_profile_without_email(self):
         """
@@ -161,7 +166,28 @@ class ProfileViewTest(TestCase):
         self.assertNotContains(response, 'new@email.com')
         self.assertNotContains(response, 'changed_first_name')
         self.assertNotContains(response, 'changed_last_name')
-        self.assertNotContains(response, 'profile_test')
+        self.assertFalse(Profile.objects.get(id=self.profile.id).image)
+
+    def test_profile_not_modified(self):
+        """
+        Reloading the profile with its ETag must return a 304 not modified,
+        until the profile is edited
+        """
+        response = self.access_profile_screen()
+        etag = response['ETag']
+
+        response = self.client.get(
+            reverse('authentication:profile'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.try_to_edit_profile({
+            'email': 'new@email.com',
+            'first_name': 'changed_first_name',
+            'last_name': 'changed_last_name',
+        })
+        response = self.client.get(
+            reverse('authentication:profile'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
 
     def test_edit_profile_without_image(self):
         """
@@ -264,3 +290,98 @@ class ProfilePasswordViewTest(TestCase):
             response.content.decode(), reverse('authentication:login'))
         self.user.refresh_from_db()
         self.assertTrue(self.user.check_password(new_password))
+
+    def test_change_password_ends_the_sessions(self):
+        """
+        After changing the password, the sessions started with the old one
+        must not be authenticated by the cached user anymore
+        """
+        self.client.login(username=self.username, password=self.password)
+        self.client.get(reverse('authentication:profile'))
+
+        user = User.objects.get(id=self.user.id)
+        user.set_password('new_password')
+        user.save()
+
+        response = self.client.get(reverse('authentication:profile'))
+
+        self.assertEqual(response.status_code, 302)
+
+
+class CachedUserTest(TestCase):
+
+    @classmethod
+    def setUp(cls):
+        cls.user = User.objects.create(
+            username='test_user', password='password', first_name='First')
+        cls.profile = Profile.objects.create(user=cls.user)
+
+    @classmethod
+    def tearDown(cls):
+        cls.user.delete()
+
+    def test_cached_request_runs_no_queries(self):
+        """
+        Once the session and the user are cached, authenticating a request
+        and reading the profile of the user must not query the database
+        """
+        self.client.force_login(self.user)
+        self.client.get(reverse('authentication:profile'))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('authentication:profile'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 0)
+
+    def test_session_of_the_model_backend(self):
+        """
+        A session opened before the cached backend replaced ModelBackend
+        must keep its user logged in
+        """
+        self.client.force_login(
+            self.user, 'django.contrib.auth.backends.ModelBackend')
+
+        response = self.client.get(reverse('authentication:profile'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['user'], self.user)
+
+    def test_user_is_loaded_with_its_profile(self):
+        """
+        On a cache miss, the user and its profile must be read in one query
+        """
+        with self.assertNumQueries(1):
+            user = CachedModelBackend().get_user(self.user.id)
+            self.assertEqual(user.profile, self.profile)
+
+        self.assertEqual(cache.get(USER_KEY % self.user.id), user)
+
+    def test_editing_the_profile_invalidates_the_user(self):
+        """
+        Editing the profile must show the new name on the next request and
+        bump the cached version of the profile
+        """
+        self.client.force_login(self.user)
+        self.client.get(reverse('authentication:profile'))
+
+        context = {'first_name': 'Changed', 'last_name': 'Last',
+                   'email': 'email@test.com'}
+        response = self.client.post(
+            reverse('authentication:profile'), context, follow=True)
+
+        self.assertContains(response, 'Changed')
+        self.assertEqual(response.context['profile'].version, 1)
+
+    def test_login_invalidates_the_user(self):
+        """
+        Logging in must drop the cached user, whose last_login changed
+        """
+        self.user.set_password('password')
+        self.user.save()
+        CachedModelBackend().get_user(self.user.id)
+
+        self.assertTrue(
+            self.client.login(username='test_user', password='password'))
+
+        self.assertIsNone(cache.get(USER_KEY % self.user.id))
@@ -5,21 +5,47 @@ from django.core.urlresolvers import reverse
 
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import PasswordChangeForm
+from django.db import transaction
+from django.db.models import F
 from django.http import HttpResponse
+from django.middleware.csrf import get_token
 from django.shortcuts import render, redirect
 from django.utils.decorators import method_decorator
+from django.views.decorators.cache import cache_control
 from django.views.generic import View
 
+from blobs.tasks import delete_files
+from feed.conditional import bump_feed_version, make_etag
+from replicas.router import replica_condition, use_replica
+
+from .backends import invalidate_user
 from .forms import ProfileForm
 from .models import Profile
 
 
+def profile_etag(request):
+    """
+    Validates the profile page of the viewer, which changes with the
+    version of the profile and carries the viewer's CSRF token
+    """
+    try:
+        version = request.user.profile.version
+    except ObjectDoesNotExist:
+        version = None
+
+    return make_etag(
+        'profile', request.user.id, version, get_token(request))
+
+
 class ProfileView(View):
 
     @method_decorator(login_required)
+    @method_decorator(cache_control(private=True, no_cache=True))
+    @method_decorator(replica_condition(etag_func=profile_etag))
+    @method_decorator(use_replica())
     def get(self, request):
         try:
-            profile = Profile.objects.get(user=request.user)
+            profile = request.user.profile
         except ObjectDoesNotExist:
             profile = Profile.objects.create(user=request.user)
 
@@ -38,8 +64,19 @@ class ProfileView(View):
             user.save()
 
             if form.cleaned_data['image']:
-                user.profile.image = form.cleaned_data['image']
-                user.profile.save()
+                replaced = user.profile.image.name
+
+                with transaction.atomic():
+                    user.profile.image = form.cleaned_data['image']
+                    user.profile.save()
+
+                    if replaced:
+                        delete_files.delay(names=[replaced])
+
+            # The name and image are displayed on the cards of the posts
+            Profile.objects.filter(user=user).update(version=F('version') + 1)
+            invalidate_user(user.id)
+            bump_feed_version()
 
         return redirect(reverse('authentication:profile'))
 
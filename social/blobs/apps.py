@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+
+from django.apps import AppConfig
+
+
+class BlobsConfig(AppConfig):
+    name = 'blobs'
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.db import models, transaction
+
+from .models import Blob
+from .storage import BLOBS_DIR
+
+# Names inserted in the reference set at a time
+INSERT_BATCH_SIZE = 1000
+
+
+def get_file_fields():
+    """
+    Returns the (model, field) pairs of every file field of the project
+    """
+    return [
+        (model, field)
+        for model in apps.get_models()
+        if not model._meta.proxy
+        for field in model._meta.concrete_fields
+        if isinstance(field, models.FileField)
+    ]
+
+
+def get_media_dirs():
+    """
+    Returns the directories of the media root the files are stored under:
+    the blobs and the first directory of each upload_to
+    """
+    dirs = {BLOBS_DIR}
+
+    for model, field in get_file_fields():
+        if isinstance(field.upload_to, str) and '/' in field.upload_to:
+            dirs.add(field.upload_to.split('/')[0])
+
+    return sorted(dirs)
+
+
+def get_databases():
+    """
+    Returns the aliases of the databases that may hold references, every one
+    but the replicas
+    """
+    return [alias for alias in settings.DATABASES
+            if alias not in settings.DATABASE_REPLICAS]
+
+
+def iter_references():
+    """
+    Yields the name of every file referenced by a file field, streamed from
+    each database without holding them all in memory
+    """
+    for model, field in get_file_fields():
+        for alias in get_databases():
+            names = model._base_manager.using(alias).exclude(
+                **{field.attname: ''})
+            names = names.values_list(field.attname, flat=True)
+
+            for name in names.iterator():
+                yield name
+
+
+def is_referenced(name):
+    """
+    Returns whether a file field references the file right now
+    """
+    return any(
+        model._base_manager.using(alias).filter(
+            **{field.attname: name}).exists()
+        for model, field in get_file_fields()
+        for alias in get_databases())
+
+
+class ReferenceSet(object):
+    """
+    A set of file names kept in a temporary SQLite database on disk, so the
+    references of millions of files can be looked up without loading them
+    in memory
+    """
+
+    def __enter__(self):
+        handle, self.path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+
+        self.db = sqlite3.connect(self.path)
+        self.db.execute(
+            'CREATE TABLE names (name TEXT PRIMARY KEY) WITHOUT ROWID')
+        return self
+
+    def __exit__(self, *exc_info):
+        self.db.close()
+        os.remove(self.path)
+
+    def update(self, names):
+        batch = []
+
+        for name in names:
+            batch.append((name,))
+
+            if len(batch) == INSERT_BATCH_SIZE:
+                self.insert(batch)
+                batch = []
+
+        self.insert(batch)
+
+    def insert(self, batch):
+        self.db.executemany(
+            'INSERT OR IGNORE INTO names (name) VALUES (?)', batch)
+        self.db.commit()
+
+    def __contains__(self, name):
+        row = self.db.execute('SELECT 1 FROM names WHERE name = ?', (name,))
+        return row.fetchone() is not None
+
+
+def walk_files(root, directory):
+    """
+    Yields the DirEntry of every file under the directory of the root, one
+    directory open at a time, along with its name relative to the root
+    """
+    try:
+        entries = list(os.scandir(os.path.join(root, directory)))
+    except FileNotFoundError:
+        return
+
+    for entry in entries:
+        name = '/'.join([directory, entry.name])
+
+        if entry.is_dir(follow_symlinks=False):
+            yield from walk_files(root, name)
+        elif entry.is_file(follow_symlinks=False):
+            yield name, entry
+
+
+def find_orphans(root, directories, references, min_age):
+    """
+    Yields the (name, size) of the files under the directories of the root
+    that are not in references and were not modified for min_age seconds,
+    which leaves alone the uploads whose rows are not committed yet
+    """
+    modified_before = time.time() - min_age
+
+    for directory in directories:
+        for name, entry in walk_files(root, directory):
+            if name in references:
+                continue
+
+            stat = entry.stat(follow_symlinks=False)
+            if stat.st_mtime < modified_before:
+                yield name, stat.st_size
+
+
+def remove_orphan(root, name, quarantine=None):
+    """
+    Deletes the file, or moves it under the quarantine directory, unless a
+    reference to it was added since the references were read. Returns
+    whether it was removed
+    """
+    with transaction.atomic():
+        # Locked against a concurrent save adding a reference to the blob
+        blob = Blob.objects.select_for_update().filter(name=name).first()
+
+        if is_referenced(name):
+            return False
+
+        if blob is not None:
+            blob.delete()
+
+        path = os.path.join(root, name)
+        if quarantine is None:
+            os.remove(path)
+        else:
+            target = os.path.join(quarantine, name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.move(path, target)
+
+    return True
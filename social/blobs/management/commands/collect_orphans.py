@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from blobs.gc import (
+    ReferenceSet, find_orphans, get_media_dirs, iter_references,
+    remove_orphan)
+
+
+class Command(BaseCommand):
+    help = ('Deletes the files of the media root no file field references '
+            'anymore, or only reports them with --dry-run')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'directories', nargs='*',
+            help='Directories of the media root to collect, by default the '
+                 'ones files are uploaded to. Collecting a part of the tree '
+                 'at a time keeps each run short')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report the orphaned files without removing them')
+        parser.add_argument(
+            '--quarantine',
+            help='Move the orphaned files under this directory, outside the '
+                 'collected ones, instead of deleting them')
+        parser.add_argument(
+            '--min-age', type=int, default=60 * 60 * 24,
+            help='Seconds since a file was last modified before it can be '
+                 'collected')
+
+    def handle(self, *args, **options):
+        root = settings.MEDIA_ROOT
+        directories = [directory.strip('/') for directory in
+                       options['directories'] or get_media_dirs()]
+        quarantine = options['quarantine']
+        if quarantine:
+            quarantine = os.path.abspath(quarantine)
+
+        found = removed = size = 0
+
+        with ReferenceSet() as references:
+            references.update(iter_references())
+
+            for name, file_size in find_orphans(
+                    root, directories, references, options['min_age']):
+                found += 1
+                if options['verbosity'] > 1:
+                    self.stdout.write(name)
+
+                if options['dry_run']:
+                    size += file_size
+                elif remove_orphan(root, name, quarantine):
+                    removed += 1
+                    size += file_size
+
+        if options['dry_run']:
+            self.stdout.write(
+                '%d orphaned files found, %d bytes.' % (found, size))
+        else:
+            self.stdout.write('%d orphaned files %s, %d bytes.' % (
+                removed, 'quarantined' if quarantine else 'deleted', size))
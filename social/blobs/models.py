@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+
+from django.db import models
+
+
+class Blob(models.Model):
+    """
+    A file stored under the hash of its content, with the number of
+    references to it
+    """
+
+    name = models.CharField(max_length=100, unique=True)
+    size = models.BigIntegerField()
+    refcount = models.PositiveIntegerField(default=1)
+    created_at = models.DateTimeField(auto_now_add=True)
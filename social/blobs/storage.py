@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import Blob
+
+BLOBS_DIR = 'blobs'
+
+EXTENSION = re.compile(r'^\.[a-z0-9]{1,10}$')
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores each file under the SHA-256 of its content, sharded in two levels
+    of directories by the first characters of the hash. Saving a content that
+    is already stored only adds a reference to it, and deleting removes the
+    file once no reference is left.
+
+    The names never change for a content, so their URLs can be cached
+    forever. Files stored before, under other names, are served and deleted
+    as usual.
+    """
+
+    @staticmethod
+    def hash_content(content):
+        sha256 = hashlib.sha256()
+        content.seek(0)
+
+        for chunk in content.chunks():
+            sha256.update(chunk)
+
+        content.seek(0)
+        return sha256.hexdigest()
+
+    @staticmethod
+    def blob_name(digest, name):
+        # The extension is kept so the type of the file can be told by name
+        extension = os.path.splitext(name)[1].lower()
+        if not EXTENSION.match(extension):
+            extension = ''
+
+        return '/'.join(
+            [BLOBS_DIR, digest[:2], digest[2:4], digest + extension])
+
+    def get_available_name(self, name, max_length=None):
+        # Equal names mean equal contents, so there is nothing to avoid
+        return name
+
+    def write(self, name, content):
+        """
+        Writes the content to a temporary file moved into place at once, so
+        a concurrent save of the same content never sees a partial file
+        """
+        path = self.path(name)
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+
+        descriptor, temporary = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(descriptor, 'wb') as temporary_file:
+                for chunk in content.chunks():
+                    temporary_file.write(chunk)
+            os.chmod(temporary, self.file_permissions_mode or 0o644)
+            file_move_safe(temporary, path, allow_overwrite=True)
+        except Exception:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+
+    def _save(self, name, content):
+        name = self.blob_name(self.hash_content(content), name)
+
+        with transaction.atomic():
+            blob = Blob.objects.select_for_update().filter(name=name).first()
+
+            # A blob can outlive its file when the transaction that deleted
+            # the file was rolled back
+            if blob is None or not self.exists(name):
+                self.write(name, content)
+
+            if blob is not None:
+                Blob.objects.filter(id=blob.id).update(
+                    refcount=F('refcount') + 1)
+                return name
+
+            try:
+                with transaction.atomic():
+                    Blob.objects.create(name=name, size=content.size)
+            except IntegrityError:
+                # Stored by a concurrent save in the meantime
+                Blob.objects.filter(name=name).update(
+                    refcount=F('refcount') + 1)
+
+        return name
+
+    def delete(self, name):
+        if not name.startswith(BLOBS_DIR + '/'):
+            return super(ContentAddressedStorage, self).delete(name)
+
+        with transaction.atomic():
+            blob = Blob.objects.select_for_update().filter(name=name).first()
+
+            if blob is None:
+                # Not committed yet by the save that wrote it
+                return
+
+            if blob.refcount > 1:
+                Blob.objects.filter(id=blob.id).update(
+                    refcount=F('refcount') - 1)
+                return
+
+            blob.delete()
+            super(ContentAddressedStorage, self).delete(name)
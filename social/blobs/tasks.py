@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+
+from django.core.files.storage import default_storage
+
+from jobs.registry import task
+
+
+@task
+def delete_files(names):
+    """
+    Deletes files no longer referenced by the object that was using them
+    """
+    for name in names:
+        default_storage.delete(name)
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import time
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils.six import StringIO
+
+from authentication.models import Profile
+from blobs.gc import (
+    ReferenceSet, get_media_dirs, iter_references, remove_orphan, walk_files)
+from blobs.models import Blob
+from feed.models import Post
+
+
+class CollectOrphansCommandTests(TestCase):
+
+    @classmethod
+    def setUp(cls):
+        cls.location = tempfile.mkdtemp()
+        cls.settings_override = override_settings(MEDIA_ROOT=cls.location)
+        cls.settings_override.enable()
+
+        for name in ('profile/2016/06/30/face.png', 'blobs/ab/cd/abcd.png',
+                     'profile/2016/06/30/old.png', 'blobs/ef/01/ef01.png'):
+            cls.create_file(name, age=2 * 60 * 60)
+        Blob.objects.create(name='blobs/ef/01/ef01.png', size=7)
+
+        user = User.objects.create(username='owner', password='password')
+        profile = Profile.objects.create(
+            user=user, image='profile/2016/06/30/face.png')
+        Post.objects.create(
+            text='Post text', author=profile, image='blobs/ab/cd/abcd.png')
+
+        # Uploaded right now, its row may not be committed yet
+        cls.create_file('photos/2016/06/30/new.png', age=0)
+
+    @classmethod
+    def tearDown(cls):
+        cls.settings_override.disable()
+        shutil.rmtree(cls.location)
+
+    @classmethod
+    def create_file(cls, name, age):
+        path = os.path.join(cls.location, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as media_file:
+            media_file.write(b'content')
+
+        modified = time.time() - age
+        os.utime(path, (modified, modified))
+
+    def exists(self, name):
+        return os.path.exists(os.path.join(self.location, name))
+
+    def collect(self, *args, **options):
+        output = StringIO()
+        call_command('collect_orphans', *args, min_age=60 * 60,
+                     stdout=output, **options)
+        return output.getvalue()
+
+    def test_dry_run(self):
+        """
+        A dry run must report the orphaned files old enough without
+        removing anything
+        """
+        output = self.collect(dry_run=True, verbosity=2)
+
+        self.assertIn('blobs/ef/01/ef01.png\n', output)
+        self.assertIn('profile/2016/06/30/old.png\n', output)
+        self.assertIn('2 orphaned files found, 14 bytes.', output)
+        self.assertTrue(self.exists('profile/2016/06/30/old.png'))
+        self.assertTrue(Blob.objects.exists())
+
+    def test_collect_orphans(self):
+        """
+        The orphaned files old enough must be deleted with their blobs, and
+        the referenced and recent files kept
+        """
+        output = self.collect()
+
+        self.assertIn('2 orphaned files deleted, 14 bytes.', output)
+        self.assertFalse(self.exists('profile/2016/06/30/old.png'))
+        self.assertFalse(self.exists('blobs/ef/01/ef01.png'))
+        self.assertFalse(Blob.objects.exists())
+        self.assertTrue(self.exists('profile/2016/06/30/face.png'))
+        self.assertTrue(self.exists('blobs/ab/cd/abcd.png'))
+        self.assertTrue(self.exists('photos/2016/06/30/new.png'))
+
+    def test_collect_orphans_of_a_directory(self):
+        """
+        Collecting a directory must leave the orphans of the others alone
+        """
+        output = self.collect('profile')
+
+        self.assertIn('1 orphaned files deleted', output)
+        self.assertTrue(self.exists('blobs/ef/01/ef01.png'))
+
+    def test_quarantine_orphans(self):
+        """
+        Orphaned files must be moved under the quarantine directory, with
+        their names, when one is given
+        """
+        quarantine = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, quarantine)
+
+        output = self.collect(quarantine=quarantine)
+
+        self.assertIn('2 orphaned files quarantined', output)
+        self.assertFalse(self.exists('profile/2016/06/30/old.png'))
+        self.assertTrue(os.path.exists(
+            os.path.join(quarantine, 'profile/2016/06/30/old.png')))
+
+    def test_orphan_referenced_meanwhile_is_kept(self):
+        """
+        A file referenced after the references were read must not be
+        removed
+        """
+        name = 'profile/2016/06/30/old.png'
+
+        with ReferenceSet() as references:
+            references.update(iter_references())
+            self.assertNotIn(name, references)
+
+            Profile.objects.update(image=name)
+
+            self.assertFalse(remove_orphan(self.location, name))
+            self.assertTrue(self.exists(name))
+
+    def test_media_dirs_and_walk(self):
+        """
+        The uploads directories must be found from the file fields, and
+        walking one must answer its files relative to the media root
+        """
+        self.assertEqual(get_media_dirs(), ['blobs', 'photos', 'profile'])
+        self.assertEqual(
+            sorted(name for name, _ in walk_files(self.location, 'profile')),
+            ['profile/2016/06/30/face.png', 'profile/2016/06/30/old.png'])
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+
+from django.core.files.base import ContentFile
+from django.test import TestCase
+
+from blobs.models import Blob
+from blobs.storage import ContentAddressedStorage
+
+
+class ContentAddressedStorageTests(TestCase):
+
+    @classmethod
+    def setUp(cls):
+        cls.location = tempfile.mkdtemp()
+        cls.storage = ContentAddressedStorage(location=cls.location)
+
+    @classmethod
+    def tearDown(cls):
+        shutil.rmtree(cls.location)
+
+    def save(self, name, content):
+        return self.storage.save(name, ContentFile(content))
+
+    def test_name_by_content(self):
+        """
+        A file must be named by the hash of its content, sharded by its
+        first characters, keeping the extension
+        """
+        digest = hashlib.sha256(b'content').hexdigest()
+
+        name = self.save('photos/2016/06/30/Meme.PNG', b'content')
+
+        self.assertEqual(
+            name, 'blobs/%s/%s/%s.png' % (digest[:2], digest[2:4], digest))
+        self.assertTrue(os.path.exists(self.storage.path(name)))
+        self.assertEqual(Blob.objects.get(name=name).size, 7)
+
+    def test_same_content_saved_once(self):
+        """
+        Saving a content already stored must add a reference to it without
+        writing it again
+        """
+        first = self.save('first.png', b'content')
+
+        with patch.object(ContentAddressedStorage, 'write') as write:
+            second = self.save('second.png', b'content')
+
+        self.assertEqual(first, second)
+        self.assertFalse(write.called)
+        self.assertEqual(Blob.objects.get(name=first).refcount, 2)
+
+    def test_different_contents(self):
+        """
+        Different contents must be stored apart
+        """
+        first = self.save('image.png', b'first')
+        second = self.save('image.png', b'second')
+
+        self.assertNotEqual(first, second)
+        self.assertEqual(Blob.objects.count(), 2)
+
+    def test_delete_last_reference(self):
+        """
+        The file must be kept while it is referenced, and removed with its
+        last reference
+        """
+        name = self.save('first.png', b'content')
+        self.save('second.png', b'content')
+
+        self.storage.delete(name)
+
+        self.assertTrue(self.storage.exists(name))
+        self.assertEqual(Blob.objects.get(name=name).refcount, 1)
+
+        self.storage.delete(name)
+
+        self.assertFalse(self.storage.exists(name))
+        self.assertFalse(Blob.objects.exists())
+
+    def test_save_blob_without_file(self):
+        """
+        Saving a content whose file is missing must write it again
+        """
+        name = self.save('first.png', b'content')
+        os.remove(self.storage.path(name))
+
+        self.save('second.png', b'content')
+
+        self.assertTrue(self.storage.exists(name))
+        self.assertEqual(Blob.objects.get(name=name).refcount, 2)
+
+    def test_delete_file_stored_before(self):
+        """
+        A file stored under another name before must be deleted as usual
+        """
+        os.makedirs(os.path.join(self.location, 'photos'))
+        with open(os.path.join(self.location, 'photos', 'old.png'), 'wb'):
+            pass
+
+        self.storage.delete('photos/old.png')
+
+        self.assertFalse(self.storage.exists('photos/old.png'))
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""
+Gunicorn configuration of production, run from the project directory with
+
+    gunicorn -c config/gunicorn.py config.wsgi
+
+The event streams stay open for FEED_EVENTS_STREAM_TIMEOUT seconds. A sync
+worker would be held by each of them, so the workers are threaded: an idle
+stream holds a thread waiting on the broker, without a database connection
+nor queries of its own. Connections are not persistent (CONN_MAX_AGE is 0),
+so only the threads handling a request hold one
+"""
+
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '127.0.0.1:8000')
+
+workers = int(os.environ.get(
+    'GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+
+worker_class = 'gthread'
+
+# Requests and open event streams handled at once by each worker
+threads = int(os.environ.get('GUNICORN_THREADS', 100))
+
+# Seconds a worker may go without notifying the master before it is killed.
+# The threaded workers notify it from their main thread, so the long streams
+# do not trip it
+timeout = 30
+
+# The workers are restarted now and then, which frees what they leaked
+max_requests = 1000
+
+max_requests_jitter = 100
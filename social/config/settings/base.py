@@ -1,6 +1,7 @@
 # -*- conding: utf-8 -*-
 
 import os
+import tempfile
 
 BASE_DIR = os.path.dirname(os.path.dirname(
     os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
@@ -23,7 +24,11 @@ THIRD_PARTY_APPS = [
 
 LOCAL_APPS = [
     'feed',
-    'authentication'
+    'authentication.apps.AuthenticationConfig',
+    'blobs',
+    'replicas',
+    'jobs.apps.JobsConfig',
+    'metrics',
 ]
 
 INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + LOCAL_APPS
@@ -32,7 +37,10 @@ INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + LOCAL_APPS
 # MIDDLEWARE CONFIGURATION
 # ------------------------------------------------------------------------------
 MIDDLEWARE_CLASSES = [
+    # First, so it measures the time of the other middleware too
+    'metrics.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'replicas.middleware.ReplicaPinMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -60,7 +68,8 @@ USE_TZ = True
 # ------------------------------------------------------------------------------
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Django's backend, timing the rendering for the request metrics
+        'BACKEND': 'metrics.templates.DjangoTemplates',
         'DIRS': [
             APPS_DIR + '/templates'
         ],
@@ -100,6 +109,63 @@ MEDIA_ROOT = APPS_DIR + '/media'
 
 MEDIA_URL = '/media/'
 
+# Uploads are stored once per distinct content, named by its hash
+DEFAULT_FILE_STORAGE = 'blobs.storage.ContentAddressedStorage'
+
+
+# DATABASE REPLICA CONFIGURATION
+# ------------------------------------------------------------------------------
+# The shard router goes first, the posts it routes are not replicated
+DATABASE_ROUTERS = [
+    'feed.shards.FeedShardRouter',
+    'replicas.router.ReplicaRouter',
+]
+
+# Aliases of the databases replicating the primary. The reads of the views
+# marked with use_replica go to them
+DATABASE_REPLICAS = []
+
+# Seconds a replica may be behind the primary and still be read from, and
+# between the checks of its lag and health
+DATABASE_REPLICA_MAX_LAG = 2
+
+DATABASE_REPLICA_CHECK_INTERVAL = 5
+
+# Seconds the reads of a client stay on the primary after it wrote. Longer
+# than the lag allowed, so the replicas have its writes when it ends
+DATABASE_REPLICA_PIN = 5
+
+
+# FEED SHARD CONFIGURATION
+# ------------------------------------------------------------------------------
+# Aliases of the databases the posts, with their comments, likes and image
+# variants, are split among by author. Empty keeps them on the default one.
+# Run the init_shards command after creating the databases
+FEED_SHARDS = []
+
+# Size of the range of ids each shard allocates, so the shard holding an
+# object is told by its id. The ids are integer columns on PostgreSQL, up to
+# 2 ** 31 - 1, so this span leaves room for 21 shards
+FEED_SHARD_ID_SPAN = 10 ** 8
+
+
+# CACHE CONFIGURATION
+# ------------------------------------------------------------------------------
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Liked post ids of the active profiles. Must be shared by all the
+    # worker processes when there is more than one
+    'liked': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'liked',
+        'OPTIONS': {
+            'MAX_ENTRIES': 20000,
+        },
+    },
+}
+
 
 # URL CONFIGURATION
 # ------------------------------------------------------------------------------
@@ -130,8 +196,136 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# The user of each request is read from the cache along with its profile.
+# The sessions keep the backend that logged their user in, so ModelBackend
+# stays listed for the sessions opened before it was replaced. It can go
+# once they have expired, SESSION_COOKIE_AGE after the release
+AUTHENTICATION_BACKENDS = [
+    'authentication.backends.CachedModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
+# Seconds a user and its profile stay cached. Changes invalidate them; this
+# only bounds the entries of users that stopped using the site
+AUTH_USER_CACHE_TIMEOUT = 60 * 60
+
+
+# SESSION CONFIGURATION
+# ------------------------------------------------------------------------------
+# Sessions are read from the cache, and from the database only on a miss
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+
 # LOGIN CONFIGURATION
 # ------------------------------------------------------------------------------
 LOGIN_REDIRECT_URL = 'feed:feed'
 
 LOGIN_URL = 'authentication:login'
+
+
+# JOBS CONFIGURATION
+# ------------------------------------------------------------------------------
+JOBS_MAX_ATTEMPTS = 5
+
+# Seconds before retrying a failed job, doubled after every failure
+JOBS_RETRY_DELAY = 10
+
+JOBS_RETRY_MAX_DELAY = 60 * 60
+
+# Seconds after which a running job whose worker stopped answering is handed
+# to another worker
+JOBS_LOCK_TIMEOUT = 10 * 60
+
+# Seconds an idle worker waits before looking for jobs again
+JOBS_POLL_INTERVAL = 1
+
+
+# FEED CONFIGURATION
+# ------------------------------------------------------------------------------
+FEED_PAGE_SIZE = 10
+
+FEED_COMMENTS_PREVIEW = 3
+
+FEED_COMMENTS_PAGE_SIZE = 20
+
+# Authors with more followers than this are not fanned out on write; their
+# posts are merged into the followers' timelines when they are read
+FEED_FANOUT_LIMIT = 10000
+
+# Number of recent posts copied into the timeline when following someone
+FEED_TIMELINE_BACKFILL = 50
+
+# Seconds a rendered post card stays cached. Cards are invalidated by their
+# versions; this only bounds how long comment authors' names can be stale
+FEED_CARD_TIMEOUT = 60 * 60
+
+# Most posts a client can read from the JSON API in one request, and how
+# many of them are read from the database at a time
+FEED_API_MAX_LIMIT = 1000
+
+FEED_API_BATCH_SIZE = 100
+
+# Most likes and comment deletions applied by one batch request
+FEED_BATCH_MAX_ACTIONS = 100
+
+# Widths in pixels of the variants generated for the images of the posts,
+# and the quality they are encoded with
+FEED_IMAGE_WIDTHS = (320, 640, 1280)
+
+FEED_IMAGE_QUALITY = 80
+
+# Class waking the event streams when events are published. The database
+# broker also sees the events published by the other processes, polling for
+# them every FEED_EVENTS_POLL_INTERVAL seconds
+FEED_EVENTS_BROKER = 'feed.events.DatabaseBroker'
+
+FEED_EVENTS_POLL_INTERVAL = 1
+
+# Seconds an event stream stays open before the browser reconnects, and
+# between the messages that keep an idle stream open
+FEED_EVENTS_STREAM_TIMEOUT = 60
+
+FEED_EVENTS_HEARTBEAT = 15
+
+# Milliseconds the browser waits before reconnecting an event stream
+FEED_EVENTS_RETRY = 1000
+
+# Events read from the database at a time, and most posts a stream follows
+FEED_EVENTS_BATCH_SIZE = 100
+
+FEED_EVENTS_MAX_POSTS = 500
+
+# Seconds the events are kept. Sync tokens older than this are refused, as
+# the changes that follow them may be gone
+FEED_EVENTS_RETENTION = 60 * 60 * 24 * 7
+
+# Most events a sync request reads, and the age in seconds events must have
+# to be answered by the syncs and the event streams, which leaves time for
+# slower transactions to commit theirs
+FEED_SYNC_BATCH_SIZE = 500
+
+FEED_SYNC_DELAY = 2
+
+# Rows removed by each job purging a deleted post, and by each query of the
+# purge_deleted command
+FEED_PURGE_CHUNK_SIZE = 1000
+
+# Number of most recently liked post ids cached per profile, and for how many
+# seconds a profile that stopped reading the feed keeps them
+FEED_LIKED_CACHE_SIZE = 500
+
+FEED_LIKED_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+# METRICS CONFIGURATION
+# ------------------------------------------------------------------------------
+# Directory where each worker process writes its request histograms, summed
+# by the /metrics endpoint. The files of the processes that exited are added
+# to an archive there, so the totals survive the restarts of the workers
+METRICS_DIR = os.path.join(tempfile.gettempdir(), 'social-metrics')
+
+# Seconds between the writes of the histograms of a process
+METRICS_FLUSH_INTERVAL = 5
+
+# Addresses allowed to read /metrics
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
@@ -23,10 +23,40 @@ DATABASES = {
         'PASSWORD': '',
         'HOST': 'localhost',
         'PORT': '5432',
-    }
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': '',
+        'USER': '',
+        'PASSWORD': '',
+        'HOST': '',
+        'PORT': '5432',
+        'TEST': {
+            'MIRROR': 'default',
+        },
+    },
 }
 
+DATABASE_REPLICAS = ['replica']
+
 
 # HOSTS CONFIGURATION
 # ------------------------------------------------------------------------------
 ALLOWED_HOSTS = ['winstein.com.br']
+
+
+# CACHE CONFIGURATION
+# ------------------------------------------------------------------------------
+# Memcached is shared by the gunicorn workers and evicts the least recently
+# used entries once its memory limit is reached
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': '127.0.0.1:11211',
+    },
+    'liked': {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': '127.0.0.1:11211',
+        'KEY_PREFIX': 'liked',
+    },
+}
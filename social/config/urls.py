@@ -5,6 +5,7 @@ from django.contrib import admin
 
 urlpatterns = [
     url(r'^admin/', admin.site.urls),
+    url(r'^', include('metrics.urls')),
     url(r'^', include('feed.urls')),
     url(r'^', include('authentication.urls'))
 ]
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+from .pagination import decode_cursor, encode_cursor
+
+# Fields a client can ask for, and how each is read from a post
+FIELDS = {
+    'id': lambda post: post.id,
+    'text': lambda post: post.text,
+    'pub_date': lambda post: post.pub_date.isoformat(),
+    'image': lambda post: post.image.url if post.image else None,
+    'author': lambda post: {
+        'id': post.author_id,
+        'name': post.author.first_name,
+        'image': post.author.image.url if post.author.image else None,
+    },
+    'like_count': lambda post: post.like_count,
+    'comment_count': lambda post: post.comment_count,
+    'liked': lambda post: post.liked,
+    'cursor': encode_cursor,
+}
+
+DEFAULT_FIELDS = ['id', 'text', 'pub_date', 'author', 'cursor']
+
+
+def parse_fields(value):
+    """
+    Returns the fields listed, comma separated, in value, or the default
+    ones when it is empty. Raises ValueError on unknown fields
+    """
+    if not value:
+        return DEFAULT_FIELDS
+
+    fields = value.split(',')
+    unknown = set(fields) - set(FIELDS)
+    if unknown:
+        raise ValueError('Unknown fields: %s' % ', '.join(sorted(unknown)))
+
+    return fields
+
+
+def stream_posts(get_posts, user, cursor, limit, fields, batch_size):
+    """
+    Yields the posts as lines of JSON. The posts are read in batches from
+    the cursor on, so no more than one batch is held in memory
+    """
+    while limit > 0:
+        posts = list(get_posts(user, cursor, min(batch_size, limit)))
+
+        for post in posts:
+            line = {field: FIELDS[field](post) for field in fields}
+            yield json.dumps(line, separators=(',', ':')) + '\n'
+
+        if len(posts) < min(batch_size, limit):
+            return
+
+        limit -= len(posts)
+        cursor = decode_cursor(encode_cursor(posts[-1]))
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+import math
+import time
+import tracemalloc
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import CommandError
+from django.core.urlresolvers import resolve, reverse
+from django.db import DEFAULT_DB_ALIAS, connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from authentication.models import Profile
+from .models import Post
+from .shards import gather_posts, is_sharded
+
+
+# Each scenario is (name, HTTP method, URL name, request data builder). The
+# builders receive the post the scenario acts on.
+SCENARIOS = [
+    ('feed', 'get', 'feed:feed', lambda post: {}),
+    ('explore', 'get', 'feed:explore', lambda post: {}),
+    ('like', 'post', 'feed:like', lambda post: {'post_id': post.id}),
+    ('comment', 'post', 'feed:add_comment',
+     lambda post: {'post': post.id, 'text': 'Benchmark comment'}),
+    ('delete_post', 'post', 'feed:delete', lambda post: {'post_id': post.id}),
+    ('profile', 'get', 'authentication:profile', lambda post: {}),
+]
+
+
+def get_user_and_post(username=None):
+    """
+    Returns the user the scenarios run as and the post they act on: the
+    newest post of the user, or the newest post at all
+    """
+    posts = Post.objects.order_by('-pub_date', '-id')
+
+    if username:
+        # Read apart, the profiles are not on the shards
+        posts = posts.filter(author_id__in=list(Profile.objects.filter(
+            user__username=username).values_list('id', flat=True)))
+
+    if is_sharded():
+        posts = gather_posts(posts, limit=1)
+    else:
+        posts = posts.select_related('author__user')[:1]
+
+    post = next(iter(posts), None)
+    if post is None:
+        raise CommandError(
+            'There are no posts to benchmark. Run seed_data first.')
+
+    return User.objects.get(id=post.author.user_id), post
+
+
+def get_aliases():
+    """
+    Returns the aliases of the databases the views write to
+    """
+    return [DEFAULT_DB_ALIAS] + list(settings.FEED_SHARDS)
+
+
+def call_view(method, url_name, data, user):
+    """
+    Calls the view behind the URL as the given user and rolls back whatever
+    it writes, so every iteration sees the same data
+    """
+    path = reverse(url_name)
+    request = getattr(RequestFactory(), method)(path, data)
+    request.user = user
+    match = resolve(path)
+
+    with ExitStack() as stack:
+        for alias in get_aliases():
+            stack.enter_context(transaction.atomic(using=alias))
+
+        response = match.func(request, *match.args, **match.kwargs)
+
+        for alias in get_aliases():
+            transaction.set_rollback(True, using=alias)
+
+    return response
+
+
+def percentile(values, rank):
+    values = sorted(values)
+    return values[max(int(math.ceil(rank / 100.0 * len(values))) - 1, 0)]
+
+
+def measure(scenario, user, post, iterations):
+    """
+    Returns the latency percentiles in milliseconds, the highest number of
+    queries and the peak of memory allocated in KiB of a scenario
+    """
+    name, method, url_name, build_data = scenario
+    data = build_data(post)
+    latencies = []
+    queries = 0
+
+    for _ in range(iterations):
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            call_view(method, url_name, data, user)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        queries = max(queries, len(captured))
+
+    # Tracing allocations slows the view down, so memory gets its own run
+    tracemalloc.start()
+    try:
+        call_view(method, url_name, data, user)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'p99_ms': percentile(latencies, 99),
+        'queries': queries,
+        'peak_kb': peak / 1024.0,
+    }
+
+
+def check_budgets(results, budgets):
+    """
+    Returns a description of every measure above its budget
+    """
+    violations = []
+
+    for name, measures in sorted(results.items()):
+        for measure_name, limit in sorted(budgets.get(name, {}).items()):
+            if measures[measure_name] > limit:
+                violations.append('%s: %s is %.1f, budget is %s' % (
+                    name, measure_name, measures[measure_name], limit))
+
+    return violations
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+from .models import Comment, ImageVariant
+
+# Placeholders for the parts of a card that depend on the viewer. They
+# contain characters that autoescaping never lets through, so user text can
+# not fake them
+MARKERS = {
+    'like_class': mark_safe('<like-class>'),
+    'follow_text': mark_safe('<follow-text>'),
+    'csrf_input': mark_safe('<csrf-input>'),
+}
+
+# Placeholders for the classes of the controls shown to a single profile,
+# or to everybody but it, written by the templates as <viewer-only-ID> and
+# <viewer-not-ID>
+VIEWER_MARKER = re.compile(r'<viewer-(only|not)-(\d+)>')
+
+LIKED_CLASS = 'light-green-text text-accent-4'
+NOT_LIKED_CLASS = 'grey-text text-darken-2'
+
+FOLLOWING_TEXT = 'Deixar de seguir'
+NOT_FOLLOWING_TEXT = 'Seguir'
+
+
+def card_key(post):
+    """
+    Returns the cache key of the card of a post. Any change to the post or
+    to its author bumps one of the versions, so stale cards are never read
+    """
+    return 'feed:card:%d:%d:%d:%d' % (
+        post.id, post.version, post.author.version,
+        int(post.pub_date.timestamp() * 1000000))
+
+
+def overlay_viewer(html, request):
+    """
+    Shows the controls reserved to the viewer, hides the ones meant for
+    everybody else and fills in the CSRF token
+    """
+    viewer_id = request.user.profile.id
+
+    def classes(match):
+        kind, profile_id = match.group(1), int(match.group(2))
+        hidden = (profile_id == viewer_id) == (kind == 'not')
+
+        return 'viewer-%s-%d%s' % (kind, profile_id, ' hide' if hidden else '')
+
+    html = VIEWER_MARKER.sub(classes, html)
+
+    csrf_input = format_html(
+        '<input type="hidden" name="csrfmiddlewaretoken" value="{}">',
+        get_token(request))
+
+    return html.replace(MARKERS['csrf_input'], csrf_input)
+
+
+def overlay_card(html, post, request):
+    html = html.replace(
+        MARKERS['like_class'], LIKED_CLASS if post.liked else NOT_LIKED_CLASS)
+    html = html.replace(
+        MARKERS['follow_text'],
+        FOLLOWING_TEXT if post.followed else NOT_FOLLOWING_TEXT)
+
+    return overlay_viewer(html, request)
+
+
+def render_cards(request, posts):
+    """
+    Sets card on each post with its rendered HTML. Cards are read from the
+    cache in one get_many; only the missing ones load their comments and
+    image variants and go through the template
+    """
+    keys = [card_key(post) for post in posts]
+    cards = cache.get_many(keys)
+    missing = [post for post, key in zip(posts, keys) if key not in cards]
+
+    if missing:
+        Comment.attach_latest_comments(
+            missing, settings.FEED_COMMENTS_PREVIEW)
+        ImageVariant.attach_variants(missing)
+
+        rendered = {
+            card_key(post): render_to_string(
+                'feed/card.html', {'post': post, 'markers': MARKERS})
+            for post in missing
+        }
+        cache.set_many(rendered, settings.FEED_CARD_TIMEOUT)
+        cards.update(rendered)
+
+    for post, key in zip(posts, keys):
+        post.card = mark_safe(overlay_card(cards[key], post, request))
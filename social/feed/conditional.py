@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import math
+import time
+from datetime import datetime
+
+from django.core.cache import cache
+from django.middleware.csrf import get_token
+from django.utils import timezone
+
+VERSION_KEY = 'feed:version'
+MODIFIED_KEY = 'feed:modified'
+
+
+def bump_feed_version():
+    """
+    Marks that something displayed on the feeds changed. Must be called
+    once the change is committed, or a page read before the commit could
+    be validated under the new version
+    """
+    cache.set(MODIFIED_KEY, time.time(), None)
+
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        # Seeded from the clock, so a version that was evicted does not
+        # start over and match the validators handed out before
+        cache.add(VERSION_KEY, int(time.time() * 1000000), None)
+
+
+def get_feed_version():
+    version = cache.get(VERSION_KEY)
+
+    if version is None:
+        cache.add(VERSION_KEY, int(time.time() * 1000000), None)
+        version = cache.get(VERSION_KEY)
+
+    return version
+
+
+def make_etag(*parts):
+    return hashlib.sha1(
+        ':'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def feed_etag(request, *args, **kwargs):
+    """
+    Validates a feed page for its viewer: the page changes with the global
+    feed version, and its forms carry the viewer's CSRF token
+    """
+    return make_etag(
+        request.path, request.GET.urlencode(), request.user.id,
+        get_feed_version(), get_token(request))
+
+
+def feed_last_modified(request, *args, **kwargs):
+    """
+    Returns when the feeds last changed, rounded up to the second, or None
+    while that second has not passed yet: a change later in that same
+    second would not be told apart. The viewer's login counts as a change,
+    so a browser shared by two users never revalidates across them
+    """
+    last_login = request.user.last_login
+    modified = max(
+        cache.get(MODIFIED_KEY) or 0,
+        last_login.timestamp() if last_login else 0)
+    modified = math.ceil(modified)
+
+    if modified > time.time():
+        return None
+
+    return datetime.fromtimestamp(modified, timezone.utc)
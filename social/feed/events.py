@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Max, Q
+from django.utils.module_loading import import_string
+
+from .models import Event
+from .sync import get_settled_events
+
+
+class LocalBroker(object):
+    """
+    Wakes the event streams of this process when it publishes events. Enough
+    for a single process and for the tests
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.last_id = 0
+
+    def notify(self, last_id):
+        with self.condition:
+            if last_id > self.last_id:
+                self.last_id = last_id
+                self.condition.notify_all()
+
+    def wait(self, last_id, timeout):
+        """
+        Blocks until an event newer than last_id is known or the timeout
+        passes. Returns whether there is a newer event
+        """
+        with self.condition:
+            return self.condition.wait_for(
+                lambda: self.last_id > last_id, timeout)
+
+
+class DatabaseBroker(LocalBroker):
+    """
+    Also wakes the event streams for the events published by the other
+    processes. A single thread per process polls the newest event id, so
+    idle streams cost no queries of their own
+    """
+
+    def __init__(self):
+        super(DatabaseBroker, self).__init__()
+        self.poller = None
+
+    def check(self):
+        self.notify(Event.get_last_id())
+
+    def poll(self):
+        while True:
+            time.sleep(settings.FEED_EVENTS_POLL_INTERVAL)
+
+            try:
+                self.check()
+            except DatabaseError:
+                connection.close()
+
+    def wait(self, last_id, timeout):
+        with self.condition:
+            if self.poller is None:
+                self.poller = threading.Thread(target=self.poll, daemon=True)
+                self.poller.start()
+
+        return super(DatabaseBroker, self).wait(last_id, timeout)
+
+
+_brokers = {}
+_brokers_lock = threading.Lock()
+
+
+def get_broker():
+    """
+    Returns the broker set in FEED_EVENTS_BROKER, shared by the whole process
+    """
+    path = settings.FEED_EVENTS_BROKER
+
+    with _brokers_lock:
+        if path not in _brokers:
+            _brokers[path] = import_string(path)()
+
+        return _brokers[path]
+
+
+def publish(*events):
+    """
+    Appends the events to the log in one query. The streams are woken once
+    the current transaction, if any, is committed
+    """
+    broker = get_broker()
+
+    # bulk_create does not set the ids, so they are only read back when
+    # there is more than one event
+    if len(events) == 1:
+        event = events[0]
+        event.save()
+        transaction.on_commit(lambda: broker.notify(event.id))
+    else:
+        Event.objects.bulk_create(events)
+        transaction.on_commit(lambda: broker.notify(Event.get_last_id()))
+
+
+def make_filter(post_ids, author_ids):
+    """
+    Returns the condition of the events that matter to a client showing
+    post_ids: changes to those posts, and new posts by author_ids
+    """
+    return (Q(kind=Event.POST, author_id__in=author_ids) |
+            Q(post_id__in=post_ids) & ~Q(kind=Event.POST))
+
+
+def format_event(event):
+    data = json.dumps(
+        event.as_data(), separators=(',', ':'), sort_keys=True)
+    return 'id: %d\nevent: %s\ndata: %s\n\n' % (event.id, event.kind, data)
+
+
+def read_events(last_id, matches):
+    """
+    Returns the settled events after last_id that match, up to
+    FEED_EVENTS_BATCH_SIZE of them, and the id the next read starts after.
+    Like the sync, only events older than FEED_SYNC_DELAY are read, so one
+    whose transaction commits after a newer one was sent is not skipped
+    """
+    settled = get_settled_events().filter(id__gt=last_id)
+    newest = settled.aggregate(newest=Max('id'))['newest']
+
+    if newest is None:
+        return [], last_id
+
+    size = settings.FEED_EVENTS_BATCH_SIZE
+    events = settled.filter(matches, id__lte=newest).order_by('id')
+    events = list(events[:size])
+
+    if len(events) == size:
+        return events, events[-1].id
+
+    return events, newest
+
+
+def stream_events(last_id, matches):
+    """
+    Yields the events after last_id matching the condition, in the
+    text/event-stream format, until FEED_EVENTS_STREAM_TIMEOUT passes and
+    the browser reconnects from the last event id. While idle, a stream only
+    holds a thread waiting on the broker, without a database connection,
+    and runs no queries
+    """
+    broker = get_broker()
+    deadline = time.time() + settings.FEED_EVENTS_STREAM_TIMEOUT
+
+    yield 'retry: %d\n\n' % settings.FEED_EVENTS_RETRY
+
+    while True:
+        events, last_id = read_events(last_id, matches)
+
+        for event in events:
+            yield format_event(event)
+
+        if len(events) == settings.FEED_EVENTS_BATCH_SIZE:
+            continue
+
+        if not connection.in_atomic_block:
+            connection.close()
+
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return
+
+            if broker.wait(
+                    last_id, min(remaining, settings.FEED_EVENTS_HEARTBEAT)):
+                break
+
+            # Keeps the connection open and moves the id the browser
+            # reconnects from past the events it was not interested in
+            yield 'id: %d\n\n' % last_id
+
+        # The events just published settle before they are read
+        time.sleep(min(settings.FEED_SYNC_DELAY, remaining))
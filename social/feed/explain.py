@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+import re
+from contextlib import contextmanager
+
+from django.db.backends.utils import CursorWrapper
+
+EXPLAIN_PREFIXES = {
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'postgresql': 'EXPLAIN ',
+    'mysql': 'EXPLAIN ',
+}
+
+# Only these statements are explained; the others are writes of new rows or
+# transaction control
+EXPLAINED_STATEMENTS = ('SELECT', 'UPDATE', 'DELETE')
+
+SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)$')
+POSTGRESQL_SCAN = re.compile(r'Seq Scan on (\w+)')
+POSTGRESQL_SORT = re.compile(r'^\s*(?:->\s*)?(?:Incremental )?Sort\s+\(')
+
+
+class RecordingCursor(CursorWrapper):
+    """
+    Cursor that keeps the SQL and parameters of every query it executes,
+    unlike the debug cursor, which only keeps them interpolated
+    """
+
+    def __init__(self, cursor, db, queries):
+        super(RecordingCursor, self).__init__(cursor, db)
+        self.queries = queries
+
+    def execute(self, sql, params=None):
+        self.queries.append((sql, params))
+        return super(RecordingCursor, self).execute(sql, params)
+
+
+@contextmanager
+def record_queries(connection):
+    """
+    Yields a list that receives the (sql, params) pair of every query run
+    on the connection inside the block
+    """
+    queries = []
+    force_debug_cursor = connection.force_debug_cursor
+    # Restored afterwards, the cursors may be wrapped already by the metrics
+    make_debug_cursor = connection.make_debug_cursor
+    connection.force_debug_cursor = True
+    connection.make_debug_cursor = (
+        lambda cursor: RecordingCursor(cursor, connection, queries))
+
+    try:
+        yield queries
+    finally:
+        connection.make_debug_cursor = make_debug_cursor
+        connection.force_debug_cursor = force_debug_cursor
+
+
+def is_explained(sql):
+    return sql.lstrip().upper().startswith(EXPLAINED_STATEMENTS)
+
+
+def explain(connection, sql, params):
+    """
+    Returns the lines of the plan the database chooses for the query
+    """
+    prefix = EXPLAIN_PREFIXES[connection.vendor]
+
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + sql, params)
+        columns = [column[0] for column in cursor.description]
+        rows = cursor.fetchall()
+
+    if connection.vendor == 'sqlite':
+        return [row[columns.index('detail')] for row in rows]
+
+    if connection.vendor == 'mysql':
+        return [
+            ' '.join('%s=%s' % pair for pair in zip(columns, row))
+            for row in rows
+        ]
+
+    return [row[0] for row in rows]
+
+
+def find_problems(vendor, plan, tables):
+    """
+    Returns (line, problem) for every line of the plan reading a whole table
+    or sorting rows that no index returns in order
+    """
+    problems = []
+
+    for line in plan:
+        if vendor == 'sqlite':
+            scan = SQLITE_SCAN.match(line)
+            if scan and scan.group(1) in tables:
+                problems.append((line, 'sequential scan'))
+            if 'TEMP B-TREE' in line:
+                problems.append((line, 'filesort'))
+
+        elif vendor == 'postgresql':
+            scan = POSTGRESQL_SCAN.search(line)
+            if scan and scan.group(1) in tables:
+                problems.append((line, 'sequential scan'))
+            if POSTGRESQL_SORT.match(line):
+                problems.append((line, 'filesort'))
+
+        elif vendor == 'mysql':
+            if 'type=ALL' in line.split():
+                problems.append((line, 'sequential scan'))
+            if 'Using filesort' in line:
+                problems.append((line, 'filesort'))
+
+    return problems
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image
+
+from .models import ImageVariant, Post
+
+# Formats of the variants, by the content type they are served with. WebP is
+# only written when Pillow was built with it
+FORMATS = [
+    ('image/webp', 'WEBP', 'webp'),
+    ('image/jpeg', 'JPEG', 'jpg'),
+]
+
+
+def get_formats():
+    Image.init()
+    return [fmt for fmt in FORMATS if fmt[1] in Image.SAVE]
+
+
+def flatten(image):
+    """
+    Returns the image in RGB, laying transparent parts over white, as JPEG
+    has no alpha channel
+    """
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1])
+        return background
+
+    return image.convert('RGB')
+
+
+def get_widths(original_width):
+    """
+    Returns the widths of the variants of an image: the configured ones
+    narrower than the original, or only the original width when it is
+    narrower than all of them
+    """
+    widths = [
+        width for width in settings.FEED_IMAGE_WIDTHS
+        if width < original_width
+    ]
+
+    return widths or [original_width]
+
+
+def make_variants(post):
+    """
+    Returns unsaved ImageVariant instances with downscaled, re-encoded
+    copies of the image of the post, whose files are already stored. Sets
+    the dimensions of the image on the post
+    """
+    post.image.open()
+    try:
+        original = Image.open(post.image)
+        original.load()
+    finally:
+        post.image.close()
+
+    post.image_width, post.image_height = original.size
+
+    name = os.path.splitext(os.path.basename(post.image.name))[0]
+    variants = []
+
+    for width in get_widths(original.width):
+        height = max(int(round(original.height * width / original.width)), 1)
+        resized = original.resize((width, height), Image.LANCZOS)
+
+        for content_type, image_format, extension in get_formats():
+            if image_format == 'JPEG':
+                encoded = flatten(resized)
+                options = {'optimize': True, 'progressive': True}
+            else:
+                encoded = resized.convert(
+                    'RGBA' if 'A' in resized.mode else 'RGB')
+                options = {}
+
+            buffer = BytesIO()
+            encoded.save(buffer, image_format,
+                         quality=settings.FEED_IMAGE_QUALITY, **options)
+
+            variant = ImageVariant(
+                post=post, width=width, height=height,
+                content_type=content_type)
+            variant.image.save(
+                '%s_%d.%s' % (name, width, extension),
+                ContentFile(buffer.getvalue()), save=False)
+            variants.append(variant)
+
+    return variants
+
+
+def create_variants(post):
+    """
+    Stores the variants of the image of the post, when it has one, and its
+    dimensions
+    """
+    if post.image:
+        # On the database of the post, which is its shard when sharded
+        ImageVariant.objects.using(post._state.db).bulk_create(
+            make_variants(post))
+        Post.objects.using(post._state.db).filter(id=post.id).update(
+            image_width=post.image_width, image_height=post.image_height)
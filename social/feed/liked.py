@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+class LikedCache(object):
+    """
+    Keeps the ids of the posts each profile liked most recently in a cache
+    shared by all the worker processes, so the liked state of a page of
+    posts is answered without querying the likes.
+
+    Every entry is tagged with the generation of its profile, which is bumped
+    after each like or unlike is committed. An entry is only used while its
+    tag is the current generation, so an entry filled or updated from an
+    older read of the database is never served.
+    """
+
+    def __init__(self, load, alias='liked', size=None, timeout=None):
+        # load(profile_id, post_ids=None, limit=None) returns the ids of the
+        # posts liked by the profile, the most recent first
+        self.load = load
+        self.alias = alias
+        self.size = size or settings.FEED_LIKED_CACHE_SIZE
+        self.timeout = timeout or settings.FEED_LIKED_CACHE_TIMEOUT
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @staticmethod
+    def keys(profile_id):
+        return 'liked:gen:%d' % profile_id, 'liked:ids:%d' % profile_id
+
+    def read(self, profile_id):
+        """
+        Returns the current generation of the profile and its entry, or None
+        in place of the entry when it is missing or outdated
+        """
+        gen_key, ids_key = self.keys(profile_id)
+        values = self.cache.get_many([gen_key, ids_key])
+        generation = values.get(gen_key)
+
+        if generation is None:
+            # Seeded from the clock, so a generation that was evicted does not
+            # start over and match the entries written before
+            self.cache.add(gen_key, int(time.time() * 1000000), None)
+            return self.cache.get(gen_key), None
+
+        entry = values.get(ids_key)
+        if entry is None or entry[0] != generation:
+            return generation, None
+
+        return generation, entry
+
+    def fill(self, profile_id, generation):
+        """
+        Loads the most recent likes of the profile and stores them tagged
+        with the generation read before loading them
+        """
+        post_ids = self.load(profile_id, limit=self.size + 1)
+
+        # Every liked post with an id from floor on is in the entry
+        floor = 0
+        if len(post_ids) > self.size:
+            post_ids = post_ids[:self.size]
+            floor = post_ids[-1]
+
+        entry = (generation, floor, frozenset(post_ids))
+        if generation is not None:
+            self.cache.set(self.keys(profile_id)[1], entry, self.timeout)
+
+        return entry
+
+    def lookup(self, profile_id, post_ids):
+        """
+        Returns which of the posts the profile liked. Only posts older than
+        the ones kept in the entry are looked up on the database
+        """
+        generation, entry = self.read(profile_id)
+        if entry is None:
+            entry = self.fill(profile_id, generation)
+
+        _, floor, liked_ids = entry
+        liked = set(post_id for post_id in post_ids if post_id in liked_ids)
+
+        older = [post_id for post_id in post_ids if post_id < floor]
+        if older:
+            liked.update(self.load(profile_id, older))
+
+        return liked
+
+    def record(self, profile_id, post_id):
+        """
+        Writes a committed like or unlike of the post through to the entry
+        of the profile. The liked state is read again after bumping the
+        generation, so concurrent toggles can not leave it out of order
+        """
+        gen_key, ids_key = self.keys(profile_id)
+
+        try:
+            generation = self.cache.incr(gen_key)
+        except ValueError:
+            # Without a generation there is no current entry to update
+            return
+
+        entry = self.cache.get(ids_key)
+        if entry is None or entry[0] != generation - 1:
+            # Another toggle got in between, so the entry is outdated and
+            # will be filled again on the next read
+            return
+
+        _, floor, liked_ids = entry
+
+        if post_id >= floor:
+            if self.load(profile_id, [post_id]):
+                liked_ids = liked_ids | {post_id}
+            else:
+                liked_ids = liked_ids - {post_id}
+
+            if len(liked_ids) > self.size:
+                liked_ids = frozenset(sorted(liked_ids)[-self.size:])
+                floor = min(liked_ids)
+
+        self.cache.set(ids_key, (generation, floor, liked_ids), self.timeout)
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from feed.benchmark import (
+    SCENARIOS, check_budgets, get_user_and_post, measure)
+
+BUDGETS_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__)))), 'benchmark_budgets.json')
+
+
+class Command(BaseCommand):
+    help = 'Measures latency, queries and memory of the views against budgets'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--budgets', default=BUDGETS_PATH)
+        parser.add_argument(
+            '--username',
+            help='User the views run as; defaults to the newest post author')
+        parser.add_argument(
+            'scenarios', nargs='*',
+            help='Names of the scenarios to run; defaults to all of them')
+
+    def handle(self, *args, **options):
+        with open(options['budgets']) as budgets_file:
+            budgets = json.load(budgets_file)
+
+        user, post = get_user_and_post(options['username'])
+        names = options['scenarios']
+        results = {}
+
+        self.stdout.write('%-12s %9s %9s %9s %8s %10s' % (
+            'view', 'p50 ms', 'p95 ms', 'p99 ms', 'queries', 'peak KiB'))
+
+        for scenario in SCENARIOS:
+            if names and scenario[0] not in names:
+                continue
+
+            result = measure(scenario, user, post, options['iterations'])
+            results[scenario[0]] = result
+
+            self.stdout.write('%-12s %9.2f %9.2f %9.2f %8d %10.1f' % (
+                scenario[0], result['p50_ms'], result['p95_ms'],
+                result['p99_ms'], result['queries'], result['peak_kb']))
+
+        violations = check_budgets(results, budgets)
+        if violations:
+            raise CommandError(
+                'Budgets exceeded:\n' + '\n'.join(violations))
+
+        self.stdout.write('All budgets met.')
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+from contextlib import ExitStack
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from feed.benchmark import SCENARIOS, call_view, get_aliases, get_user_and_post
+from feed.explain import explain, find_problems, is_explained, record_queries
+from feed.shards import in_calling_thread
+
+
+class Command(BaseCommand):
+    help = ('Replays the queries of the views under EXPLAIN and flags '
+            'sequential scans and filesorts')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--username',
+            help='User the views run as; defaults to the newest post author')
+        parser.add_argument(
+            '--strict', action='store_true',
+            help='Fail when any query is flagged')
+        parser.add_argument(
+            'scenarios', nargs='*',
+            help='Names of the scenarios to run; defaults to all of them')
+
+    def handle(self, *args, **options):
+        # The default database and the shards, when sharded
+        aliases = get_aliases()
+
+        for alias in aliases:
+            if connections[alias].vendor not in (
+                    'sqlite', 'postgresql', 'mysql'):
+                raise CommandError(
+                    'EXPLAIN is not supported on %s.' %
+                    connections[alias].vendor)
+
+        user, post = get_user_and_post(options['username'])
+        tables = {alias: set(connections[alias].introspection.table_names())
+                  for alias in aliases}
+        names = options['scenarios']
+        explained = flagged = 0
+
+        for name, method, url_name, build_data in SCENARIOS:
+            if names and name not in names:
+                continue
+
+            # The shards are read in this thread, where the queries on their
+            # connections are recorded
+            with ExitStack() as stack:
+                recorded = [
+                    (alias, stack.enter_context(
+                        record_queries(connections[alias])))
+                    for alias in aliases
+                ]
+                stack.enter_context(in_calling_thread())
+                call_view(method, url_name, build_data(post), user)
+
+            queries = [
+                (alias, sql, params)
+                for alias, alias_queries in recorded
+                for sql, params in alias_queries if is_explained(sql)
+            ]
+            self.stdout.write('%s: %d queries' % (name, len(queries)))
+
+            for alias, sql, params in queries:
+                connection = connections[alias]
+                plan = explain(connection, sql, params)
+                problems = find_problems(
+                    connection.vendor, plan, tables[alias])
+                explained += 1
+
+                if not problems and options['verbosity'] < 2:
+                    continue
+
+                flagged += bool(problems)
+                self.stdout.write('  %s' % sql)
+                for line in plan:
+                    self.stdout.write('    %s' % line)
+                for line, problem in problems:
+                    self.stdout.write('    ! %s: %s' % (problem, line))
+
+        self.stdout.write(
+            '%d queries explained, %d flagged.' % (explained, flagged))
+
+        if flagged and options['strict']:
+            raise CommandError('%d queries flagged.' % flagged)
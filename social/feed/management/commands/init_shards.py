@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from feed.shards import MAX_ID, SHARDED_MODELS
+
+
+class Command(BaseCommand):
+    help = ('Starts the ids of the posts, comments, likes and image variants '
+            'of each shard at its range of FEED_SHARD_ID_SPAN ids')
+
+    def set_sequence(self, connection, table, start):
+        """
+        Moves the next id of the table to after start, never backwards
+        """
+        quoted = connection.ops.quote_name(table)
+
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute(
+                    'UPDATE sqlite_sequence SET seq = MAX(seq, %s) '
+                    'WHERE name = %s', [start, table])
+                if not cursor.rowcount:
+                    cursor.execute(
+                        'INSERT INTO sqlite_sequence (name, seq) '
+                        'VALUES (%s, %s)', [table, start])
+            elif connection.vendor == 'postgresql':
+                cursor.execute(
+                    "SELECT setval(pg_get_serial_sequence(%%s, 'id'), "
+                    "GREATEST(%%s, (SELECT COALESCE(MAX(id), 0) FROM %s), 1))"
+                    % quoted, [table, start])
+            else:
+                raise CommandError(
+                    'Shards on %s are not supported.' % connection.vendor)
+
+    def handle(self, *args, **options):
+        if not settings.FEED_SHARDS:
+            raise CommandError('FEED_SHARDS is empty.')
+
+        last_id = len(settings.FEED_SHARDS) * settings.FEED_SHARD_ID_SPAN
+        if last_id > MAX_ID:
+            raise CommandError(
+                'The ids of %d shards of FEED_SHARD_ID_SPAN ids go up to %d, '
+                'over the largest id, %d.' % (
+                    len(settings.FEED_SHARDS), last_id, MAX_ID))
+
+        tables = [apps.get_model('feed', name)._meta.db_table
+                  for name in SHARDED_MODELS]
+
+        for index, alias in enumerate(settings.FEED_SHARDS):
+            start = index * settings.FEED_SHARD_ID_SPAN
+
+            for table in tables:
+                self.set_sequence(connections[alias], table, start)
+
+            self.stdout.write('%s: ids from %d.' % (alias, start + 1))
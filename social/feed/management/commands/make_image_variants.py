@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from feed.images import create_variants
+from feed.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Generates the image variants of the posts published without them'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=100,
+            help='Number of posts read from the database at a time')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        total = failed = 0
+
+        for alias in settings.FEED_SHARDS or [None]:
+            posts = Post.objects.using(alias).exclude(image='')
+            posts = posts.filter(
+                deleted_at__isnull=True, image_variants__isnull=True)
+            posts = posts.order_by('id')
+            last_id = 0
+
+            while True:
+                chunk = list(posts.filter(id__gt=last_id)[:chunk_size])
+
+                if not chunk:
+                    break
+
+                for post in chunk:
+                    try:
+                        create_variants(post)
+                    except (IOError, OSError) as error:
+                        failed += 1
+                        self.stderr.write('Post %d: %s' % (post.id, error))
+
+                    # Their cards are rendered again with the variants
+                    Post.objects.using(alias).filter(id=post.id).update(
+                        version=F('version') + 1)
+
+                total += len(chunk)
+                last_id = chunk[-1].id
+
+        self.stdout.write('%d posts processed, %d failed.' % (total, failed))
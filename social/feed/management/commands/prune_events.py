@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from feed.models import Event
+
+
+class Command(BaseCommand):
+    help = 'Deletes the events older than FEED_EVENTS_RETENTION'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help='Number of events deleted in each query')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        cutoff = timezone.now() - timedelta(
+            seconds=settings.FEED_EVENTS_RETENTION)
+        events = Event.objects.filter(created_at__lt=cutoff)
+        total = 0
+
+        while True:
+            event_ids = list(events.order_by('id').values_list(
+                'id', flat=True)[:chunk_size])
+
+            if not event_ids:
+                break
+
+            Event.objects.filter(id__in=event_ids).delete()
+            total += len(event_ids)
+
+        self.stdout.write('%d events deleted.' % total)
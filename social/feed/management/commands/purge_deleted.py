@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from feed.models import Post, Comment
+from feed.tasks import delete_chunk, purge_post
+
+
+class Command(BaseCommand):
+    help = ('Removes the deleted comments, and enqueues again the purge of '
+            'the deleted posts still left')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age', type=int, default=60 * 60,
+            help='Seconds since the deletion of the posts purged again')
+
+    def handle(self, *args, **options):
+        chunk_size = settings.FEED_PURGE_CHUNK_SIZE
+        cutoff = timezone.now() - timedelta(seconds=options['min_age'])
+        comments = posts = 0
+
+        for alias in settings.FEED_SHARDS or [None]:
+            deleted = Comment.objects.using(alias).filter(
+                deleted_at__isnull=False)
+
+            while True:
+                count = delete_chunk(deleted, chunk_size)
+                comments += count
+
+                if count < chunk_size:
+                    break
+
+            # Their purge jobs failed or were lost
+            post_ids = Post.objects.using(alias).filter(
+                deleted_at__lt=cutoff).values_list('id', flat=True)
+
+            for post_id in post_ids.iterator():
+                purge_post.delay(post_id=post_id)
+                posts += 1
+
+        self.stdout.write(
+            '%d comments deleted, %d posts to purge.' % (comments, posts))
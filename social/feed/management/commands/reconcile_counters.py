@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F
+
+from feed.conditional import bump_feed_version
+from feed.models import Post, Comment, Like
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the like and comment counters of every post'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help='Number of posts reconciled in each transaction')
+
+    @staticmethod
+    def count_by_post(queryset, post_ids):
+        counts = queryset.filter(post_id__in=post_ids).values('post_id')
+        counts = counts.annotate(total=Count('id'))
+
+        return {row['post_id']: row['total'] for row in counts}
+
+    def reconcile(self, alias, post_ids):
+        """
+        Fixes the counters of the given posts of the database and returns
+        how many posts had drifted. Only the rows of the chunk are locked, so
+        likes and comments on these posts wait for the chunk instead of being
+        lost. The versions of the fixed posts are bumped, as their cards
+        change
+        """
+        fixed = 0
+
+        with transaction.atomic(using=alias):
+            posts = Post.objects.using(alias).select_for_update()
+            posts = posts.filter(id__in=post_ids)
+            posts = posts.values_list('id', 'like_count', 'comment_count')
+
+            posts = list(posts)
+            likes = self.count_by_post(Like.objects.using(alias), post_ids)
+            comments = self.count_by_post(
+                Comment.objects.using(alias).filter(deleted_at__isnull=True),
+                post_ids)
+
+            for post_id, like_count, comment_count in posts:
+                expected = (likes.get(post_id, 0), comments.get(post_id, 0))
+
+                if (like_count, comment_count) != expected:
+                    Post.objects.using(alias).filter(id=post_id).update(
+                        like_count=expected[0], comment_count=expected[1],
+                        version=F('version') + 1)
+                    fixed += 1
+
+            if fixed:
+                transaction.on_commit(bump_feed_version, using=alias)
+
+        return fixed
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        total = fixed = 0
+
+        for alias in settings.FEED_SHARDS or [None]:
+            posts = Post.objects.using(alias).order_by('id')
+            last_id = 0
+
+            while True:
+                post_ids = posts.filter(id__gt=last_id).values_list(
+                    'id', flat=True)
+                post_ids = list(post_ids[:chunk_size])
+
+                if not post_ids:
+                    break
+
+                fixed += self.reconcile(alias, post_ids)
+                total += len(post_ids)
+                last_id = post_ids[-1]
+
+        self.stdout.write(
+            '%d posts checked, %d counters fixed.' % (total, fixed))
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+
+import bisect
+import itertools
+import random
+from collections import defaultdict
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+
+from authentication.models import Profile
+from feed.models import Post, Comment, Like, Follow, TimelineEntry
+from feed.shards import shard_for_author
+
+
+class Command(BaseCommand):
+    help = (
+        'Bulk creates profiles, follows, posts, comments and likes for '
+        'benchmarks'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument(
+            '--comments', type=float, default=5,
+            help='Mean number of comments per post')
+        parser.add_argument(
+            '--likes', type=float, default=20,
+            help='Mean number of likes per post')
+        parser.add_argument(
+            '--follows', type=float, default=50,
+            help='Mean number of profiles followed by each profile')
+        parser.add_argument(
+            '--skew', type=float, default=1.5,
+            help='Pareto shape of the per-post and per-author distributions; '
+                 'lower values make a few posts and authors dominate')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=None)
+
+    def draw(self, mean):
+        """
+        Draws a heavy tailed count whose mean is the given one
+        """
+        scale = mean * (self.skew - 1) / self.skew
+        return int(scale * self.random.paretovariate(self.skew))
+
+    @staticmethod
+    def created_ids(model, last_id, alias=None):
+        ids = model.objects.using(alias).filter(id__gt=last_id).order_by('id')
+        return list(ids.values_list('id', flat=True))
+
+    def create_profiles(self, number):
+        password = make_password('password')
+        last_user_id = User.objects.order_by('-id').values_list(
+            'id', flat=True).first() or 0
+        last_profile_id = Profile.objects.order_by('-id').values_list(
+            'id', flat=True).first() or 0
+        prefix = 'seed_%d' % last_user_id
+
+        for start in range(0, number, self.batch_size):
+            with transaction.atomic():
+                users = [
+                    User(username='%s_%d' % (prefix, index),
+                         first_name='Seed %d' % index, password=password)
+                    for index in range(
+                        start, min(start + self.batch_size, number))
+                ]
+                User.objects.bulk_create(users)
+
+                user_ids = self.created_ids(User, last_user_id)
+                Profile.objects.bulk_create(
+                    [Profile(user_id=user_id) for user_id in user_ids])
+                last_user_id = user_ids[-1]
+
+        return self.created_ids(Profile, last_profile_id)
+
+    def pick_profile(self, profile_ids):
+        """
+        Picks a profile according to its popularity. Popular profiles post
+        more and have more followers
+        """
+        point = self.random.uniform(0, self.popularity[-1])
+        index = bisect.bisect(self.popularity, point)
+
+        return profile_ids[min(index, len(profile_ids) - 1)]
+
+    def create_follows(self, profile_ids):
+        total = 0
+        follows = []
+
+        for follower_id in profile_ids:
+            number = min(self.draw(self.follows), len(profile_ids) - 1)
+            followee_ids = set()
+
+            for _ in range(number * 3):
+                if len(followee_ids) == number:
+                    break
+
+                followee_id = self.pick_profile(profile_ids)
+                if followee_id != follower_id:
+                    followee_ids.add(followee_id)
+
+            follows.extend(
+                Follow(follower_id=follower_id, followee_id=followee_id)
+                for followee_id in followee_ids)
+
+            if len(follows) >= self.batch_size:
+                Follow.objects.bulk_create(follows)
+                total += len(follows)
+                follows = []
+
+        Follow.objects.bulk_create(follows)
+        total += len(follows)
+
+        followers = Follow.objects.filter(followee_id__in=profile_ids)
+        followers = followers.values('followee_id').order_by()
+        for row in followers.annotate(total=Count('id')):
+            Profile.objects.filter(id=row['followee_id']).update(
+                follower_count=row['total'])
+
+        return total
+
+    def create_posts(self, number, profile_ids):
+        """
+        Creates the posts with their comments, likes and timeline entries,
+        on the shard of their author when sharded
+        """
+        totals = {'posts': 0, 'comments': 0, 'likes': 0}
+
+        for start in range(0, number, self.batch_size):
+            size = min(self.batch_size, number - start)
+            shards = defaultdict(list)
+
+            for _ in range(size):
+                author_id = self.pick_profile(profile_ids)
+                shards[shard_for_author(author_id)].append(author_id)
+
+            for alias, authors in shards.items():
+                with transaction.atomic(using=alias):
+                    totals['posts'] += len(authors)
+                    self.create_post_batch(
+                        alias, authors, profile_ids, totals)
+
+        return totals
+
+    def fan_out(self, alias, last_post_id):
+        """
+        Writes the posts created after last_post_id to the timelines of their
+        authors and followers with INSERT ... SELECT, so the entries never go
+        through Python. The posts of a shard are on another database than the
+        timelines, so their entries are built here instead
+        """
+        if alias is not None:
+            return self.fan_out_shard(alias, last_post_id)
+
+        sql = (
+            'INSERT INTO {entry} (owner_id, post_id, author_id, pub_date) '
+            'SELECT follow.follower_id, post.id, post.author_id, post.pub_date '
+            'FROM {post} post '
+            'INNER JOIN {follow} follow ON follow.followee_id = post.author_id '
+            'INNER JOIN {profile} profile ON profile.id = post.author_id '
+            'WHERE post.id > %s AND profile.follower_count <= %s '
+            'UNION ALL '
+            'SELECT post.author_id, post.id, post.author_id, post.pub_date '
+            'FROM {post} post WHERE post.id > %s'
+        ).format(
+            entry=TimelineEntry._meta.db_table, post=Post._meta.db_table,
+            follow=Follow._meta.db_table, profile=Profile._meta.db_table)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                sql, [last_post_id, settings.FEED_FANOUT_LIMIT, last_post_id])
+
+    def fan_out_shard(self, alias, last_post_id):
+        posts = Post.objects.using(alias).filter(id__gt=last_post_id)
+        posts = list(posts.values_list('id', 'author_id', 'pub_date'))
+
+        followers = defaultdict(list)
+        follows = Follow.objects.filter(
+            followee_id__in=set(author_id for _, author_id, _ in posts),
+            followee__follower_count__lte=settings.FEED_FANOUT_LIMIT)
+        for followee_id, follower_id in follows.values_list(
+                'followee_id', 'follower_id'):
+            followers[followee_id].append(follower_id)
+
+        entries = [
+            TimelineEntry(owner_id=owner_id, post_id=post_id,
+                          author_id=author_id, pub_date=pub_date)
+            for post_id, author_id, pub_date in posts
+            for owner_id in [author_id] + followers[author_id]
+        ]
+        TimelineEntry.objects.bulk_create(entries, self.batch_size)
+
+    def create_post_batch(self, alias, authors, profile_ids, totals):
+        last_post_id = Post.objects.using(alias).order_by('-id').values_list(
+            'id', flat=True).first() or 0
+
+        posts = []
+        for index, author_id in enumerate(authors):
+            likes = min(self.draw(self.likes), len(profile_ids))
+            posts.append(Post(
+                text='Seeded post %d' % index, author_id=author_id,
+                like_count=likes, comment_count=self.draw(self.comments)))
+        Post.objects.using(alias).bulk_create(posts)
+
+        comments, likes = [], []
+        post_ids = self.created_ids(Post, last_post_id, alias)
+        for post_id, post in zip(post_ids, posts):
+            comments.extend(
+                Comment(text='Seeded comment', post_id=post_id,
+                        author_id=self.random.choice(profile_ids))
+                for _ in range(post.comment_count))
+            likes.extend(
+                Like(post_id=post_id, author_id=author_id)
+                for author_id in self.random.sample(
+                    profile_ids, post.like_count))
+
+        Comment.objects.using(alias).bulk_create(comments)
+        Like.objects.using(alias).bulk_create(likes)
+        self.fan_out(alias, last_post_id)
+
+        totals['comments'] += len(comments)
+        totals['likes'] += len(likes)
+
+    def handle(self, *args, **options):
+        if options['skew'] <= 1:
+            raise CommandError('The skew must be greater than 1.')
+
+        if options['users'] < 1:
+            raise CommandError('At least one user must be created.')
+
+        self.random = random.Random(options['seed'])
+        self.skew = options['skew']
+        self.comments = options['comments']
+        self.likes = options['likes']
+        self.follows = options['follows']
+        self.batch_size = options['batch_size']
+
+        profile_ids = self.create_profiles(options['users'])
+        self.popularity = list(itertools.accumulate(
+            self.random.paretovariate(self.skew) for _ in profile_ids))
+
+        follows = self.create_follows(profile_ids)
+        totals = self.create_posts(options['posts'], profile_ids)
+
+        self.stdout.write(
+            'Created %d profiles, %d follows, %d posts, %d comments and %d '
+            'likes.' % (len(profile_ids), follows, totals['posts'],
+                        totals['comments'], totals['likes']))
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.7 on 2026-10-18 19:41
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_by_post(model, post_ids):
+    counts = model.objects.filter(post_id__in=post_ids).values('post_id')
+    counts = counts.annotate(total=Count('id'))
+
+    return {row['post_id']: row['total'] for row in counts}
+
+
+def fill_counters(apps, schema_editor):
+    Post = apps.get_model('feed', 'Post')
+    Comment = apps.get_model('feed', 'Comment')
+    Like = apps.get_model('feed', 'Like')
+
+    last_id = 0
+
+    while True:
+        post_ids = Post.objects.filter(id__gt=last_id).order_by('id')
+        post_ids = list(post_ids.values_list('id', flat=True)[:1000])
+
+        if not post_ids:
+            break
+
+        likes = count_by_post(Like, post_ids)
+        comments = count_by_post(Comment, post_ids)
+
+        for post_id in post_ids:
+            if post_id in likes or post_id in comments:
+                Post.objects.filter(id=post_id).update(
+                    like_count=likes.get(post_id, 0),
+                    comment_count=comments.get(post_id, 0))
+
+        last_id = post_ids[-1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feed', '0008_like'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
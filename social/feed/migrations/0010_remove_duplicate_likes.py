@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.7 on 2026-10-18 19:44
+from __future__ import unicode_literals
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def remove_duplicate_likes(apps, schema_editor):
+    """
+    Keeps only the oldest like of each (post, author) pair, one chunk of
+    posts at a time, and fixes the like counters of the affected posts
+    """
+    Post = apps.get_model('feed', 'Post')
+    Like = apps.get_model('feed', 'Like')
+
+    last_id = 0
+
+    while True:
+        post_ids = Post.objects.filter(id__gt=last_id).order_by('id')
+        post_ids = list(post_ids.values_list('id', flat=True)[:1000])
+
+        if not post_ids:
+            break
+
+        duplicates = Like.objects.filter(post_id__in=post_ids)
+        duplicates = duplicates.values('post_id', 'author_id').order_by()
+        duplicates = duplicates.annotate(total=Count('id'), first=Min('id'))
+
+        for duplicate in duplicates.filter(total__gt=1):
+            Like.objects.filter(
+                post_id=duplicate['post_id'],
+                author_id=duplicate['author_id'],
+            ).exclude(id=duplicate['first']).delete()
+
+            Post.objects.filter(id=duplicate['post_id']).update(
+                like_count=Like.objects.filter(
+                    post_id=duplicate['post_id']).count())
+
+        last_id = post_ids[-1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feed', '0009_post_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_likes, migrations.RunPython.noop),
+    ]
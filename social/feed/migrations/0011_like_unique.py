@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.7 on 2026-10-18 19:44
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feed', '0010_remove_duplicate_likes'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='like',
+            unique_together=set([('post', 'author')]),
+        ),
+    ]
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.7 on 2026-10-18 19:47
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_own_timelines(apps, schema_editor):
+    """
+    Puts every existing post in the timeline of its author
+    """
+    Post = apps.get_model('feed', 'Post')
+    TimelineEntry = apps.get_model('feed', 'TimelineEntry')
+
+    last_id = 0
+
+    while True:
+        posts = Post.objects.filter(id__gt=last_id).order_by('id')
+        posts = list(posts.values_list('id', 'author_id', 'pub_date')[:1000])
+
+        if not posts:
+            break
+
+        TimelineEntry.objects.bulk_create([
+            TimelineEntry(owner_id=author_id, post_id=post_id,
+                          author_id=author_id, pub_date=pub_date)
+            for post_id, author_id, pub_date in posts
+        ])
+        last_id = posts[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0004_profile_follower_count'),
+        ('feed', '0011_like_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Follow',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('followee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='followers', to='authentication.Profile')),
+                ('follower', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='following', to='authentication.Profile')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField()),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='authentication.Profile')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to='authentication.Profile')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='feed.Post')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='timelineentry',
+            unique_together=set([('owner', 'post')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='timelineentry',
+            index_together=set([('owner', 'pub_date', 'post')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='follow',
+            unique_together=set([('follower', 'followee')]),
+        ),
+        migrations.RunPython(fill_own_timelines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.7 on 2026-10-18 19:55
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feed', '0013_post_version'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='comment',
+            index_together=set([('post', 'pub_date', 'id')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='like',
+            index_together=set([('author', 'post')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='post',
+            index_together=set([('pub_date', 'id'), ('author', 'pub_date')]),
+        ),
+    ]
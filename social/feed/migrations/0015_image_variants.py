@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.7 on 2026-10-18 19:58
+from __future__ import unicode_literals
+
+from django.core.files.images import get_image_dimensions
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def read_dimensions(name):
+    try:
+        with default_storage.open(name) as image:
+            width, height = get_image_dimensions(image)
+    except (IOError, OSError):
+        width = height = None
+
+    # Zero marks an unreadable image, so it is not read again on every load
+    return width or 0, height or 0
+
+
+def fill_dimensions(apps, schema_editor):
+    Post = apps.get_model('feed', 'Post')
+
+    last_id = 0
+
+    while True:
+        posts = Post.objects.filter(id__gt=last_id).exclude(image='')
+        posts = posts.order_by('id').values_list('id', 'image')[:1000]
+        posts = list(posts)
+
+        if not posts:
+            break
+
+        for post_id, name in posts:
+            width, height = read_dimensions(name)
+            Post.objects.filter(id=post_id).update(
+                image_width=width, image_height=height)
+
+        last_id = posts[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feed', '0014_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageVariant',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image', models.ImageField(upload_to='photos/variants/%Y/%m/%d/')),
+                ('width', models.PositiveIntegerField()),
+                ('height', models.PositiveIntegerField()),
+                ('content_type', models.CharField(max_length=20)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='image_height',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='image_width',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, height_field='image_height', upload_to='photos/%Y/%m/%d/', width_field='image_width'),
+        ),
+        migrations.AddField(
+            model_name='imagevariant',
+            name='post',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='image_variants', to='feed.Post'),
+        ),
+        migrations.RunPython(fill_dimensions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.7 on 2026-10-18 20:09
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feed', '0015_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Event',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('post', 'Publicação'), ('post_deleted', 'Publicação removida'), ('like', 'Curtida'), ('comment', 'Comentário'), ('comment_deleted', 'Comentário removido')], max_length=20)),
+                ('post_id', models.PositiveIntegerField()),
+                ('comment_id', models.PositiveIntegerField(blank=True, null=True)),
+                ('author_id', models.PositiveIntegerField(blank=True, null=True)),
+                ('count', models.PositiveIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
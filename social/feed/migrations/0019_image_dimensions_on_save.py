@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.7 on 2026-10-18 20:46
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def clear_unread_dimensions(apps, schema_editor):
+    # 0015 stored zero for the images that could not be read, so the image
+    # field did not read them again on every load. Without the dimension
+    # fields on the image, unknown dimensions are left empty
+    Post = apps.get_model('feed', 'Post')
+    Post.objects.filter(image_width=0).update(
+        image_width=None, image_height=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feed', '0018_soft_delete'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, upload_to='photos/%Y/%m/%d/'),
+        ),
+        migrations.RunPython(
+            clear_unread_dimensions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.7 on 2026-10-18 20:48
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+TABLES = ['feed_post', 'feed_comment']
+
+
+def create_deleted_indexes(apps, schema_editor):
+    # A standalone index on deleted_at was chosen over the ones the feeds
+    # are sorted by. Partial ones hold only the deleted rows, for the purge,
+    # and do not match the queries of the live rows
+    if schema_editor.connection.vendor not in ('sqlite', 'postgresql'):
+        return
+
+    for table in TABLES:
+        schema_editor.execute(
+            'CREATE INDEX %s_deleted ON %s (deleted_at) '
+            'WHERE deleted_at IS NOT NULL' % (table, table))
+
+
+def drop_deleted_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor not in ('sqlite', 'postgresql'):
+        return
+
+    for table in TABLES:
+        schema_editor.execute('DROP INDEX IF EXISTS %s_deleted' % table)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feed', '0019_image_dimensions_on_save'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='comment',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterIndexTogether(
+            name='comment',
+            index_together=set([('post', 'deleted_at', 'pub_date', 'id')]),
+        ),
+        migrations.RunPython(create_deleted_indexes, drop_deleted_indexes),
+    ]
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.7 on 2026-10-18 20:52
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def restore_deleted_indexes(apps, schema_editor):
+    # SQLite alters a field by copying the table, which loses the partial
+    # indexes created by 0020
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+
+    for table in ['feed_post', 'feed_comment']:
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS %s_deleted ON %s (deleted_at) '
+            'WHERE deleted_at IS NOT NULL' % (table, table))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feed', '0020_deleted_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='comment',
+            name='author',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='authentication.Profile'),
+        ),
+        migrations.AlterField(
+            model_name='like',
+            name='author',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='authentication.Profile'),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='author',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='posts', to='authentication.Profile'),
+        ),
+        migrations.AlterField(
+            model_name='timelineentry',
+            name='post',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='feed.Post'),
+        ),
+        migrations.RunPython(
+            restore_deleted_indexes, migrations.RunPython.noop),
+    ]
@@ -1,33 +1,149 @@
 # -*- coding: utf-8 -*-
 
-from django.core.exceptions import ObjectDoesNotExist
+from collections import defaultdict
 
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction, IntegrityError
+from django.db.models import F
 
 from authentication.models import Profile
 
+from .liked import LikedCache
+from .pagination import before_cursor, encode_cursor
+from .shards import (
+    for_ids, gather_posts, group_by_shard, is_sharded, read_all,
+    shard_for_author, shard_for_id, with_authors)
+
 
 class Post(models.Model):
 
     text = models.TextField(blank=False)
     pub_date = models.DateTimeField(auto_now=False, auto_now_add=True)
     image = models.ImageField(upload_to='photos/%Y/%m/%d/', blank=True)
+    # Set when the image is saved. Not width_field and height_field, which
+    # open the file again on every load while they are not filled
+    image_width = models.PositiveIntegerField(null=True, blank=True)
+    image_height = models.PositiveIntegerField(null=True, blank=True)
+    # Without a constraint, as the profiles stay on the default database
+    # when the posts are sharded
     author = models.ForeignKey(Profile, on_delete=models.CASCADE,
-                               null=False, related_name='posts')
+                               null=False, related_name='posts',
+                               db_constraint=False)
+    like_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+    version = models.PositiveIntegerField(default=0)
+    # Set when the post is deleted. It is left out of the feed right away
+    # and removed, with its comments and likes, by the purge_post job. Only
+    # the deleted rows are indexed, by migration 0020, so the feed queries
+    # keep the indexes they are sorted by
+    deleted_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        index_together = [('pub_date', 'id'), ('author', 'pub_date')]
+
+    @staticmethod
+    def adjust_count(post_id, field, delta):
+        """
+        Atomically adds delta to one of the counter fields of the post on the
+        database, without reading it first. The version of the post is
+        bumped along, as its card changes
+        """
+        Post.objects.using(shard_for_id(post_id)).filter(id=post_id).update(
+            version=F('version') + 1, **{field: F(field) + delta})
+
+    @staticmethod
+    def get_feed_posts():
+        """
+        Returns the posts in feed order, joined with their authors so they
+        are not fetched once per post
+        """
+        posts = Post.objects.select_related('author__user')
+        posts = posts.filter(deleted_at__isnull=True)
+
+        return posts.order_by('-pub_date', '-id')
 
     @staticmethod
-    def get_posts_with_likes(user):
-        posts = Post.objects.all().order_by('-pub_date')
+    def with_likes(posts, user):
+        """
+        Evaluates the posts and sets on each whether the user liked it,
+        answered by the liked cache of the user
+        """
+        posts = list(posts)
+        liked = liked_posts.lookup(user.profile.id, [p.id for p in posts])
 
         for post in posts:
-            try:
-                Like.objects.get(post=post, author=user.profile)
-                post.liked = True
-            except ObjectDoesNotExist:
-                post.liked = False
+            post.liked = post.id in liked
 
         return posts
 
+    @staticmethod
+    def get_posts_with_likes(user, cursor=None, limit=None):
+        posts = before_cursor(Post.get_feed_posts(), cursor)
+
+        if is_sharded():
+            posts = gather_posts(posts, limit)
+        elif limit is not None:
+            posts = posts[:limit]
+
+        return Post.with_likes(posts, user)
+
+    @staticmethod
+    def get_posts_by_ids(post_ids):
+        """
+        Returns the posts with the ids, in feed order, with their authors.
+        Reads only the shards holding some of them
+        """
+        posts = with_authors(for_ids(Post.get_feed_posts(), post_ids))
+
+        return sorted(posts, key=lambda post: (post.pub_date, post.id),
+                      reverse=True)
+
+
+class ImageVariant(models.Model):
+    """
+    A downscaled, re-encoded copy of the image of a post, offered to the
+    browsers through srcset
+    """
+
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE, null=False,
+        related_name='image_variants')
+    image = models.ImageField(upload_to='photos/variants/%Y/%m/%d/')
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    content_type = models.CharField(max_length=20)
+
+    @staticmethod
+    def attach_variants(posts):
+        """
+        Sets on each post the (content type, srcset) pairs of its variants
+        and the variant its img falls back to, or None when it has none
+        """
+        variants = defaultdict(list)
+        post_ids = [post.id for post in posts if post.image]
+
+        shards = for_ids(
+            ImageVariant.objects.order_by('width'), post_ids, 'post_id')
+        for variant in (variant for shard in shards for variant in shard):
+            variants[variant.post_id].append(variant)
+
+        for post in posts:
+            post.image_sources = []
+            post.image_fallback = None
+
+            for content_type in ('image/webp', 'image/jpeg'):
+                of_type = [
+                    variant for variant in variants[post.id]
+                    if variant.content_type == content_type
+                ]
+                if not of_type:
+                    continue
+
+                post.image_sources.append((content_type, ', '.join(
+                    '%s %dw' % (variant.image.url, variant.width)
+                    for variant in of_type)))
+                post.image_fallback = of_type[len(of_type) // 2]
+
 
 class Comment(models.Model):
 
@@ -36,11 +152,373 @@ class Comment(models.Model):
     post = models.ForeignKey(
         Post, on_delete=models.CASCADE, null=False, related_name="comments")
     author = models.ForeignKey(
-        Profile, on_delete=models.CASCADE, null=False)
+        Profile, on_delete=models.CASCADE, null=False, db_constraint=False)
+    # Set when the comment is deleted, until the purge_deleted command
+    # removes it. Indexed like the one of Post
+    deleted_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        # The comments of a post are read without the deleted ones, in
+        # date order, so deleted_at goes before the sort keys
+        index_together = [('post', 'deleted_at', 'pub_date', 'id')]
+
+    @staticmethod
+    def get_latest_comments(post_ids, limit):
+        """
+        Returns the latest comments of each post, at most limit per post,
+        with their authors, in a single query ranked by a window function
+        """
+        if not post_ids:
+            return Comment.objects.none()
+
+        latest = (
+            '{comment}.id IN (SELECT id FROM (SELECT id, ROW_NUMBER() OVER ('
+            'PARTITION BY post_id ORDER BY pub_date DESC, id DESC) AS position '
+            'FROM {comment} WHERE post_id IN ({post_ids}) '
+            'AND deleted_at IS NULL) AS ranked '
+            'WHERE position <= %s)'
+        ).format(
+            comment=Comment._meta.db_table,
+            post_ids=', '.join(['%s'] * len(post_ids)))
+
+        comments = Comment.objects.select_related('author__user')
+        comments = comments.extra(
+            where=[latest], params=list(post_ids) + [limit])
+
+        return comments.order_by('pub_date', 'id')
+
+    @staticmethod
+    def attach_latest_comments(posts, limit):
+        """
+        Sets latest_comments on each post and, when it has older comments,
+        the cursor from which they can be loaded
+        """
+        comments = defaultdict(list)
+        latest = [
+            Comment.get_latest_comments(post_ids, limit).using(alias)
+            for alias, post_ids in group_by_shard([p.id for p in posts])
+        ]
+
+        for comment in with_authors(latest):
+            comments[comment.post_id].append(comment)
+
+        for post in posts:
+            post.latest_comments = comments[post.id]
+            post.comments_cursor = None
+
+            # The counter may have drifted above the comments left
+            if (post.latest_comments and
+                    post.comment_count > len(post.latest_comments)):
+                post.comments_cursor = encode_cursor(post.latest_comments[0])
 
 
 class Like(models.Model):
 
-    author = models.ForeignKey(Profile, on_delete=models.CASCADE, null=False)
+    author = models.ForeignKey(
+        Profile, on_delete=models.CASCADE, null=False, db_constraint=False)
     post = models.ForeignKey(
         Post, on_delete=models.CASCADE, null=False, related_name='likes')
+
+    class Meta:
+        unique_together = (('post', 'author'),)
+        index_together = [('author', 'post')]
+
+    @staticmethod
+    def toggle(post_id, author):
+        """
+        Likes the post, or removes the like when it already exists, in one
+        transaction. Returns whether the post is liked now and its number of
+        likes, read from the counter instead of counting the likes
+        """
+        shard = shard_for_id(post_id)
+
+        with transaction.atomic(using=shard):
+            deleted, _ = Like.objects.using(shard).filter(
+                post_id=post_id, author=author).delete()
+
+            if deleted:
+                liked, delta = False, -deleted
+            else:
+                try:
+                    with transaction.atomic(using=shard):
+                        Like.objects.using(shard).create(
+                            post_id=post_id, author=author)
+                    liked, delta = True, 1
+                except IntegrityError:
+                    # A concurrent request liked it first
+                    liked, delta = True, 0
+
+            Post.adjust_count(post_id, 'like_count', delta)
+            like_count = Post.objects.using(shard).filter(
+                id=post_id).values_list('like_count', flat=True)[0]
+
+        return liked, like_count
+
+    @staticmethod
+    def get_liked_ids(author_id, post_ids=None, limit=None):
+        """
+        Returns the ids of the posts liked by the author, optionally only
+        among post_ids, the most recent first
+        """
+        likes = Like.objects.filter(author_id=author_id)
+
+        if post_ids is not None:
+            likes = likes.filter(post_id__in=post_ids)
+
+        likes = likes.order_by('-post_id').values_list('post_id', flat=True)
+
+        if is_sharded():
+            return sorted((post_id for shard in read_all(likes, limit)
+                           for post_id in shard), reverse=True)[:limit]
+
+        return list(likes[:limit] if limit is not None else likes)
+
+
+liked_posts = LikedCache(Like.get_liked_ids)
+
+
+class Follow(models.Model):
+
+    follower = models.ForeignKey(
+        Profile, on_delete=models.CASCADE, null=False,
+        related_name='following')
+    followee = models.ForeignKey(
+        Profile, on_delete=models.CASCADE, null=False,
+        related_name='followers')
+
+    class Meta:
+        unique_together = (('follower', 'followee'),)
+
+    @staticmethod
+    def toggle(follower, followee_id):
+        """
+        Follows the profile, or stops following it, updating the follower's
+        timeline. Returns whether it is followed now and its number of
+        followers
+        """
+        with transaction.atomic():
+            deleted, _ = Follow.objects.filter(
+                follower=follower, followee_id=followee_id).delete()
+
+            if deleted:
+                following, delta = False, -deleted
+                TimelineEntry.objects.filter(
+                    owner=follower, author_id=followee_id).delete()
+            else:
+                try:
+                    with transaction.atomic():
+                        Follow.objects.create(
+                            follower=follower, followee_id=followee_id)
+                    following, delta = True, 1
+                    TimelineEntry.backfill(follower, followee_id)
+                except IntegrityError:
+                    # A concurrent request followed it first
+                    following, delta = True, 0
+
+            Profile.objects.filter(id=followee_id).update(
+                follower_count=F('follower_count') + delta)
+            follower_count = Profile.objects.filter(
+                id=followee_id).values_list('follower_count', flat=True)[0]
+
+        return following, follower_count
+
+    @staticmethod
+    def attach_followed(posts, follower):
+        """
+        Sets on each post whether the follower follows its author
+        """
+        followed = Follow.objects.filter(
+            follower=follower,
+            followee_id__in=set(post.author_id for post in posts))
+        followed = set(followed.values_list('followee_id', flat=True))
+
+        for post in posts:
+            post.followed = post.author_id in followed
+
+
+class TimelineEntry(models.Model):
+    """
+    A post in the home timeline of a profile, written when the post is
+    created so that reading a timeline is a range scan on one index
+    """
+
+    owner = models.ForeignKey(
+        Profile, on_delete=models.CASCADE, null=False,
+        related_name='timeline')
+    # Without a constraint, as the posts are on the shards when sharded
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE, null=False, related_name='+',
+        db_constraint=False)
+    author = models.ForeignKey(
+        Profile, on_delete=models.CASCADE, null=False, related_name='+')
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        unique_together = (('owner', 'post'),)
+        index_together = [('owner', 'pub_date', 'post')]
+
+    @staticmethod
+    def is_fanned_out(profile_id):
+        follower_count = Profile.objects.filter(id=profile_id).values_list(
+            'follower_count', flat=True)[0]
+
+        return follower_count <= settings.FEED_FANOUT_LIMIT
+
+    @staticmethod
+    def fan_out(post, chunk_size=1000):
+        """
+        Writes the post to the timelines of its author and, unless the author
+        has too many followers, of every follower
+        """
+        TimelineEntry.add_own(post)
+        TimelineEntry.fan_out_to_followers(post, chunk_size)
+
+    @staticmethod
+    def add_own(post):
+        TimelineEntry.objects.create(
+            owner_id=post.author_id, post=post, author_id=post.author_id,
+            pub_date=post.pub_date)
+
+    @staticmethod
+    def fan_out_to_followers(post, chunk_size=1000):
+        """
+        Writes the post to the timelines of the followers of its author that
+        do not have it yet, so it can run again after failing halfway
+        """
+        if not TimelineEntry.is_fanned_out(post.author_id):
+            return
+
+        followers = Follow.objects.filter(followee_id=post.author_id)
+        followers = followers.order_by('follower_id')
+        last_id = 0
+
+        while True:
+            follower_ids = followers.filter(follower_id__gt=last_id)
+            follower_ids = list(follower_ids.values_list(
+                'follower_id', flat=True)[:chunk_size])
+
+            if not follower_ids:
+                break
+
+            existing = set(TimelineEntry.objects.filter(
+                post=post, owner_id__in=follower_ids).values_list(
+                'owner_id', flat=True))
+
+            TimelineEntry.objects.bulk_create([
+                TimelineEntry(owner_id=follower_id, post=post,
+                              author_id=post.author_id, pub_date=post.pub_date)
+                for follower_id in follower_ids if follower_id not in existing
+            ])
+            last_id = follower_ids[-1]
+
+    @staticmethod
+    def backfill(owner, author_id):
+        """
+        Copies the latest posts of a newly followed author to the timeline
+        """
+        if not TimelineEntry.is_fanned_out(author_id):
+            return
+
+        posts = Post.objects.using(shard_for_author(author_id))
+        posts = posts.filter(author_id=author_id, deleted_at__isnull=True)
+        posts = posts.order_by('-pub_date', '-id')
+        posts = posts.values_list('id', 'pub_date')
+
+        TimelineEntry.objects.bulk_create([
+            TimelineEntry(owner=owner, post_id=post_id, author_id=author_id,
+                          pub_date=pub_date)
+            for post_id, pub_date in posts[:settings.FEED_TIMELINE_BACKFILL]
+        ])
+
+    @staticmethod
+    def get_home_posts(user, cursor=None, limit=None):
+        """
+        Returns the posts of the home timeline of the user, merging the
+        timeline entries with the posts of the followed authors that are not
+        fanned out
+        """
+        profile = user.profile
+
+        entries = TimelineEntry.objects.filter(owner=profile)
+        entries = entries.order_by('-pub_date', '-post_id')
+        entries = before_cursor(entries, cursor, 'post_id')
+        if not is_sharded():
+            # The entries of a deleted post are only removed by its purge.
+            # Shards cannot be joined, their pages come short until then
+            entries = entries.filter(post__deleted_at__isnull=True)
+        entries = entries.values_list('pub_date', 'post_id')
+
+        pulled = Follow.objects.filter(
+            follower=profile,
+            followee__follower_count__gt=settings.FEED_FANOUT_LIMIT)
+        pulled = list(pulled.values_list('followee_id', flat=True))
+
+        keys = set(entries[:limit] if limit is not None else entries)
+
+        authors = defaultdict(list)
+        for author_id in pulled:
+            authors[shard_for_author(author_id)].append(author_id)
+
+        for alias, author_ids in authors.items():
+            posts = Post.objects.using(alias).filter(
+                author_id__in=author_ids, deleted_at__isnull=True)
+            posts = before_cursor(posts.order_by('-pub_date', '-id'), cursor)
+            posts = posts.values_list('pub_date', 'id')
+            keys.update(posts[:limit] if limit is not None else posts)
+
+        post_ids = [post_id for _, post_id in sorted(keys, reverse=True)]
+        if limit is not None:
+            post_ids = post_ids[:limit]
+
+        return Post.with_likes(Post.get_posts_by_ids(post_ids), user)
+
+
+class Event(models.Model):
+    """
+    An entry of the log of changes to the posts, pushed to the clients that
+    keep a feed open and read by the ones that poll for changes. Events keep
+    plain ids, so they outlive the posts and comments they refer to: the
+    deletion events are their tombstones. author_id is the author of the
+    post
+    """
+
+    POST = 'post'
+    POST_DELETED = 'post_deleted'
+    LIKE = 'like'
+    COMMENT = 'comment'
+    COMMENT_DELETED = 'comment_deleted'
+
+    KINDS = (
+        (POST, 'Publicação'),
+        (POST_DELETED, 'Publicação removida'),
+        (LIKE, 'Curtida'),
+        (COMMENT, 'Comentário'),
+        (COMMENT_DELETED, 'Comentário removido'),
+    )
+
+    kind = models.CharField(max_length=20, choices=KINDS)
+    post_id = models.PositiveIntegerField()
+    comment_id = models.PositiveIntegerField(null=True, blank=True)
+    author_id = models.PositiveIntegerField(null=True, blank=True)
+    count = models.PositiveIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    @staticmethod
+    def get_last_id():
+        return Event.objects.aggregate(
+            last_id=models.Max('id'))['last_id'] or 0
+
+    def as_data(self):
+        """
+        Returns the fields of the event that matter to its kind
+        """
+        data = {'post': self.post_id}
+
+        if self.comment_id is not None:
+            data['comment'] = self.comment_id
+        if self.author_id is not None:
+            data['author'] = self.author_id
+        if self.count is not None:
+            data['count'] = self.count
+
+        return data
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+import base64
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+def encode_cursor(item):
+    """
+    Returns an opaque cursor pointing at the given item, which must have
+    pub_date and id attributes
+    """
+    raw = '%s|%d' % (item.pub_date.isoformat(), item.id)
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Returns the (pub_date, id) pair encoded in the cursor. Raises
+    ValueError when the cursor is malformed
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        pub_date, item_id = raw.split('|')
+        pub_date = parse_datetime(pub_date)
+        item_id = int(item_id)
+    except (TypeError, ValueError, UnicodeError):
+        raise ValueError('Invalid cursor: %r' % cursor)
+
+    if pub_date is None:
+        raise ValueError('Invalid cursor: %r' % cursor)
+
+    return pub_date, item_id
+
+
+def before_cursor(queryset, cursor, id_field='id'):
+    """
+    Filters the queryset to the items that come after the cursor in the
+    (-pub_date, -id_field) order. Works as a range scan, never as an OFFSET
+    """
+    if cursor is None:
+        return queryset
+
+    pub_date, item_id = cursor
+    return queryset.filter(
+        Q(pub_date__lt=pub_date) |
+        Q(pub_date=pub_date, **{id_field + '__lt': item_id}))
+
+
+def get_page(items, size):
+    """
+    Splits a list fetched with size + 1 rows into the page itself and the
+    cursor of the next page, or None when there are no more items
+    """
+    items = list(items)
+    if len(items) > size:
+        items = items[:size]
+        return items, encode_cursor(items[-1])
+
+    return items, None
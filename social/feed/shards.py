@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+
+import heapq
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
+
+from django.conf import settings
+from django.db import connections
+
+from authentication.models import Profile
+
+# Models stored on the shard of the author of their post
+SHARDED_MODELS = ('post', 'comment', 'like', 'imagevariant')
+
+# Largest id of those models, their id columns being integers on PostgreSQL
+MAX_ID = 2 ** 31 - 1
+
+# Whether scatter() runs in the calling thread, set by in_calling_thread()
+_scatter = threading.local()
+
+
+def is_sharded():
+    return bool(settings.FEED_SHARDS)
+
+
+def shard_for_author(author_id):
+    """
+    Returns the database holding the posts of the author, or None when the
+    posts are not sharded, which leaves the choice to the routers
+    """
+    shards = settings.FEED_SHARDS
+    return shards[author_id % len(shards)] if shards else None
+
+
+def shard_for_id(object_id):
+    """
+    Returns the database holding the post, comment, like or image variant
+    with the id. Each shard allocates the ids in its own range of
+    FEED_SHARD_ID_SPAN, set by the init_shards command
+    """
+    shards = settings.FEED_SHARDS
+    if not shards:
+        return None
+
+    index = int(object_id) // settings.FEED_SHARD_ID_SPAN
+    return shards[min(index, len(shards) - 1)]
+
+
+def shard_of(instance):
+    """
+    Returns the database of a post, or of the post a comment, like or image
+    variant belongs to
+    """
+    # The database of a new instance is only a guess made when its first
+    # relation was set, maybe from the profile of a comment or like
+    if instance._state.db is not None and not instance._state.adding:
+        return instance._state.db
+
+    if instance._meta.model_name == 'post':
+        return shard_for_author(instance.author_id)
+
+    return shard_for_id(instance.post_id)
+
+
+def group_by_shard(ids):
+    """
+    Returns (shard, ids) pairs splitting the ids by the shard holding them,
+    a single pair with a None shard when not sharded
+    """
+    groups = defaultdict(list)
+    for object_id in ids:
+        groups[shard_for_id(object_id)].append(object_id)
+
+    return list(groups.items())
+
+
+def for_ids(queryset, ids, field='id'):
+    """
+    Splits a query for the objects whose field is in ids into one query per
+    shard holding some of them
+    """
+    return [queryset.using(alias).filter(**{field + '__in': group})
+            for alias, group in group_by_shard(ids)]
+
+
+def scatter(function):
+    """
+    Calls function with the alias of every shard, in parallel threads, and
+    returns the results in the order of FEED_SHARDS
+    """
+    def call(alias):
+        try:
+            return function(alias)
+        finally:
+            # The connections of a worker thread are not reused
+            connections[alias].close()
+
+    if getattr(_scatter, 'in_calling_thread', False):
+        return [function(alias) for alias in settings.FEED_SHARDS]
+
+    with ThreadPoolExecutor(max_workers=len(settings.FEED_SHARDS)) as pool:
+        return list(pool.map(call, settings.FEED_SHARDS))
+
+
+@contextmanager
+def in_calling_thread():
+    """
+    Makes scatter() call the shards one after the other in the calling
+    thread inside the block, so their queries run on its connections
+    """
+    _scatter.in_calling_thread = True
+    try:
+        yield
+    finally:
+        _scatter.in_calling_thread = False
+
+
+def read_all(queryset, limit=None):
+    """
+    Returns the rows of the queryset on every shard, at most limit from
+    each, one list per shard
+    """
+    def read(alias):
+        rows = queryset.using(alias)
+        return list(rows[:limit] if limit is not None else rows)
+
+    return scatter(read)
+
+
+def attach_authors(items):
+    """
+    Sets the author, with its user, on each post or comment read from a
+    shard, as the profiles are stored on the default database only
+    """
+    authors = Profile.objects.select_related('user').in_bulk(
+        set(item.author_id for item in items))
+
+    for item in items:
+        item.author = authors[item.author_id]
+
+
+def with_authors(querysets):
+    """
+    Evaluates the querysets of posts or comments with their authors, joined
+    by select_related when not sharded or read in one more query otherwise
+    """
+    if not is_sharded():
+        return [item for queryset in querysets for item in queryset]
+
+    items = [item for queryset in querysets
+             for item in queryset.select_related(None)]
+    attach_authors(items)
+
+    return items
+
+
+def gather_posts(queryset, limit=None):
+    """
+    Reads the queryset, in feed order, from every shard in parallel and
+    merges the lists on (pub_date, id) into the limit newest posts, with
+    their authors
+    """
+    posts = heapq.merge(
+        *read_all(queryset.select_related(None), limit),
+        key=lambda post: (post.pub_date, post.id), reverse=True)
+    posts = list(islice(posts, limit))
+    attach_authors(posts)
+
+    return posts
+
+
+class FeedShardRouter(object):
+    """
+    Sends the posts, comments, likes and image variants to the shard of
+    the author of the post when FEED_SHARDS is set. Queries that carry no
+    instance to route by choose their shard with using()
+    """
+
+    def get_shard(self, model, instance):
+        if (not is_sharded() or instance is None or
+                model._meta.app_label != 'feed' or
+                model._meta.model_name not in SHARDED_MODELS):
+            return None
+
+        if isinstance(instance, Profile):
+            # Only the posts are stored on the shard of their author
+            if model._meta.model_name == 'post':
+                return shard_for_author(instance.pk)
+            return None
+
+        if instance._meta.model_name in SHARDED_MODELS:
+            return shard_of(instance)
+
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self.get_shard(model, hints.get('instance'))
+
+    def db_for_write(self, model, **hints):
+        return self.get_shard(model, hints.get('instance'))
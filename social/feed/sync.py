@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+import base64
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+
+from .api import FIELDS
+from .models import Post, Follow, Event
+from .shards import for_ids
+
+
+class ExpiredToken(Exception):
+    """
+    The events after the token were pruned, so the client must read the
+    whole feed again
+    """
+
+
+def encode_token(last_id, issued=None):
+    """
+    Returns an opaque sync token pointing after the event last_id. The time
+    it was issued at tells whether the log still holds what follows it
+    """
+    issued = int(time.time() if issued is None else issued)
+    raw = '%d|%d' % (last_id, issued)
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_token(token):
+    """
+    Returns the (last_id, issued) pair encoded in the token. Raises
+    ValueError when the token is malformed and ExpiredToken when it is older
+    than the events kept
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token.encode()).decode()
+        last_id, issued = (int(value) for value in raw.split('|'))
+    except (TypeError, ValueError, UnicodeError):
+        raise ValueError('Invalid token: %r' % token)
+
+    if issued < time.time() - settings.FEED_EVENTS_RETENTION:
+        raise ExpiredToken(token)
+
+    return last_id, issued
+
+
+def get_settled_events():
+    """
+    Returns the events older than FEED_SYNC_DELAY. Newer ones are left for
+    the next poll, so an event whose transaction commits late is not
+    skipped by a token pointing after it
+    """
+    settled = timezone.now() - timedelta(seconds=settings.FEED_SYNC_DELAY)
+    return Event.objects.filter(created_at__lte=settled)
+
+
+def get_settled_last_id():
+    """
+    Returns the id of the newest settled event, or 0 when there is none
+    """
+    return get_settled_events().aggregate(last_id=Max('id'))['last_id'] or 0
+
+
+def get_start_token():
+    """
+    Returns the token of a client that just read the whole feed
+    """
+    return encode_token(get_settled_last_id())
+
+
+def get_changes(user, last_id, fields):
+    """
+    Returns what changed in the posts of the authors followed by the user
+    since the event last_id: one range read on the event log, plus the new
+    posts and the counters of the changed ones
+    """
+    profile = user.profile
+    author_ids = set(Follow.objects.filter(follower=profile).values_list(
+        'followee_id', flat=True))
+    author_ids.add(profile.id)
+
+    size = settings.FEED_SYNC_BATCH_SIZE
+    events = get_settled_events().filter(id__gt=last_id).order_by('id')
+    events = list(events[:size])
+
+    new_posts = set()
+    changed = set()
+    deleted_posts = set()
+    deleted_comments = set()
+
+    for event in events:
+        if event.author_id not in author_ids:
+            continue
+
+        if event.kind == Event.POST:
+            new_posts.add(event.post_id)
+        elif event.kind == Event.POST_DELETED:
+            deleted_posts.add(event.post_id)
+        elif event.kind == Event.COMMENT_DELETED:
+            deleted_comments.add(event.comment_id)
+            changed.add(event.post_id)
+        else:
+            changed.add(event.post_id)
+
+    new_posts -= deleted_posts
+    changed -= new_posts | deleted_posts
+
+    posts = Post.get_posts_by_ids(new_posts)
+    posts = Post.with_likes(posts, user) if new_posts else []
+
+    counts = [row for shard in for_ids(Post.objects.all(), changed)
+              for row in shard.values_list(
+                  'id', 'like_count', 'comment_count')]
+
+    return {
+        'token': encode_token(events[-1].id if events else last_id),
+        'more': len(events) == size,
+        'posts': [{field: FIELDS[field](post) for field in fields}
+                  for post in posts],
+        'deleted_posts': sorted(deleted_posts),
+        'deleted_comments': sorted(deleted_comments),
+        'counts': {
+            post_id: {'like_count': likes, 'comment_count': comments}
+            for post_id, likes, comments in counts
+        },
+    }
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from blobs.tasks import delete_files
+from jobs.registry import task
+
+from .conditional import bump_feed_version
+from .images import create_variants
+from .models import Post, Comment, Like, TimelineEntry
+from .shards import shard_for_id
+
+
+@task
+def fan_out_post(post_id):
+    post = Post.objects.using(shard_for_id(post_id)).filter(
+        id=post_id, deleted_at__isnull=True).first()
+
+    if post is not None:
+        TimelineEntry.fan_out_to_followers(post)
+        transaction.on_commit(bump_feed_version)
+
+
+@task
+def make_image_variants(post_id):
+    """
+    Generates the variants of the image of a post and bumps its version, so
+    its card is rendered again with them
+    """
+    post = Post.objects.using(shard_for_id(post_id)).filter(
+        id=post_id, deleted_at__isnull=True).first()
+
+    if post is None or post.image_variants.exists():
+        return
+
+    create_variants(post)
+    Post.objects.using(post._state.db).filter(id=post_id).update(
+        version=F('version') + 1)
+    transaction.on_commit(bump_feed_version)
+
+
+def delete_chunk(queryset, chunk_size):
+    """
+    Deletes up to chunk_size rows of the queryset and returns how many. The
+    purged models have no dependents, so each chunk is a single DELETE
+    """
+    ids = list(queryset.values_list('id', flat=True)[:chunk_size])
+
+    if ids:
+        queryset.filter(id__in=ids).delete()
+
+    return len(ids)
+
+
+@task
+def purge_post(post_id):
+    """
+    Removes a deleted post with its comments, likes, timeline entries and
+    files. The dependents go FEED_PURGE_CHUNK_SIZE rows per job, which
+    enqueues the next one, so no transaction holds many locks
+    """
+    shard = shard_for_id(post_id)
+    post = Post.objects.using(shard).filter(
+        id=post_id, deleted_at__isnull=False).first()
+
+    if post is None:
+        return
+
+    chunk_size = settings.FEED_PURGE_CHUNK_SIZE
+    dependents = [
+        Comment.objects.using(shard).filter(post_id=post_id),
+        Like.objects.using(shard).filter(post_id=post_id),
+        TimelineEntry.objects.filter(post_id=post_id),
+    ]
+
+    for queryset in dependents:
+        if delete_chunk(queryset, chunk_size) == chunk_size:
+            purge_post.delay(post_id=post_id)
+            return
+
+    files = [variant.image.name for variant in post.image_variants.all()]
+    if post.image:
+        files.append(post.image.name)
+
+    post.delete()
+    if files:
+        delete_files.delay(names=files)
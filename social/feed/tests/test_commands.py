@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import tempfile
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.files import File
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.utils.six import StringIO
+
+from authentication.models import Profile
+from feed.explain import explain, find_problems, record_queries
+from feed.models import Post, Comment, Like, Follow, TimelineEntry, Event
+
+
+class ReconcileCountersCommandTests(TestCase):
+
+    @classmethod
+    def setUp(cls):
+        cls.user = User.objects.create(
+            username='test_user', password='password')
+        cls.profile = Profile.objects.create(user=cls.user)
+
+    @classmethod
+    def tearDown(cls):
+        cls.user.delete()
+
+    def reconcile(self, chunk_size=2):
+        output = StringIO()
+        call_command(
+            'reconcile_counters', chunk_size=chunk_size, stdout=output)
+        return output.getvalue()
+
+    def test_reconcile_drifted_counters(self):
+        """
+        reconcile_counters must fix the counters that differ from the real
+        number of likes and comments, across several chunks
+        """
+        posts = [
+            Post.objects.create(text='Post %d' % number, author=self.profile)
+            for number in range(5)
+        ]
+
+        Like.objects.create(post=posts[0], author=self.profile)
+        Comment.objects.create(text='Text', post=posts[0], author=self.profile)
+        Comment.objects.create(text='Text', post=posts[4], author=self.profile)
+        Post.objects.filter(id=posts[2].id).update(like_count=7)
+
+        output = self.reconcile()
+
+        counters = Post.objects.order_by('id').values_list(
+            'like_count', 'comment_count')
+        self.assertEqual(
+            list(counters), [(1, 1), (0, 0), (0, 0), (0, 0), (0, 1)])
+        self.assertEqual(
+            list(Post.objects.order_by('id').values_list(
+                'version', flat=True)),
+            [1, 0, 1, 0, 1])
+        self.assertIn('5 posts checked, 3 counters fixed.', output)
+
+    def test_reconcile_correct_counters(self):
+        """
+        reconcile_counters must not change counters that are already right
+        """
+        post = Post.objects.create(text='Post', author=self.profile)
+        Like.objects.create(post=post, author=self.profile)
+        Post.adjust_count(post.id, 'like_count', 1)
+
+        output = self.reconcile()
+
+        post.refresh_from_db()
+        self.assertEqual(post.like_count, 1)
+        self.assertIn('1 posts checked, 0 counters fixed.', output)
+
+
+class SeedDataCommandTests(TestCase):
+
+    def test_seed_data(self):
+        """
+        seed_data must create the requested number of profiles and posts, with
+        counters matching the comments and likes created
+        """
+        output = StringIO()
+        call_command(
+            'seed_data', users=6, posts=15, comments=3, likes=2, follows=2,
+            seed=1, batch_size=4, stdout=output)
+
+        self.assertEqual(Profile.objects.count(), 6)
+        self.assertEqual(Post.objects.count(), 15)
+        self.assertEqual(
+            TimelineEntry.objects.count(),
+            15 + sum(Follow.objects.filter(followee=post.author).count()
+                     for post in Post.objects.all()))
+
+        for profile in Profile.objects.all():
+            self.assertEqual(
+                profile.follower_count, profile.followers.count())
+
+        posts = Post.objects.annotate(
+            likes_total=Count('likes', distinct=True),
+            comments_total=Count('comments', distinct=True))
+        for post in posts:
+            self.assertEqual(post.like_count, post.likes_total)
+            self.assertEqual(post.comment_count, post.comments_total)
+
+        self.assertIn('Created 6 profiles', output.getvalue())
+
+    def test_seed_data_with_invalid_skew(self):
+        """
+        seed_data must refuse distributions without a finite mean
+        """
+        with self.assertRaises(CommandError):
+            call_command('seed_data', users=1, posts=1, skew=1)
+
+
+class BenchmarkViewsCommandTests(TestCase):
+
+    @classmethod
+    def setUp(cls):
+        call_command(
+            'seed_data', users=4, posts=6, seed=1, stdout=StringIO())
+
+    def benchmark(self, budgets):
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as budgets_file:
+            json.dump(budgets, budgets_file)
+            budgets_file.flush()
+
+            output = StringIO()
+            call_command(
+                'benchmark_views', iterations=2, budgets=budgets_file.name,
+                stdout=output)
+
+        return output.getvalue()
+
+    def test_benchmark_within_budgets(self):
+        """
+        benchmark_views must report every view and succeed when no budget is
+        exceeded
+        """
+        output = self.benchmark({'feed': {'queries': 100}})
+
+        for name in ('feed', 'explore', 'like', 'comment', 'delete_post', 'profile'):
+            self.assertIn(name, output)
+        self.assertIn('All budgets met.', output)
+
+    def test_benchmark_over_budget(self):
+        """
+        benchmark_views must fail when a view exceeds its budget
+        """
+        with self.assertRaisesRegex(CommandError, 'feed: queries'):
+            self.benchmark({'feed': {'queries': 0}})
+
+    def test_benchmark_rolls_back_writes(self):
+        """
+        benchmark_views must not keep anything written by the views
+        """
+        posts = Post.objects.count()
+        comments = Comment.objects.count()
+
+        self.benchmark({})
+
+        self.assertEqual(Post.objects.count(), posts)
+        self.assertEqual(Comment.objects.count(), comments)
+
+    def test_benchmark_without_posts(self):
+        """
+        benchmark_views must fail when there is nothing to benchmark
+        """
+        Post.objects.all().delete()
+
+        with self.assertRaises(CommandError):
+            self.benchmark({})
+
+
+class ExplainViewsCommandTests(TestCase):
+
+    @classmethod
+    def setUp(cls):
+        call_command(
+            'seed_data', users=4, posts=6, seed=1, stdout=StringIO())
+
+    def test_explain_views(self):
+        """
+        explain_views must explain the queries of every view it runs and
+        not keep anything they write
+        """
+        posts = Post.objects.count()
+        output = StringIO()
+
+        call_command('explain_views', 'feed', 'delete_post', stdout=output)
+
+        self.assertIn('feed: ', output.getvalue())
+        self.assertIn('delete_post: ', output.getvalue())
+        self.assertNotIn('like: ', output.getvalue())
+        self.assertIn('queries explained', output.getvalue())
+        self.assertEqual(Post.objects.count(), posts)
+
+    def test_record_queries(self):
+        """
+        record_queries() must keep the SQL and the parameters apart, ready
+        to be executed again
+        """
+        with record_queries(connection) as queries:
+            Post.objects.filter(text='Benchmark').count()
+
+        sql, params = queries[0]
+        self.assertIn('%s', sql)
+        self.assertEqual(list(params), ['Benchmark'])
+        self.assertTrue(explain(connection, sql, params))
+
+    def test_find_problems(self):
+        """
+        find_problems() must flag full scans of tables and sorts without an
+        index on every supported database
+        """
+        tables = {'feed_post'}
+        plans = [
+            ('sqlite', 'SCAN feed_post', 'sequential scan'),
+            ('sqlite', 'SCAN TABLE feed_post', 'sequential scan'),
+            ('sqlite', 'USE TEMP B-TREE FOR ORDER BY', 'filesort'),
+            ('postgresql', 'Seq Scan on feed_post  (cost=0.00..1.00 rows=1)',
+             'sequential scan'),
+            ('postgresql', '  ->  Sort  (cost=1.00..1.01 rows=1)', 'filesort'),
+            ('mysql', 'table=feed_post type=ALL Extra=None',
+             'sequential scan'),
+            ('mysql', 'table=feed_post type=index Extra=Using filesort',
+             'filesort'),
+        ]
+
+        for vendor, line, problem in plans:
+            self.assertEqual(
+                find_problems(vendor, [line], tables), [(line, problem)])
+
+    def test_find_no_problems(self):
+        """
+        find_problems() must not flag index scans nor scans of subqueries
+        """
+        tables = {'feed_post'}
+        plans = [
+            ('sqlite', 'SCAN feed_post USING INDEX feed_post_pub_date_idx'),
+            ('sqlite', 'SCAN ranked'),
+            ('sqlite', 'SEARCH feed_post USING INTEGER PRIMARY KEY (rowid=?)'),
+            ('postgresql', 'Index Scan Backward using feed_post_pub_date_idx'),
+            ('postgresql', '  Sort Key: pub_date'),
+            ('mysql', 'table=feed_post type=range Extra=Using where'),
+        ]
+
+        for vendor, line in plans:
+            self.assertEqual(find_problems(vendor, [line], tables), [])
+
+
+class MakeImageVariantsCommandTests(TestCase):
+
+    @classmethod
+    def setUp(cls):
+        cls.user = User.objects.create(
+            username='test_user', password='password')
+        cls.profile = Profile.objects.create(user=cls.user)
+
+    @classmethod
+    def tearDown(cls):
+        cls.user.delete()
+
+    def test_make_image_variants(self):
+        """
+        make_image_variants must generate the variants of the posts with
+        images that have none, only once
+        """
+        path = os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), 'files',
+            'image_test.png')
+        post = Post(text='Post text', author=self.profile)
+        with open(path, 'rb') as image:
+            post.image.save('image_test.png', File(image))
+        Post.objects.create(text='Without image', author=self.profile)
+
+        output = StringIO()
+        call_command('make_image_variants', stdout=output)
+
+        self.assertIn('1 posts processed, 0 failed.', output.getvalue())
+        self.assertTrue(post.image_variants.exists())
+        self.assertEqual(Post.objects.get(id=post.id).version, 1)
+
+        output = StringIO()
+        call_command('make_image_variants', stdout=output)
+
+        self.assertIn('0 posts processed', output.getvalue())
+
+
+class PruneEventsCommandTests(TestCase):
+
+    @override_settings(FEED_EVENTS_RETENTION=60)
+    def test_prune_old_events(self):
+        """
+        prune_events must delete the events older than the retention, across
+        several chunks, and keep the newer ones
+        """
+        events = [Event.objects.create(kind=Event.LIKE, post_id=1, count=1)
+                  for _ in range(4)]
+        Event.objects.filter(id__in=[event.id for event in events[:3]]).update(
+            created_at=timezone.now() - timedelta(minutes=2))
+
+        output = StringIO()
+        call_command('prune_events', chunk_size=2, stdout=output)
+
+        self.assertEqual(list(Event.objects.all()), [events[3]])
+        self.assertIn('3 events deleted.', output.getvalue())
+
+
+class PurgeDeletedCommandTests(TestCase):
+
+    @override_settings(FEED_PURGE_CHUNK_SIZE=2)
+    def test_purge_deleted(self):
+        """
+        purge_deleted must delete the deleted comments, across several
+        chunks, and enqueue the purge of the posts deleted long ago
+        """
+        user = User.objects.create(username='purged', password='password')
+        profile = Profile.objects.create(user=user)
+        post = Post.objects.create(text='Post text', author=profile)
+        comments = [Comment.objects.create(
+            text='Comment text', post=post, author=profile)
+            for _ in range(4)]
+        Comment.objects.filter(
+            id__in=[comment.id for comment in comments[:3]]).update(
+            deleted_at=timezone.now())
+        Post.objects.create(
+            text='Deleted text', author=profile,
+            deleted_at=timezone.now() - timedelta(hours=2))
+
+        output = StringIO()
+        call_command('purge_deleted', stdout=output)
+
+        self.assertEqual(list(Comment.objects.all()), [comments[3]])
+        self.assertIn('3 comments deleted, 1 posts to purge.',
+                      output.getvalue())
+
+        call_command('run_jobs', once=True, stdout=StringIO())
+        self.assertEqual(list(Post.objects.all()), [post])
@@ -1,10 +1,19 @@
 # -*- coding: utf-8 -*-
 
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+import threading
+import time
 
 from authentication.models import Profile
-from feed.models import Post, Like
+from feed.events import DatabaseBroker, LocalBroker
+from feed.liked import LikedCache
+from feed.models import Post, Comment, Like, Follow, TimelineEntry, Event
+from feed.pagination import decode_cursor, encode_cursor
 
 
 class PostModelTests(TestCase):
@@ -19,6 +28,8 @@ class PostModelTests(TestCase):
 
     @classmethod
     def setUp(cls):
+        caches['liked'].clear()
+
         cls.user = User.objects.create(
             username='test_user', password='password')
         Profile.objects.create(user=cls.user)
@@ -51,7 +62,7 @@ class PostModelTests(TestCase):
 
         posts = Post.get_posts_with_likes(self.user)
 
-        self.assertEqual(posts.count(), 1)
+        self.assertEqual(len(posts), 1)
         self.assertTrue(posts[0].liked)
 
     def test_get_posts_with_likes_withou_liked_post(self):
@@ -71,6 +82,483 @@ class PostModelTests(TestCase):
 
         posts = Post.get_posts_with_likes(self.user)
 
-        self.assertEqual(posts.count(), 2)
+        self.assertEqual(len(posts), 2)
         self.assertFalse(posts[0].liked)
         self.assertFalse(posts[1].liked)
+
+    def test_get_posts_with_likes_after_cursor(self):
+        """
+        get_posts_with_likes() must return only the posts older than the
+        cursor, limited to the given number of posts
+        """
+        posts = [
+            self.create_post('Post %d' % number, self.user.profile)
+            for number in range(4)
+        ]
+
+        cursor = decode_cursor(encode_cursor(posts[3]))
+        page = Post.get_posts_with_likes(self.user, cursor, 2)
+
+        self.assertEqual(list(page), [posts[2], posts[1]])
+
+    def test_get_posts_with_likes_number_of_queries(self):
+        """
+        get_posts_with_likes() must fetch the posts and their authors in a
+        single query, answering the liked state from the warm liked cache
+        """
+        other_user = User.objects.create(
+            username='other_user', password='password')
+        Profile.objects.create(user=other_user)
+
+        for number in range(3):
+            post = self.create_post('Post %d' % number, other_user.profile)
+            self.like_post(post, self.user.profile)
+
+        self.create_post('Not liked post', self.user.profile)
+        self.user.profile
+        Post.get_posts_with_likes(self.user)
+
+        with self.assertNumQueries(1):
+            posts = Post.get_posts_with_likes(self.user)
+            liked = [bool(post.liked) for post in posts]
+            authors = [
+                (post.author.first_name, post.author.image, post.author.user)
+                for post in posts
+            ]
+
+        self.assertEqual(liked, [False, True, True, True])
+        self.assertEqual(len(authors), 4)
+
+
+class CommentModelTests(TestCase):
+
+    @classmethod
+    def setUp(cls):
+        cls.user = User.objects.create(
+            username='test_user', password='password')
+        cls.profile = Profile.objects.create(user=cls.user)
+
+    @classmethod
+    def tearDown(cls):
+        cls.user.delete()
+
+    def create_post_with_comments(self, number_of_comments):
+        post = Post.objects.create(text='Post text', author=self.profile)
+        comments = [
+            Comment.objects.create(
+                text='Comment %d' % number, post=post, author=self.profile)
+            for number in range(number_of_comments)
+        ]
+        Post.adjust_count(post.id, 'comment_count', number_of_comments)
+        post.refresh_from_db()
+
+        return post, comments
+
+    def test_get_latest_comments_without_posts(self):
+        """
+        get_latest_comments() must return no comments when no posts are given
+        """
+        self.assertQuerysetEqual(Comment.get_latest_comments([], 3), [])
+
+    def test_get_latest_comments_limit_per_post(self):
+        """
+        get_latest_comments() must return at most limit comments of each
+        post, the latest ones, in chronological order
+        """
+        first_post, first_comments = self.create_post_with_comments(5)
+        second_post, second_comments = self.create_post_with_comments(2)
+        self.create_post_with_comments(4)
+
+        comments = Comment.get_latest_comments(
+            [first_post.id, second_post.id], 3)
+
+        self.assertEqual(
+            list(comments), first_comments[2:] + second_comments)
+
+    def test_get_latest_comments_skips_deleted(self):
+        """
+        get_latest_comments() must leave out the deleted comments, and
+        answer the older ones in their place
+        """
+        post, comments = self.create_post_with_comments(4)
+        Comment.objects.filter(id=comments[3].id).update(
+            deleted_at=timezone.now())
+
+        comments_left = Comment.get_latest_comments([post.id], 2)
+
+        self.assertEqual(list(comments_left), comments[1:3])
+
+    def test_attach_latest_comments(self):
+        """
+        attach_latest_comments() must set the latest comments of each post,
+        with their authors, and a cursor only when there are older comments
+        """
+        first_post, first_comments = self.create_post_with_comments(5)
+        second_post, second_comments = self.create_post_with_comments(2)
+
+        with self.assertNumQueries(1):
+            Comment.attach_latest_comments([first_post, second_post], 2)
+            authors = [
+                comment.author.first_name
+                for comment in first_post.latest_comments
+            ]
+
+        self.assertEqual(first_post.latest_comments, first_comments[3:])
+        self.assertEqual(
+            first_post.comments_cursor, encode_cursor(first_comments[3]))
+        self.assertEqual(second_post.latest_comments, second_comments)
+        self.assertIsNone(second_post.comments_cursor)
+        self.assertEqual(len(authors), 2)
+
+    def test_attach_latest_comments_with_drifted_counter(self):
+        """
+        attach_latest_comments() must set no cursor on a post whose counter
+        is above zero while none of its comments is left
+        """
+        post, comments = self.create_post_with_comments(2)
+        Comment.objects.filter(post=post).update(deleted_at=timezone.now())
+
+        Comment.attach_latest_comments([post], 2)
+
+        self.assertEqual(post.latest_comments, [])
+        self.assertIsNone(post.comments_cursor)
+
+
+class LikeModelTests(TestCase):
+
+    @classmethod
+    def setUp(cls):
+        caches['liked'].clear()
+
+        cls.user = User.objects.create(
+            username='test_user', password='password')
+        cls.profile = Profile.objects.create(user=cls.user)
+        cls.post = Post.objects.create(text='Post text', author=cls.profile)
+
+    @classmethod
+    def tearDown(cls):
+        cls.user.delete()
+
+    def test_duplicate_like(self):
+        """
+        The same profile must not be able to like a post twice
+        """
+        Like.objects.create(post=self.post, author=self.profile)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Like.objects.create(post=self.post, author=self.profile)
+
+    def test_toggle_like(self):
+        """
+        toggle() must like a post not liked yet and return the new state and
+        number of likes
+        """
+        liked, like_count = Like.toggle(self.post.id, self.profile)
+
+        self.assertTrue(liked)
+        self.assertEqual(like_count, 1)
+        self.assertTrue(
+            Like.objects.filter(post=self.post, author=self.profile).exists())
+
+    def test_toggle_unlike(self):
+        """
+        toggle() must remove the like of a liked post and return the new state
+        and number of likes
+        """
+        Like.toggle(self.post.id, self.profile)
+
+        with self.assertNumQueries(5):
+            liked, like_count = Like.toggle(self.post.id, self.profile)
+
+        self.assertFalse(liked)
+        self.assertEqual(like_count, 0)
+        self.assertQuerysetEqual(Like.objects.all(), [])
+
+
+class TimelineModelTests(TestCase):
+
+    @staticmethod
+    def create_profile(username):
+        user = User.objects.create(username=username, password='password')
+        return Profile.objects.create(user=user)
+
+    @staticmethod
+    def publish(author, text='Post text'):
+        post = Post.objects.create(text=text, author=author)
+        TimelineEntry.fan_out(post)
+        return post
+
+    @classmethod
+    def setUp(cls):
+        caches['liked'].clear()
+
+        cls.reader = cls.create_profile('reader')
+        cls.author = cls.create_profile('author')
+        cls.stranger = cls.create_profile('stranger')
+
+    @classmethod
+    def tearDown(cls):
+        User.objects.all().delete()
+
+    def test_fan_out(self):
+        """
+        fan_out() must write the post to the timelines of the author and of
+        its followers only
+        """
+        Follow.toggle(self.reader, self.author.id)
+        post = self.publish(self.author)
+
+        owners = TimelineEntry.objects.filter(post=post).values_list(
+            'owner_id', flat=True)
+        self.assertEqual(set(owners), {self.reader.id, self.author.id})
+
+    def test_home_posts(self):
+        """
+        get_home_posts() must return the posts of the followed profiles and
+        of the user, newest first, and not the posts of other profiles
+        """
+        Follow.toggle(self.reader, self.author.id)
+        first_post = self.publish(self.author)
+        self.publish(self.stranger)
+        own_post = self.publish(self.reader)
+        last_post = self.publish(self.author)
+
+        posts = TimelineEntry.get_home_posts(self.reader.user)
+
+        self.assertEqual(list(posts), [last_post, own_post, first_post])
+
+    def test_home_posts_after_cursor(self):
+        """
+        get_home_posts() must return only the posts older than the cursor,
+        limited to the given number of posts
+        """
+        posts = [self.publish(self.reader, 'Post %d' % n) for n in range(4)]
+
+        cursor = decode_cursor(encode_cursor(posts[3]))
+        page = TimelineEntry.get_home_posts(self.reader.user, cursor, 2)
+
+        self.assertEqual(list(page), [posts[2], posts[1]])
+
+    @override_settings(FEED_FANOUT_LIMIT=0)
+    def test_home_posts_of_not_fanned_out_author(self):
+        """
+        Posts of authors with too many followers must not be written to the
+        followers' timelines, but must still be read from them
+        """
+        Follow.toggle(self.reader, self.author.id)
+        first_post = self.publish(self.author)
+        own_post = self.publish(self.reader)
+        last_post = self.publish(self.author)
+
+        posts = TimelineEntry.get_home_posts(self.reader.user, None, 2)
+
+        self.assertFalse(
+            TimelineEntry.objects.filter(owner=self.reader,
+                                         post=first_post).exists())
+        self.assertEqual(list(posts), [last_post, own_post])
+
+    def test_follow_backfills_timeline(self):
+        """
+        Following a profile must bring its latest posts to the timeline and
+        unfollowing it must remove them
+        """
+        post = self.publish(self.author)
+
+        following, followers = Follow.toggle(self.reader, self.author.id)
+        self.assertTrue(following)
+        self.assertEqual(followers, 1)
+        self.assertEqual(
+            list(TimelineEntry.get_home_posts(self.reader.user)), [post])
+
+        following, followers = Follow.toggle(self.reader, self.author.id)
+        self.assertFalse(following)
+        self.assertEqual(followers, 0)
+        self.assertEqual(
+            list(TimelineEntry.get_home_posts(self.reader.user)), [])
+
+
+class CursorTests(TestCase):
+
+    def test_decode_invalid_cursor(self):
+        """
+        decode_cursor() must raise a ValueError when the cursor is malformed
+        """
+        for cursor in ('', 'invalid', 'bm90LWEtY3Vyc29y'):
+            with self.assertRaises(ValueError):
+                decode_cursor(cursor)
+
+
+class LikedCacheTests(TestCase):
+    """
+    Each LikedCache instance stands for a worker process; all of them share
+    the same cache, as the workers share memcached
+    """
+
+    @classmethod
+    def setUp(cls):
+        caches['liked'].clear()
+
+        cls.user = User.objects.create(
+            username='test_user', password='password')
+        cls.profile = Profile.objects.create(user=cls.user)
+        cls.posts = [
+            Post.objects.create(text='Post %d' % number, author=cls.profile)
+            for number in range(3)
+        ]
+
+    @classmethod
+    def tearDown(cls):
+        cls.user.delete()
+        caches['liked'].clear()
+
+    @staticmethod
+    def worker(size=None):
+        return LikedCache(Like.get_liked_ids, size=size)
+
+    def lookup(self):
+        return self.worker().lookup(
+            self.profile.id, [post.id for post in self.posts])
+
+    def test_lookup(self):
+        """
+        lookup() must return the liked posts among the given ones
+        """
+        Like.objects.create(post=self.posts[1], author=self.profile)
+
+        self.assertEqual(self.lookup(), {self.posts[1].id})
+
+    def test_record_writes_through(self):
+        """
+        After a toggle is recorded, lookup() must answer the new state
+        without querying the database
+        """
+        worker = self.worker()
+        self.lookup()
+
+        Like.toggle(self.posts[0].id, self.profile)
+        worker.record(self.profile.id, self.posts[0].id)
+
+        with self.assertNumQueries(0):
+            liked = self.lookup()
+
+        self.assertEqual(liked, {self.posts[0].id})
+
+    def test_toggles_recorded_out_of_order(self):
+        """
+        A like and an unlike recorded by two workers in the opposite order
+        of their commits must leave the post not liked
+        """
+        first, second = self.worker(), self.worker()
+        self.lookup()
+        post_id = self.posts[0].id
+
+        Like.toggle(post_id, self.profile)
+        Like.toggle(post_id, self.profile)
+        second.record(self.profile.id, post_id)
+        first.record(self.profile.id, post_id)
+
+        self.assertEqual(self.lookup(), set())
+
+    def test_toggles_recorded_concurrently(self):
+        """
+        A worker recording a toggle while another one recorded a toggle in
+        between must not store an entry missing either of them
+        """
+        first, second = self.worker(), self.worker()
+        self.lookup()
+
+        Like.toggle(self.posts[0].id, self.profile)
+        Like.toggle(self.posts[1].id, self.profile)
+        gen_key, ids_key = LikedCache.keys(self.profile.id)
+        caches['liked'].incr(gen_key)
+        second.record(self.profile.id, self.posts[1].id)
+        first.record(self.profile.id, self.posts[0].id)
+
+        self.assertEqual(
+            self.lookup(), {self.posts[0].id, self.posts[1].id})
+
+    def test_fill_racing_a_toggle(self):
+        """
+        An entry filled from a read made before a toggle was recorded must
+        not be served afterwards
+        """
+        reader, writer = self.worker(), self.worker()
+        generation, entry = reader.read(self.profile.id)
+        self.assertIsNone(entry)
+
+        Like.toggle(self.posts[2].id, self.profile)
+        writer.record(self.profile.id, self.posts[2].id)
+        caches['liked'].set(
+            LikedCache.keys(self.profile.id)[1],
+            (generation, 0, frozenset()))
+
+        self.assertEqual(self.lookup(), {self.posts[2].id})
+
+    def test_evicted_generation(self):
+        """
+        An entry must not be served after the generation of its profile was
+        evicted, since toggles could not be recorded meanwhile
+        """
+        self.lookup()
+        caches['liked'].delete(LikedCache.keys(self.profile.id)[0])
+
+        Like.toggle(self.posts[0].id, self.profile)
+        self.worker().record(self.profile.id, self.posts[0].id)
+
+        self.assertEqual(self.lookup(), {self.posts[0].id})
+
+    def test_likes_beyond_size(self):
+        """
+        Only the most recent likes must be kept, and older posts must still
+        be answered from the database
+        """
+        for post in self.posts:
+            Like.objects.create(post=post, author=self.profile)
+
+        worker = self.worker(size=2)
+        liked = worker.lookup(
+            self.profile.id, [post.id for post in self.posts])
+
+        _, entry = worker.read(self.profile.id)
+        self.assertEqual(len(entry[2]), 2)
+        self.assertEqual(liked, set(post.id for post in self.posts))
+
+
+class EventBrokerTests(TestCase):
+
+    def test_wait_times_out_without_events(self):
+        """
+        Waiting on a broker without newer events must return False once
+        the timeout passes
+        """
+        broker = LocalBroker()
+        broker.notify(5)
+
+        self.assertFalse(broker.wait(5, 0.01))
+        self.assertTrue(broker.wait(4, 0.01))
+
+    def test_wait_wakes_on_notify(self):
+        """
+        A stream waiting on the broker must wake up as soon as a newer event
+        is published by another thread
+        """
+        broker = LocalBroker()
+        timer = threading.Timer(0.05, broker.notify, [1])
+        timer.start()
+
+        started = time.time()
+        self.assertTrue(broker.wait(0, 5))
+        self.assertLess(time.time() - started, 5)
+        timer.join()
+
+    def test_database_broker_sees_the_newest_event(self):
+        """
+        Checking the database must make the broker know the newest event,
+        even when it was published by another process
+        """
+        broker = DatabaseBroker()
+        event = Event.objects.create(kind=Event.LIKE, post_id=1, count=1)
+
+        broker.check()
+
+        self.assertEqual(broker.last_id, event.id)
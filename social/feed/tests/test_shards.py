@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.files import File
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.urlresolvers import reverse
+from django.db import connections
+from django.db.models import F
+from django.test import TransactionTestCase, override_settings
+from django.utils import timezone
+from django.utils.six import StringIO
+
+from authentication.models import Profile
+from feed.models import (
+    Post, Comment, Like, Follow, TimelineEntry, ImageVariant)
+from feed.pagination import encode_cursor
+from feed.shards import MAX_ID, shard_for_author, shard_for_id
+from feed.tasks import fan_out_post, purge_post
+
+SHARDS = ['shard0', 'shard1']
+
+
+@override_settings(FEED_SHARDS=SHARDS)
+class ShardTests(TransactionTestCase):
+    # The shards are read from other threads, which only see committed rows
+    multi_db = True
+
+    @classmethod
+    def setUpClass(cls):
+        cls.shard_paths = []
+
+        for alias in SHARDS:
+            handle, path = tempfile.mkstemp(suffix='.sqlite3')
+            os.close(handle)
+            cls.shard_paths.append(path)
+
+            connections.databases[alias] = {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': path,
+            }
+            call_command('migrate', database=alias, verbosity=0)
+
+        super(ShardTests, cls).setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super(ShardTests, cls).tearDownClass()
+
+        for alias, path in zip(SHARDS, cls.shard_paths):
+            connections[alias].close()
+            del connections[alias]
+            del connections.databases[alias]
+            os.remove(path)
+
+    def setUp(self):
+        cache.clear()
+        caches['liked'].clear()
+        call_command('init_shards', stdout=StringIO())
+
+        self.user = User.objects.create(username='reader')
+        self.profile = Profile.objects.create(user=self.user)
+        self.author = Profile.objects.create(
+            user=User.objects.create(username='author'))
+
+    def create_post(self, author, text, minutes=0):
+        post = Post(author=author, text=text)
+        post.save()
+        post.pub_date = timezone.now() - timedelta(minutes=minutes)
+        post.save(update_fields=['pub_date'])
+        return post
+
+    def test_posts_are_stored_on_the_shard_of_their_author(self):
+        """
+        Published posts must be stored on the shard of their author, with
+        an id in the range of that shard
+        """
+        self.client.force_login(self.user)
+        self.client.post(reverse('feed:feed'), {'text': 'Sharded text'})
+
+        shard = shard_for_author(self.profile.id)
+        post = Post.objects.using(shard).get()
+
+        self.assertEqual(post.text, 'Sharded text')
+        self.assertEqual(shard_for_id(post.id), shard)
+        self.assertEqual(
+            post.id // settings.FEED_SHARD_ID_SPAN, SHARDS.index(shard))
+        self.assertEqual(TimelineEntry.objects.get().post_id, post.id)
+
+    def test_shard_ids_fit_the_id_columns(self):
+        """
+        The ranges of ids of the shards must fit the integer id columns, and
+        init_shards must refuse ranges that do not
+        """
+        self.assertLessEqual(
+            len(SHARDS) * settings.FEED_SHARD_ID_SPAN, MAX_ID)
+
+        with self.settings(FEED_SHARD_ID_SPAN=10 ** 12):
+            with self.assertRaises(CommandError):
+                call_command('init_shards', stdout=StringIO())
+
+    def test_explore_merges_the_posts_of_every_shard(self):
+        """
+        The explore pages must merge the posts of both shards in feed order,
+        with their authors
+        """
+        texts = ['First', 'Second', 'Third', 'Fourth']
+        for minutes, text in enumerate(texts):
+            author = self.profile if minutes % 2 else self.author
+            self.create_post(author, text, minutes)
+
+        posts = Post.get_posts_with_likes(self.user, limit=3)
+        self.assertEqual([post.text for post in posts], texts[:3])
+        self.assertEqual(posts[1].author.user, self.user)
+
+        cursor = (posts[-1].pub_date, posts[-1].id)
+        posts = Post.get_posts_with_likes(self.user, cursor, limit=3)
+        self.assertEqual([post.text for post in posts], texts[3:])
+
+    def test_likes_and_comments_are_stored_with_their_post(self):
+        """
+        The likes and comments of a post must be stored on its shard, and
+        answered from there
+        """
+        post = self.create_post(self.author, 'Liked text')
+        shard = post._state.db
+        self.client.force_login(self.user)
+
+        response = self.client.post(reverse('feed:like'), {'post_id': post.id})
+        self.assertEqual(response.content, b'1')
+        self.client.post(
+            reverse('feed:add_comment'), {'post': post.id, 'text': 'Comment'})
+
+        self.assertEqual(Like.objects.using(shard).get().post_id, post.id)
+        comment = Comment.objects.using(shard).get()
+        self.assertEqual(comment.author, self.profile)
+        self.assertEqual(Like.get_liked_ids(self.profile.id), [post.id])
+
+        later = Comment(id=0, pub_date=timezone.now() + timedelta(minutes=1))
+        response = self.client.get(reverse('feed:comments'), {
+            'post': post.id, 'cursor': encode_cursor(later)})
+        self.assertContains(response, 'Comment')
+
+    def test_home_feed_reads_every_shard(self):
+        """
+        The home feed must answer the own posts and the ones of the followed
+        authors, whichever shard stores them
+        """
+        Follow.toggle(self.profile, self.author.id)
+        followed = self.create_post(self.author, 'Followed text', 1)
+        fan_out_post(post_id=followed.id)
+        own = self.create_post(self.profile, 'Own text')
+        TimelineEntry.add_own(own)
+
+        posts = TimelineEntry.get_home_posts(self.user)
+
+        self.assertNotEqual(followed._state.db, own._state.db)
+        self.assertEqual([post.id for post in posts], [own.id, followed.id])
+
+    def test_deleted_post_leaves_no_timeline_entries(self):
+        """
+        Purging a deleted post must delete its comments on the shard and its
+        timeline entries on the default database
+        """
+        post = self.create_post(self.profile, 'Deleted text')
+        TimelineEntry.add_own(post)
+        Comment.objects.using(post._state.db).create(
+            post=post, author=self.author, text='Comment')
+
+        self.client.force_login(self.user)
+        response = self.client.post(
+            reverse('feed:delete'), {'post_id': post.id})
+
+        self.assertEqual(response.status_code, 200)
+        purge_post(post_id=post.id)
+
+        self.assertFalse(Post.objects.using(post._state.db).exists())
+        self.assertFalse(Comment.objects.using(post._state.db).exists())
+        self.assertFalse(TimelineEntry.objects.exists())
+
+    def test_commands_cover_every_shard(self):
+        """
+        seed_data must store the posts, with their comments and likes, on
+        the shards of their authors and fan them out, and reconcile_counters
+        must then check the posts of every shard
+        """
+        call_command(
+            'seed_data', users=6, posts=12, comments=2, likes=2, follows=2,
+            seed=1, stdout=StringIO())
+
+        posts = [Post.objects.using(alias).count() for alias in SHARDS]
+        self.assertEqual(sum(posts), 12)
+        self.assertNotIn(0, posts)
+        self.assertEqual(
+            TimelineEntry.objects.filter(owner_id=F('author_id')).count(), 12)
+
+        for alias in SHARDS:
+            Post.objects.using(alias).update(like_count=100)
+
+        output = StringIO()
+        call_command('reconcile_counters', stdout=output)
+
+        self.assertIn(
+            '12 posts checked, 12 counters fixed.', output.getvalue())
+        for alias in SHARDS:
+            for post in Post.objects.using(alias):
+                self.assertEqual(post.like_count, Like.objects.using(
+                    alias).filter(post_id=post.id).count())
+
+    def test_explain_views_on_every_shard(self):
+        """
+        explain_views must explain the queries run on the shards and not
+        keep anything the views write there
+        """
+        post = self.create_post(self.author, 'Explained text')
+        output = StringIO()
+
+        call_command(
+            'explain_views', 'explore', 'like', verbosity=2, stdout=output)
+
+        self.assertIn('FROM "feed_post"', output.getvalue())
+        self.assertIn('UPDATE "feed_post"', output.getvalue())
+        self.assertFalse(Like.objects.using(post._state.db).exists())
+
+    def test_make_image_variants_on_every_shard(self):
+        """
+        make_image_variants must generate the variants of the posts of every
+        shard, on the shard of the post
+        """
+        path = os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), 'files',
+            'image_test.png')
+
+        posts = []
+        for author in (self.profile, self.author):
+            post = Post(text='Post text', author=author)
+            with open(path, 'rb') as image:
+                post.image.save('image_test.png', File(image))
+            posts.append(post)
+
+        output = StringIO()
+        call_command('make_image_variants', stdout=output)
+
+        self.assertIn('2 posts processed, 0 failed.', output.getvalue())
+        for post in posts:
+            self.assertTrue(ImageVariant.objects.using(
+                post._state.db).filter(post_id=post.id).exists())
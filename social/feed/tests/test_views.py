@@ -3,12 +3,29 @@
 from django.core.urlresolvers import reverse
 
 from django.contrib.auth.models import User
-from django.test import TestCase
-
+from django.core.cache import cache, caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.six import StringIO
+
+import json
 import os
+import time
+from datetime import timedelta
+from unittest.mock import patch
 
 from authentication.models import Profile
-from feed.models import Post, Comment, Like
+from feed import cards
+from feed.conditional import MODIFIED_KEY, bump_feed_version
+from feed.models import Post, Comment, Like, Follow, TimelineEntry, Event
+from feed.pagination import encode_cursor
+from feed.sync import encode_token
+from jobs.models import Job
 
 
 class FeedViewTest(TestCase):
@@ -20,6 +37,8 @@ class FeedViewTest(TestCase):
 
     @classmethod
     def setUp(cls):
+        caches['liked'].clear()
+
         cls.user = User.objects.create(
             username='temporary',
             email='temporary@gmail.com',
@@ -32,7 +51,9 @@ class FeedViewTest(TestCase):
         cls.user.delete()
 
     def create_post(self, text):
-        return Post.objects.create(author=self.user.profile, text=text)
+        post = Post.objects.create(author=self.user.profile, text=text)
+        TimelineEntry.fan_out(post)
+        return post
 
     def access_feed(self):
         self.client.force_login(user=self.user)
@@ -80,6 +101,66 @@ class FeedViewTest(TestCase):
         self.assertNotContains(response, 'Nenhuma publicação')
         self.assertEqual(len(response.context['post_list']), 2)
 
+    @override_settings(FEED_PAGE_SIZE=2)
+    def test_feed_with_more_posts_than_a_page(self):
+        """
+        If there are more posts than fit in a page, only the newest ones
+        must be displayed along with the link to the next page
+        """
+        first_post = self.create_post('First Post')
+        second_post = self.create_post('Second Post')
+        third_post = self.create_post('Third Post')
+
+        response = self.access_feed()
+
+        self.assertNotContains(response, first_post.text)
+        self.assertContains(response, second_post.text)
+        self.assertContains(response, third_post.text)
+        self.assertEqual(
+            response.context['next_cursor'], encode_cursor(second_post))
+
+    @override_settings(FEED_PAGE_SIZE=2)
+    def test_feed_with_exactly_one_page_of_posts(self):
+        """
+        If all the posts fit in a page, there must be no next page
+        """
+        self.create_post('First Post')
+        self.create_post('Second Post')
+
+        response = self.access_feed()
+
+        self.assertIsNone(response.context['next_cursor'])
+        self.assertNotContains(response, 'feed-next')
+
+    def test_feed_number_of_queries(self):
+        """
+        The number of queries of the feed must not depend on the number of
+        posts, likes and comments displayed
+        """
+        def create_posts(number):
+            for _ in range(number):
+                post = self.create_post('Post text')
+                Like.objects.create(post=post, author=self.user.profile)
+                for _ in range(4):
+                    Comment.objects.create(
+                        text='Comment', post=post, author=self.user.profile)
+                Post.objects.filter(id=post.id).update(
+                    like_count=1, comment_count=4)
+
+        create_posts(2)
+        self.client.force_login(user=self.user)
+        # Caches the session and the user, as any earlier request would
+        self.client.get(reverse('authentication:profile'))
+        with CaptureQueriesContext(connection) as few_posts:
+            self.client.get(reverse('feed:feed'))
+
+        create_posts(6)
+        caches['liked'].clear()
+        with CaptureQueriesContext(connection) as many_posts:
+            self.client.get(reverse('feed:feed'))
+
+        self.assertEqual(len(few_posts), len(many_posts))
+
     def test_publish_with_no_text_and_no_image(self):
         """
         Trying to pusblish a post with no text and no image, the post
@@ -129,10 +210,203 @@ class FeedViewTest(TestCase):
             response = self.try_to_publish(context)
 
         self.assertContains(response, post_text)
-        self.assertContains(response, 'image_test')
+        self.assertContains(response, Post.objects.get().image.url)
         self.assertEqual(len(response.context['post_list']), 1)
         self.assertEqual(len(response.redirect_chain), 1)
 
+    def test_publish_fans_out_in_jobs(self):
+        """
+        Publishing a post must show it to its author at once and to the
+        followers after the jobs ran
+        """
+        follower = User.objects.create(username='follower')
+        Follow.objects.create(
+            follower=Profile.objects.create(user=follower),
+            followee=self.user.profile)
+
+        self.try_to_publish({'text': 'Post text'})
+
+        self.assertEqual(
+            list(Job.objects.values_list('task', flat=True)),
+            ['feed.tasks.fan_out_post'])
+        self.assertEqual(TimelineEntry.objects.count(), 1)
+
+        call_command('run_jobs', once=True, stdout=StringIO())
+
+        self.assertEqual(TimelineEntry.objects.count(), 2)
+        self.assertFalse(Job.objects.exists())
+
+    @override_settings(FEED_IMAGE_WIDTHS=(50, 100, 400))
+    def test_publish_image_variants(self):
+        """
+        Publishing a post with an image must store its dimensions and, once
+        the jobs ran, variants narrower than it offered through srcset
+        """
+        with open(self.get_image_path(), 'rb') as image:
+            self.try_to_publish({'text': 'Text', 'image': image})
+
+        call_command('run_jobs', once=True, stdout=StringIO())
+        response = self.access_feed()
+        post = Post.objects.get()
+        variants = post.image_variants.order_by('width', 'content_type')
+
+        self.assertEqual((post.image_width, post.image_height), (211, 192))
+        self.assertEqual(
+            sorted(set(variant.width for variant in variants)), [50, 100])
+        self.assertIn(
+            'image/jpeg', [variant.content_type for variant in variants])
+        self.assertEqual(
+            [(variant.width, variant.height) for variant in variants
+             if variant.content_type == 'image/jpeg'],
+            [(50, 45), (100, 91)])
+        self.assertContains(response, 'srcset="')
+        self.assertContains(response, '%s 100w' % variants.get(
+            width=100, content_type='image/jpeg').image.url)
+
+    def test_feed_with_a_missing_image_file(self):
+        """
+        A post whose image file was removed, and whose dimensions are not
+        known, must still be displayed on the feed and the explore pages
+        """
+        with open(self.get_image_path(), 'rb') as image:
+            self.try_to_publish({'text': 'Post text', 'image': image})
+
+        post = Post.objects.get()
+        self.assertEqual((post.image_width, post.image_height), (211, 192))
+
+        default_storage.delete(post.image.name)
+        Post.objects.update(image_width=None, image_height=None)
+
+        response = self.access_feed()
+        explore = self.client.get(reverse('feed:explore'))
+
+        self.assertContains(response, post.image.url)
+        self.assertContains(explore, post.image.url)
+
+    def test_publish_with_ajax(self):
+        """
+        Publishing a post through AJAX must answer only its card, with
+        queries that do not grow with the size of the feed
+        """
+        def publish(text):
+            self.client.force_login(user=self.user)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(
+                    reverse('feed:feed'), {'text': text},
+                    HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+            return response, len(queries)
+
+        _, first_count = publish('First Post')
+        for index in range(5):
+            self.create_post('Post %d' % index)
+        response, count = publish('Last Post')
+        post = Post.objects.latest('id')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'id="post_%d"' % post.id)
+        self.assertContains(response, 'Last Post')
+        self.assertNotContains(response, 'Post 0')
+        self.assertEqual(first_count, count)
+
+    def test_publish_invalid_with_ajax(self):
+        """
+        Trying to publish a post with no text through AJAX must not publish
+        it and return a 400 bad request
+        """
+        self.client.force_login(user=self.user)
+        response = self.client.post(
+            reverse('feed:feed'), {},
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Post.objects.exists())
+
+
+@override_settings(FEED_PAGE_SIZE=2)
+class FeedPageViewTest(TestCase):
+
+    @classmethod
+    def setUp(cls):
+        caches['liked'].clear()
+
+        cls.user = User.objects.create(
+            username='temporary', password='tempo1234')
+        profile = Profile.objects.create(user=cls.user)
+
+        cls.posts = [
+            Post.objects.create(author=profile, text='Post %d' % number)
+            for number in range(5)
+        ]
+        for post in cls.posts:
+            TimelineEntry.fan_out(post)
+
+    @classmethod
+    def tearDown(cls):
+        cls.user.delete()
+
+    def access_page(self, cursor):
+        self.client.force_login(user=self.user)
+        return self.client.get(reverse('feed:page'), {'cursor': cursor})
+
+    def test_page_without_cursor(self):
+        """
+        Trying to access a page without a cursor must return a 400 bad request
+        """
+        self.client.force_login(user=self.user)
+        response = self.client.get(reverse('feed:page'))
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_page_with_invalid_cursor(self):
+        """
+        Trying to access a page with a malformed cursor must return a 400
+        bad request
+        """
+        response = self.access_page('invalid')
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_page_after_cursor(self):
+        """
+        A page must contain only the posts older than the cursor and the
+        cursor of the next page
+        """
+        response = self.access_page(encode_cursor(self.posts[3]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            list(response.context['post_list']),
+            [self.posts[2], self.posts[1]])
+        self.assertEqual(
+            response.context['next_cursor'], encode_cursor(self.posts[1]))
+        self.assertNotContains(response, 'Nenhuma publicação')
+
+    def test_last_page(self):
+        """
+        The last page must contain the remaining posts and no next cursor
+        """
+        response = self.access_page(encode_cursor(self.posts[1]))
+
+        self.assertEqual(list(response.context['post_list']), [self.posts[0]])
+        self.assertIsNone(response.context['next_cursor'])
+        self.assertNotContains(response, 'feed-next')
+
+    def test_posts_with_same_date(self):
+        """
+        Posts published at the same time must be ordered by id, so no post
+        is skipped or repeated between pages
+        """
+        Post.objects.update(pub_date=self.posts[0].pub_date)
+        TimelineEntry.objects.update(pub_date=self.posts[0].pub_date)
+        for post in self.posts:
+            post.refresh_from_db()
+
+        response = self.access_page(encode_cursor(self.posts[3]))
+
+        self.assertEqual(
+            list(response.context['post_list']),
+            [self.posts[2], self.posts[1]])
+
 
 class DeleteViewTest(TestCase):
 
@@ -190,15 +464,67 @@ class DeleteViewTest(TestCase):
 
     def test_delete_a_owned_post(self):
         """
-        Trying to delete a owned post must delete the post
+        Trying to delete a owned post must leave it out of the feed at once
+        and leave its removal to the jobs
         """
         post = self.create_post('Post text', self.first_user)
+        TimelineEntry.add_own(post)
 
         context = {'post_id': post.id}
         response = self.try_to_delete_a_post(self.first_user, context)
 
         self.assertEqual(response.status_code, 200)
+        self.assertNotIn(post, Post.get_feed_posts())
+        self.assertEqual(
+            list(TimelineEntry.get_home_posts(self.first_user)), [])
+        self.assertEqual(
+            self.try_to_delete_a_post(self.first_user, context).status_code,
+            404)
+
+        call_command('run_jobs', once=True, stdout=StringIO())
+
         self.assertNotIn(post, Post.objects.all())
+        self.assertFalse(TimelineEntry.objects.exists())
+
+    @override_settings(FEED_PURGE_CHUNK_SIZE=2)
+    def test_deleted_post_is_purged_in_chunks(self):
+        """
+        The comments and likes of a deleted post must be removed a chunk
+        per job, and the post once they are gone
+        """
+        post = self.create_post('Post text', self.first_user)
+        profile = self.first_user.profile
+        for text in ('First', 'Second', 'Third'):
+            Comment.objects.create(text=text, post=post, author=profile)
+        Like.objects.create(post=post, author=profile)
+
+        self.try_to_delete_a_post(self.first_user, {'post_id': post.id})
+        output = StringIO()
+        call_command('run_jobs', once=True, stdout=output)
+
+        self.assertIn('2 jobs succeeded', output.getvalue())
+        self.assertFalse(Post.objects.exists())
+        self.assertFalse(Comment.objects.exists())
+        self.assertFalse(Like.objects.exists())
+
+    def test_delete_a_post_with_image(self):
+        """
+        Deleting a post with an image must leave the removal of its file to
+        the jobs
+        """
+        post = self.create_post('Post text', self.first_user)
+        post.image.save('image_test.png', ContentFile(b'image'))
+        name = post.image.name
+
+        response = self.try_to_delete_a_post(
+            self.first_user, {'post_id': post.id})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(default_storage.exists(name))
+
+        call_command('run_jobs', once=True, stdout=StringIO())
+
+        self.assertFalse(default_storage.exists(name))
 
     def test_delete_a_not_owned_post_among_many_posts(self):
         """
@@ -232,11 +558,11 @@ class DeleteViewTest(TestCase):
         context = {'post_id': post_to_be_deleted.id}
         response = self.try_to_delete_a_post(self.first_user, context)
 
-        post_list = Post.objects.all()
+        post_list = Post.get_feed_posts()
 
         self.assertEqual(response.status_code, 200)
         self.assertEqual(post_list.count(), 2)
-        self.assertNotIn(post_to_be_deleted, Post.objects.all())
+        self.assertNotIn(post_to_be_deleted, post_list)
 
 
 class CommentViewTest(TestCase):
@@ -290,12 +616,123 @@ class CommentViewTest(TestCase):
         response = self.comment_post(context)
 
         created_comment = Comment.objects.get(text=text)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 1)
         self.assertEqual(len(response.redirect_chain), 1)
         self.assertEqual(Comment.objects.all().count(), 1)
         self.assertEqual(self.post.comments.all()[0], created_comment)
         self.assertEqual(created_comment.author, self.user.profile)
         self.assertEqual(text, created_comment.text)
 
+    def test_create_comment_with_ajax(self):
+        """
+        Trying to create a comment through AJAX must create it and answer
+        only its HTML, with its delete button shown to the author
+        """
+        self.client.force_login(self.user)
+        response = self.client.post(
+            reverse('feed:add_comment'),
+            {'text': 'Comment text', 'post': self.post.id},
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+        comment = Comment.objects.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'id="comment_%d"' % comment.id)
+        self.assertContains(response, 'Comment text')
+        self.assertNotContains(response, ' hide ')
+        self.assertNotContains(response, 'Post text')
+
+    def test_create_comment_without_text_with_ajax(self):
+        """
+        Trying to create a comment without text through AJAX must not create
+        it and return a 400 bad request
+        """
+        self.client.force_login(self.user)
+        response = self.client.post(
+            reverse('feed:add_comment'), {'text': '', 'post': self.post.id},
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Comment.objects.all().count(), 0)
+
+
+@override_settings(FEED_COMMENTS_PAGE_SIZE=2)
+class CommentListViewTest(TestCase):
+
+    @classmethod
+    def setUp(cls):
+        cls.user = User.objects.create(
+            username='test_user', password='password')
+        profile = Profile.objects.create(user=cls.user)
+
+        cls.post = Post.objects.create(text='Post text', author=profile)
+        cls.comments = [
+            Comment.objects.create(
+                text='Comment %d' % number, post=cls.post, author=profile)
+            for number in range(5)
+        ]
+
+    @classmethod
+    def tearDown(cls):
+        cls.post.delete()
+        cls.user.delete()
+
+    def list_comments(self, context):
+        self.client.force_login(self.user)
+        return self.client.get(reverse('feed:comments'), context)
+
+    def test_list_comments_without_cursor(self):
+        """
+        Trying to list comments without a cursor must return a 400 bad
+        request
+        """
+        response = self.list_comments({'post': self.post.id})
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_list_comments_of_nonexistent_post(self):
+        """
+        Trying to list comments of a nonexistent post must return a 404
+        not found
+        """
+        context = {'post': 0, 'cursor': encode_cursor(self.comments[4])}
+        response = self.list_comments(context)
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_list_comments_before_cursor(self):
+        """
+        Listing comments must return the comments older than the cursor, in
+        chronological order, and the cursor of the older ones
+        """
+        context = {
+            'post': self.post.id,
+            'cursor': encode_cursor(self.comments[4]),
+        }
+        response = self.list_comments(context)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            list(response.context['comment_list']), self.comments[2:4])
+        self.assertEqual(
+            response.context['next_cursor'], encode_cursor(self.comments[2]))
+        self.assertContains(response, 'comments-next')
+
+    def test_list_oldest_comments(self):
+        """
+        Listing the oldest comments must not return a cursor
+        """
+        context = {
+            'post': self.post.id,
+            'cursor': encode_cursor(self.comments[2]),
+        }
+        response = self.list_comments(context)
+
+        self.assertEqual(
+            list(response.context['comment_list']), self.comments[:2])
+        self.assertIsNone(response.context['next_cursor'])
+        self.assertNotContains(response, 'comments-next')
+
 
 class CommentDeleteViewTest(TestCase):
 
@@ -312,6 +749,7 @@ class CommentDeleteViewTest(TestCase):
         cls.post = Post.objects.create(text='Post text', author=first_profile)
         cls.comment = Comment.objects.create(
             text='Comment text', post=cls.post, author=first_profile)
+        Post.adjust_count(cls.post.id, 'comment_count', 1)
 
     @classmethod
     def tearDown(cls):
@@ -354,14 +792,42 @@ class CommentDeleteViewTest(TestCase):
         context = {'comment_id': self.comment.id}
         response = self.delete_comment(context, self.first_user)
 
+        self.post.refresh_from_db()
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(Comment.objects.all().count(), 0)
+        self.assertEqual(
+            Comment.objects.filter(deleted_at__isnull=True).count(), 0)
+        self.assertEqual(self.post.comment_count, 0)
+        self.assertEqual(
+            self.delete_comment(context, self.first_user).status_code, 404)
+
+    def test_delete_a_comment_deleted_meanwhile(self):
+        """
+        Trying to delete a comment that a concurrent request deleted after
+        it was read must not decrement its post counter again
+        """
+        def get_then_delete(queryset, **kwargs):
+            comment = queryset.get(**kwargs)
+            Comment.objects.filter(id=comment.id).update(
+                deleted_at=timezone.now())
+            return comment
+
+        context = {'comment_id': self.comment.id}
+        with patch('feed.views.get_object_or_404', get_then_delete):
+            response = self.delete_comment(context, self.first_user)
+
+        self.post.refresh_from_db()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.post.comment_count, 1)
+        self.assertFalse(
+            Event.objects.filter(kind=Event.COMMENT_DELETED).exists())
 
 
 class LikeViewTest(TestCase):
 
     @classmethod
     def setUp(cls):
+        caches['liked'].clear()
+
         cls.first_user = User.objects.create(
             username='first_user', password='password')
         first_profile = Profile.objects.create(user=cls.first_user)
@@ -382,6 +848,24 @@ class LikeViewTest(TestCase):
         self.client.force_login(user)
         return self.client.post(reverse('feed:like'), context)
 
+    def create_like(self, user):
+        Like.objects.create(author=user.profile, post=self.post)
+        Post.adjust_count(self.post.id, 'like_count', 1)
+
+    def test_like_updates_post_counter(self):
+        """
+        Liking and unliking a post must keep its like counter up to date
+        """
+        context = {'post_id': self.post.id}
+
+        self.like_post(self.first_user, context)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+
+        self.like_post(self.first_user, context)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 0)
+
     def test_like_a_nonexistent_post(self):
         """
         Trying to like a nonexistent post must return a 404 not found
@@ -413,7 +897,7 @@ class LikeViewTest(TestCase):
         Trying to unlike a post that was alrealdy liked, must return a 200 OK
         and the post's number of likes. The Like object must be deleted.
         """
-        Like.objects.create(author=self.first_user.profile, post=self.post)
+        self.create_like(self.first_user)
 
         context = {'post_id': self.post.id}
         response = self.like_post(self.first_user, context)
@@ -428,7 +912,7 @@ class LikeViewTest(TestCase):
         Trying to like a post that was not liked yet, must return a 200 OK
         and the post's number of likes. A Like object must be created.
         """
-        Like.objects.create(author=self.second_user.profile, post=self.post)
+        self.create_like(self.second_user)
 
         context = {'post_id': self.post.id}
         response = self.like_post(self.first_user, context)
@@ -446,8 +930,8 @@ class LikeViewTest(TestCase):
         Trying to unlike a post that was alrealdy liked, must return a 200 OK
         and the post's number of likes. The Like object must be deleted.
         """
-        Like.objects.create(author=self.first_user.profile, post=self.post)
-        Like.objects.create(author=self.second_user.profile, post=self.post)
+        self.create_like(self.first_user)
+        self.create_like(self.second_user)
 
         context = {'post_id': self.post.id}
         response = self.like_post(self.first_user, context)
@@ -459,3 +943,805 @@ class LikeViewTest(TestCase):
         self.assertEqual(like.post, self.post)
         self.assertEqual(self.post.likes.count(), 1)
         self.assertEqual(int(response.content), 1)
+
+
+class BatchViewTest(TestCase):
+
+    @classmethod
+    def setUp(cls):
+        caches['liked'].clear()
+
+        cls.first_user = User.objects.create(
+            username='first_user', password='password')
+        cls.first_profile = Profile.objects.create(user=cls.first_user)
+
+        cls.second_user = User.objects.create(
+            username='second_user', password='password')
+        cls.second_profile = Profile.objects.create(user=cls.second_user)
+
+        cls.post = Post.objects.create(
+            text='Post text', author=cls.first_profile)
+
+    @classmethod
+    def tearDown(cls):
+        Comment.objects.all().delete()
+        cls.post.delete()
+        cls.first_user.delete()
+        cls.second_user.delete()
+
+    def create_comments(self, author, count):
+        comments = [Comment.objects.create(
+            text='Comment text', post=self.post, author=author)
+            for _ in range(count)]
+        Post.adjust_count(self.post.id, 'comment_count', count)
+        return comments
+
+    def send_batch(self, user, actions):
+        self.client.force_login(user)
+        return self.client.post(
+            reverse('feed:batch'), json.dumps({'actions': actions}),
+            content_type='application/json')
+
+    def test_batch_with_mixed_actions(self):
+        """
+        Trying to send likes and comment deletions together must apply all
+        of them and return a result for each one, in order
+        """
+        own, = self.create_comments(self.first_profile, 1)
+        other, = self.create_comments(self.second_profile, 1)
+
+        response = self.send_batch(self.first_user, [
+            {'type': 'like', 'id': self.post.id},
+            {'type': 'delete_comment', 'id': own.id},
+            {'type': 'delete_comment', 'id': other.id},
+            {'type': 'like', 'id': 0},
+            {'type': 'delete_comment', 'id': own.id},
+        ])
+
+        results = json.loads(response.content.decode())['results']
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['status'] for result in results],
+                         [200, 200, 401, 404, 404])
+        self.assertTrue(results[0]['liked'])
+        self.assertEqual(results[0]['like_count'], 1)
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+        self.assertEqual(self.post.comment_count, 1)
+        self.assertEqual(
+            list(Comment.objects.filter(deleted_at__isnull=True)), [other])
+
+    def test_batch_toggles_likes_in_order(self):
+        """
+        Trying to like the same post twice in a batch must leave it unliked
+        """
+        response = self.send_batch(self.second_user, [
+            {'type': 'like', 'id': self.post.id},
+            {'type': 'like', 'id': self.post.id},
+        ])
+
+        results = json.loads(response.content.decode())['results']
+        self.assertEqual([result['liked'] for result in results],
+                         [True, False])
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 0)
+        self.assertFalse(Like.objects.exists())
+
+    def test_batch_with_malformed_body(self):
+        """
+        Trying to send a malformed batch must not apply anything and
+        return a 400 bad request
+        """
+        self.client.force_login(self.first_user)
+        response = self.client.post(
+            reverse('feed:batch'), 'not json',
+            content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+        for actions in ([], [{'type': 'follow', 'id': 1}],
+                        [{'type': 'like'}], [{'type': 'like', 'id': 1e30}],
+                        [{'type': 'like', 'id': 2 ** 31}],
+                        [{'type': 'like', 'id': True}],
+                        [{'type': 'like', 'id': str(self.post.id)}]):
+            response = self.send_batch(self.first_user, actions)
+            self.assertEqual(response.status_code, 400)
+
+        self.assertFalse(Like.objects.exists())
+
+    @override_settings(FEED_BATCH_MAX_ACTIONS=2)
+    def test_batch_with_too_many_actions(self):
+        """
+        Trying to send more actions than allowed must not apply any of them
+        and return a 400 bad request
+        """
+        response = self.send_batch(
+            self.first_user, [{'type': 'like', 'id': self.post.id}] * 3)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Like.objects.exists())
+
+    def test_batch_query_count_does_not_grow_with_deletions(self):
+        """
+        Trying to delete more comments in a batch must not run more queries
+        """
+        def count_queries(comments):
+            actions = [{'type': 'delete_comment', 'id': comment.id}
+                       for comment in comments]
+            self.client.force_login(self.first_user)
+            with CaptureQueriesContext(connection) as queries:
+                self.client.post(
+                    reverse('feed:batch'), json.dumps({'actions': actions}),
+                    content_type='application/json')
+            return len(queries)
+
+        one = count_queries(self.create_comments(self.first_profile, 1))
+        three = count_queries(self.create_comments(self.first_profile, 3))
+
+        self.assertEqual(one, three)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 0)
+
+
+class FollowViewTest(TestCase):
+
+    @classmethod
+    def setUp(cls):
+        caches['liked'].clear()
+
+        cls.user = User.objects.create(
+            username='first_user', password='password')
+        Profile.objects.create(user=cls.user)
+
+        other_user = User.objects.create(
+            username='second_user', password='password')
+        cls.other_profile = Profile.objects.create(user=other_user)
+
+    @classmethod
+    def tearDown(cls):
+        User.objects.all().delete()
+
+    def follow(self, profile_id):
+        self.client.force_login(self.user)
+        return self.client.post(
+            reverse('feed:follow'), {'profile_id': profile_id})
+
+    def test_follow_nonexistent_profile(self):
+        """
+        Trying to follow a nonexistent profile must return a 404 not found
+        """
+        response = self.follow(0)
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_follow_own_profile(self):
+        """
+        Trying to follow the own profile must return a 400 bad request
+        """
+        response = self.follow(self.user.profile.id)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Follow.objects.exists())
+
+    def test_follow_and_unfollow(self):
+        """
+        Following a profile must return the new state and number of
+        followers, and following it again must undo it
+        """
+        response = self.follow(self.other_profile.id)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(), {'following': True, 'followers': 1})
+
+        response = self.follow(self.other_profile.id)
+
+        self.assertEqual(
+            response.json(), {'following': False, 'followers': 0})
+
+    def test_followed_posts_on_feed(self):
+        """
+        Posts published after following a profile must be displayed on the
+        feed, and posts of not followed profiles only on explore
+        """
+        self.follow(self.other_profile.id)
+        followed_post = Post.objects.create(
+            text='Followed post', author=self.other_profile)
+        TimelineEntry.fan_out(followed_post)
+
+        stranger = User.objects.create(username='stranger')
+        stranger_post = Post.objects.create(
+            text='Stranger post', author=Profile.objects.create(user=stranger))
+        TimelineEntry.fan_out(stranger_post)
+
+        response = self.client.get(reverse('feed:feed'))
+        self.assertContains(response, 'Followed post')
+        self.assertNotContains(response, 'Stranger post')
+
+        response = self.client.get(reverse('feed:explore'))
+        self.assertContains(response, 'Followed post')
+        self.assertContains(response, 'Stranger post')
+
+
+class CardCacheTest(TestCase):
+
+    @classmethod
+    def setUp(cls):
+        cache.clear()
+        caches['liked'].clear()
+
+        cls.user = User.objects.create(username='author', password='password')
+        cls.profile = Profile.objects.create(user=cls.user)
+
+        other_user = User.objects.create(username='reader', password='password')
+        cls.other_user = other_user
+        cls.other_profile = Profile.objects.create(user=other_user)
+
+        cls.post = Post.objects.create(text='Cached post', author=cls.profile)
+
+    @classmethod
+    def tearDown(cls):
+        User.objects.all().delete()
+        cache.clear()
+
+    def access_explore(self, user):
+        self.client.force_login(user)
+        return self.client.get(reverse('feed:explore'))
+
+    def test_card_is_rendered_once(self):
+        """
+        A card already in the cache must not be rendered again, nor load
+        the comments of its post
+        """
+        self.access_explore(self.user)
+
+        with patch('feed.cards.render_to_string') as render_card:
+            response = self.access_explore(self.user)
+
+        self.assertFalse(render_card.called)
+        self.assertContains(response, 'Cached post')
+
+    def test_card_changes_after_like(self):
+        """
+        Liking a post must bump its version, so its card is rendered again
+        with the new number of likes
+        """
+        self.access_explore(self.user)
+        Like.toggle(self.post.id, self.other_profile)
+
+        response = self.access_explore(self.user)
+
+        self.assertContains(
+            response, '<span id="%d_likes">1</span>' % self.post.id)
+
+    def test_card_viewer_controls(self):
+        """
+        The same cached card must show the delete option only to the author
+        and the follow button only to the other users
+        """
+        response = self.access_explore(self.user)
+        self.assertContains(response, 'viewer-only-%d right' % self.profile.id)
+        self.assertContains(
+            response, 'viewer-not-%d hide right' % self.profile.id)
+
+        response = self.access_explore(self.other_user)
+        self.assertContains(
+            response, 'viewer-only-%d hide right' % self.profile.id)
+        self.assertContains(response, 'viewer-not-%d right' % self.profile.id)
+
+    def test_card_viewer_like_and_csrf(self):
+        """
+        The like state and the CSRF token of the viewer must be filled in
+        the cached card, and the markers must never reach the page
+        """
+        Like.toggle(self.post.id, self.other_profile)
+        self.access_explore(self.user)
+
+        response = self.access_explore(self.other_user)
+
+        self.assertContains(response, cards.LIKED_CLASS)
+        self.assertContains(response, 'csrfmiddlewaretoken')
+        for marker in cards.MARKERS.values():
+            self.assertNotContains(response, marker)
+
+    def test_markers_in_post_text(self):
+        """
+        A post whose text looks like a marker must be displayed escaped,
+        never replaced by the viewer state
+        """
+        Post.objects.create(text='<like-class>', author=self.profile)
+
+        response = self.access_explore(self.user)
+
+        self.assertContains(response, '&lt;like-class&gt;')
+
+    def test_viewer_classes_in_post_text(self):
+        """
+        A post or comment whose text holds the classes of the viewer
+        controls must be displayed as written
+        """
+        text = 'viewer-only-%d hide viewer-not-%d <viewer-not-%d>' % (
+            (self.profile.id,) * 3)
+        post = Post.objects.create(text=text, author=self.profile)
+        Comment.objects.create(post=post, text=text, author=self.profile)
+        Post.adjust_count(post.id, 'comment_count', 1)
+
+        response = self.access_explore(self.user)
+
+        escaped = text.replace('<', '&lt;').replace('>', '&gt;')
+        self.assertContains(response, escaped, count=2)
+
+
+@override_settings(FEED_API_BATCH_SIZE=2)
+class FeedApiViewTest(TestCase):
+
+    @classmethod
+    def setUp(cls):
+        caches['liked'].clear()
+
+        cls.user = User.objects.create(username='reader', password='password')
+        cls.profile = Profile.objects.create(user=cls.user)
+
+        cls.posts = []
+        for number in range(5):
+            post = Post.objects.create(
+                text='Post %d' % number, author=cls.profile)
+            TimelineEntry.fan_out(post)
+            cls.posts.append(post)
+
+    @classmethod
+    def tearDown(cls):
+        User.objects.all().delete()
+
+    def read_feed(self, **params):
+        self.client.force_login(self.user)
+        return self.client.get(reverse('feed:api_feed'), params)
+
+    @staticmethod
+    def read_lines(response):
+        content = b''.join(response.streaming_content).decode()
+        return [json.loads(line) for line in content.splitlines()]
+
+    def test_stream_posts(self):
+        """
+        The API must stream the posts of the feed, newest first, one JSON
+        object per line, across several batches
+        """
+        response = self.read_feed(limit=5)
+        lines = self.read_lines(response)
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(
+            [line['id'] for line in lines],
+            [post.id for post in reversed(self.posts)])
+        self.assertEqual(lines[0]['author']['id'], self.profile.id)
+
+    def test_stream_after_cursor(self):
+        """
+        The cursor of a post must resume the stream right after it
+        """
+        lines = self.read_lines(self.read_feed(limit=2))
+        lines = self.read_lines(
+            self.read_feed(limit=10, cursor=lines[-1]['cursor']))
+
+        self.assertEqual(
+            [line['id'] for line in lines],
+            [post.id for post in reversed(self.posts[:3])])
+
+    def test_stream_selected_fields(self):
+        """
+        Only the fields asked for must be streamed
+        """
+        Like.toggle(self.posts[4].id, self.profile)
+
+        lines = self.read_lines(self.read_feed(limit=1, fields='id,liked'))
+
+        self.assertEqual(lines, [{'id': self.posts[4].id, 'liked': True}])
+
+    def test_invalid_parameters(self):
+        """
+        Trying to read with unknown fields, a bad cursor or a limit out of
+        range must return a 400 bad request
+        """
+        for params in [{'fields': 'id,password'}, {'cursor': 'invalid'},
+                       {'limit': 0}, {'limit': 'ten'}, {'limit': 100000}]:
+            self.assertEqual(self.read_feed(**params).status_code, 400)
+
+    def test_explore(self):
+        """
+        The explore API must stream the posts of every profile
+        """
+        other = User.objects.create(username='other')
+        post = Post.objects.create(
+            text='Other post', author=Profile.objects.create(user=other))
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('feed:api_explore'), {'limit': 1})
+
+        self.assertEqual(
+            [line['id'] for line in self.read_lines(response)], [post.id])
+
+
+class ConditionalFeedTest(TestCase):
+
+    @classmethod
+    def setUp(cls):
+        caches['liked'].clear()
+
+        cls.user = User.objects.create(username='reader', password='password')
+        cls.profile = Profile.objects.create(user=cls.user)
+        cls.post = Post.objects.create(text='Post text', author=cls.profile)
+        TimelineEntry.fan_out(cls.post)
+
+    @classmethod
+    def tearDown(cls):
+        User.objects.all().delete()
+
+    def access_feed(self, **headers):
+        return self.client.get(reverse('feed:feed'), **headers)
+
+    def revalidate(self, response):
+        return self.access_feed(HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_not_modified(self):
+        """
+        Reloading the feed with its ETag must return a 304 not modified
+        without loading any post
+        """
+        self.client.force_login(self.user)
+        response = self.access_feed()
+
+        with CaptureQueriesContext(connection) as queries:
+            revalidated = self.revalidate(response)
+
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertFalse(
+            [query for query in queries if 'feed_post' in query['sql']])
+
+    def test_modified_after_like(self):
+        """
+        Liking a post must change the ETag of the feed
+        """
+        self.client.force_login(self.user)
+        response = self.access_feed()
+
+        self.client.post(reverse('feed:like'), {'post_id': self.post.id})
+
+        self.assertEqual(self.revalidate(response).status_code, 200)
+
+    def test_other_viewer(self):
+        """
+        The ETag of a viewer must not validate the feed of another one
+        """
+        self.client.force_login(self.user)
+        response = self.access_feed()
+
+        other = User.objects.create(username='other')
+        Profile.objects.create(user=other)
+        self.client.force_login(other)
+
+        self.assertEqual(self.revalidate(response).status_code, 200)
+
+    def test_last_modified(self):
+        """
+        Once the second of the last change has passed, the feed must be
+        validated by its Last-Modified date as well
+        """
+        self.client.force_login(self.user)
+        User.objects.filter(id=self.user.id).update(
+            last_login=timezone.now() - timedelta(minutes=1))
+        cache.set(MODIFIED_KEY, time.time() - 60)
+
+        response = self.access_feed()
+        revalidated = self.access_feed(
+            HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertIn('private', response['Cache-Control'])
+
+    def test_no_last_modified_within_the_second(self):
+        """
+        While a change could still happen in the second of the last one,
+        the feed must not be validated by date
+        """
+        self.client.force_login(self.user)
+        bump_feed_version()
+
+        self.assertFalse(self.access_feed().has_header('Last-Modified'))
+
+
+@override_settings(FEED_EVENTS_BROKER='feed.events.LocalBroker',
+                   FEED_EVENTS_STREAM_TIMEOUT=0, FEED_SYNC_DELAY=0)
+class EventStreamViewTest(TestCase):
+
+    @classmethod
+    def setUp(cls):
+        caches['liked'].clear()
+
+        cls.first_user = User.objects.create(
+            username='first_user', password='password')
+        cls.first_profile = Profile.objects.create(user=cls.first_user)
+
+        cls.second_user = User.objects.create(
+            username='second_user', password='password')
+        cls.second_profile = Profile.objects.create(user=cls.second_user)
+
+        cls.post = Post.objects.create(
+            text='Post text', author=cls.first_profile)
+
+    @classmethod
+    def tearDown(cls):
+        cls.post.delete()
+        cls.first_user.delete()
+        cls.second_user.delete()
+
+    def read_stream(self, user, **params):
+        self.client.force_login(user)
+        response = self.client.get(
+            reverse('feed:events'),
+            {key: value for key, value in params.items() if key != 'header'},
+            **params.get('header', {}))
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_views_publish_events(self):
+        """
+        Liking, commenting and deleting must append their events to the log
+        """
+        self.client.force_login(self.first_user)
+        self.client.post(reverse('feed:like'), {'post_id': self.post.id})
+        self.client.post(reverse('feed:add_comment'),
+                         {'text': 'Comment text', 'post': self.post.id})
+        comment = Comment.objects.get()
+        self.client.post(reverse('feed:delete_comment'),
+                         {'comment_id': comment.id})
+        self.client.post(reverse('feed:delete'), {'post_id': self.post.id})
+
+        events = Event.objects.order_by('id')
+        self.assertEqual(
+            [(event.kind, event.post_id, event.comment_id, event.count)
+             for event in events],
+            [(Event.LIKE, self.post.id, None, 1),
+             (Event.COMMENT, self.post.id, comment.id, None),
+             (Event.COMMENT_DELETED, self.post.id, comment.id, None),
+             (Event.POST_DELETED, self.post.id, None, None)])
+
+    def test_stream_only_sends_events_of_the_client(self):
+        """
+        The stream must send the changes to the posts the client shows and
+        the new posts of the authors it follows, and nothing else
+        """
+        Follow.toggle(self.second_profile, self.first_profile.id)
+        other_post = Post.objects.create(
+            text='Other text', author=self.second_profile)
+
+        like = Event.objects.create(
+            kind=Event.LIKE, post_id=self.post.id, count=3)
+        Event.objects.create(kind=Event.LIKE, post_id=other_post.id, count=1)
+        new_post = Event.objects.create(
+            kind=Event.POST, post_id=self.post.id,
+            author_id=self.first_profile.id)
+        Event.objects.create(
+            kind=Event.POST, post_id=other_post.id, author_id=0)
+
+        response, content = self.read_stream(
+            self.second_user, posts=str(self.post.id), last_id=0)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(content, (
+            'retry: 1000\n\n'
+            'id: %d\nevent: like\ndata: {"count":3,"post":%d}\n\n'
+            'id: %d\nevent: post\ndata: {"author":%d,"post":%d}\n\n') % (
+            like.id, self.post.id, new_post.id, self.first_profile.id,
+            self.post.id))
+
+    def test_stream_resumes_after_last_event_id(self):
+        """
+        A reconnecting browser must only receive the events after the one
+        in its Last-Event-ID header
+        """
+        first = Event.objects.create(
+            kind=Event.LIKE, post_id=self.post.id, count=1)
+        second = Event.objects.create(
+            kind=Event.LIKE, post_id=self.post.id, count=2)
+
+        _, content = self.read_stream(
+            self.first_user, posts=str(self.post.id),
+            header={'HTTP_LAST_EVENT_ID': str(first.id)})
+
+        self.assertNotIn('id: %d\n' % first.id, content)
+        self.assertIn('id: %d\n' % second.id, content)
+
+    def test_stream_starts_at_the_newest_event(self):
+        """
+        A new stream must not send the events published before it opened
+        """
+        Event.objects.create(kind=Event.LIKE, post_id=self.post.id, count=1)
+
+        _, content = self.read_stream(
+            self.first_user, posts=str(self.post.id))
+
+        self.assertEqual(content, 'retry: 1000\n\n')
+
+    @override_settings(FEED_EVENTS_STREAM_TIMEOUT=0.2,
+                       FEED_EVENTS_HEARTBEAT=0.05)
+    def test_idle_stream_sends_heartbeats(self):
+        """
+        An idle stream must keep sending the last event id until it times
+        out
+        """
+        event = Event.objects.create(
+            kind=Event.LIKE, post_id=0, count=1)
+
+        _, content = self.read_stream(
+            self.first_user, posts=str(self.post.id), last_id=0)
+
+        self.assertNotIn('event:', content)
+        self.assertIn('id: %d\n\n' % event.id, content)
+
+    @override_settings(FEED_EVENTS_STREAM_TIMEOUT=0.2,
+                       FEED_EVENTS_HEARTBEAT=0.02)
+    def test_idle_stream_runs_no_queries(self):
+        """
+        An idle stream must run the queries of its first read only, however
+        many heartbeats it sends
+        """
+        Event.objects.create(kind=Event.LIKE, post_id=0, count=1)
+        self.client.force_login(self.first_user)
+        response = self.client.get(
+            reverse('feed:events'), {'posts': self.post.id, 'last_id': 0})
+
+        with CaptureQueriesContext(connection) as queries:
+            content = b''.join(response.streaming_content).decode()
+
+        self.assertGreater(content.count('\n\n'), 3)
+        self.assertEqual(len(queries), 2)
+
+    @override_settings(FEED_SYNC_DELAY=60)
+    def test_stream_leaves_unsettled_events(self):
+        """
+        The events newer than FEED_SYNC_DELAY must not be sent yet, so one
+        committed late by a slower transaction is not skipped
+        """
+        Event.objects.create(kind=Event.LIKE, post_id=self.post.id, count=1)
+
+        _, content = self.read_stream(
+            self.first_user, posts=str(self.post.id), last_id=0)
+
+        self.assertEqual(content, 'retry: 1000\n\n')
+
+    @override_settings(FEED_EVENTS_MAX_POSTS=2)
+    def test_stream_with_invalid_parameters(self):
+        """
+        Trying to open a stream with malformed or too many posts must
+        return a 400 bad request
+        """
+        self.client.force_login(self.first_user)
+
+        for params in ({'posts': 'a,b'}, {'posts': '1,2,3'},
+                       {'posts': '1', 'last_id': 'x'}):
+            response = self.client.get(reverse('feed:events'), params)
+            self.assertEqual(response.status_code, 400)
+
+
+@override_settings(FEED_SYNC_DELAY=0)
+class SyncApiViewTest(TestCase):
+
+    @classmethod
+    def setUp(cls):
+        caches['liked'].clear()
+
+        cls.first_user = User.objects.create(
+            username='first_user', password='password')
+        cls.first_profile = Profile.objects.create(user=cls.first_user)
+
+        cls.second_user = User.objects.create(
+            username='second_user', password='password')
+        cls.second_profile = Profile.objects.create(user=cls.second_user)
+
+        Follow.toggle(cls.second_profile, cls.first_profile.id)
+        cls.post = Post.objects.create(
+            text='Post text', author=cls.first_profile)
+
+    @classmethod
+    def tearDown(cls):
+        Post.objects.all().delete()
+        cls.first_user.delete()
+        cls.second_user.delete()
+
+    def sync(self, user, token=None, **params):
+        self.client.force_login(user)
+        if token is not None:
+            params['token'] = token
+        return self.client.get(reverse('feed:api_sync'), params)
+
+    def start(self, user):
+        return json.loads(self.sync(user).content.decode())['token']
+
+    def test_sync_returns_only_the_changes(self):
+        """
+        Syncing must return the new posts, the tombstones and the counters
+        of the changed posts of the followed authors since the token
+        """
+        token = self.start(self.second_user)
+
+        self.client.force_login(self.first_user)
+        self.client.post(reverse('feed:like'), {'post_id': self.post.id})
+        self.client.post(reverse('feed:add_comment'),
+                         {'text': 'First', 'post': self.post.id})
+        self.client.post(reverse('feed:add_comment'),
+                         {'text': 'Second', 'post': self.post.id})
+        comment = Comment.objects.get(text='First')
+        self.client.post(reverse('feed:delete_comment'),
+                         {'comment_id': comment.id})
+        self.client.post(reverse('feed:feed'), {'text': 'New post'})
+        self.client.post(reverse('feed:feed'), {'text': 'Gone post'})
+        gone = Post.objects.get(text='Gone post')
+        self.client.post(reverse('feed:delete'), {'post_id': gone.id})
+
+        response = self.sync(self.second_user, token, fields='id,text')
+        changes = json.loads(response.content.decode())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(changes['posts'], [{
+            'id': Post.objects.get(text='New post').id, 'text': 'New post'}])
+        self.assertEqual(changes['deleted_posts'], [gone.id])
+        self.assertEqual(changes['deleted_comments'], [comment.id])
+        self.assertEqual(changes['counts'], {
+            str(self.post.id): {'like_count': 1, 'comment_count': 1}})
+        self.assertFalse(changes['more'])
+
+        changes = json.loads(
+            self.sync(self.second_user, changes['token']).content.decode())
+        self.assertEqual(
+            (changes['posts'], changes['deleted_posts'], changes['counts']),
+            ([], [], {}))
+
+    def test_sync_skips_authors_not_followed(self):
+        """
+        Syncing must not return the changes to posts of authors the user does
+        not follow
+        """
+        token = self.start(self.first_user)
+
+        other_post = Post.objects.create(
+            text='Other text', author=self.second_profile)
+        self.client.force_login(self.second_user)
+        self.client.post(reverse('feed:like'), {'post_id': other_post.id})
+
+        changes = json.loads(
+            self.sync(self.first_user, token).content.decode())
+
+        self.assertEqual(changes['counts'], {})
+
+    @override_settings(FEED_SYNC_BATCH_SIZE=2)
+    def test_sync_in_several_requests(self):
+        """
+        When more events than a request reads changed, syncing must say so
+        and continue from the returned token
+        """
+        token = self.start(self.second_user)
+
+        self.client.force_login(self.first_user)
+        for _ in range(3):
+            self.client.post(reverse('feed:like'), {'post_id': self.post.id})
+
+        first = json.loads(self.sync(self.second_user, token).content.decode())
+        second = json.loads(
+            self.sync(self.second_user, first['token']).content.decode())
+
+        self.assertTrue(first['more'])
+        self.assertFalse(second['more'])
+        self.assertEqual(second['counts'], {
+            str(self.post.id): {'like_count': 1, 'comment_count': 0}})
+
+    def test_sync_with_invalid_or_expired_token(self):
+        """
+        Trying to sync with a malformed token must return a 400 bad request
+        and with a token older than the events kept a 410 gone
+        """
+        expired = encode_token(0, time.time() - 60 * 60 * 24 * 30)
+
+        self.assertEqual(
+            self.sync(self.first_user, 'invalid').status_code, 400)
+        self.assertEqual(self.sync(self.first_user, expired).status_code, 410)
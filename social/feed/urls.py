@@ -5,14 +5,28 @@ from django.conf.urls import url
 from django.conf.urls.static import static
 
 from .views import FeedView, PostDeleteView, CommentView, CommentDeleteView
-from .views import LikeView
+from .views import LikeView, FeedPageView, CommentListView
+from .views import ExploreView, ExplorePageView, FollowView
+from .views import FeedApiView, ExploreApiView, BatchView
+from .views import CommentDetailView, EventStreamView, SyncApiView
 
 app_name = 'feed'
 urlpatterns = [
     url(r'^$', FeedView.as_view(), name='feed'),
+    url(r'^page/$', FeedPageView.as_view(), name='page'),
+    url(r'^explore/$', ExploreView.as_view(), name='explore'),
+    url(r'^explore/page/$', ExplorePageView.as_view(), name='explore_page'),
     url(r'^delete_post/$', PostDeleteView.as_view(), name='delete'),
     url(r'^add_comment/$', CommentView.as_view(), name='add_comment'),
+    url(r'^comments/$', CommentListView.as_view(), name='comments'),
+    url(r'^comment/$', CommentDetailView.as_view(), name='comment'),
     url(r'^delete_comment/$',
         CommentDeleteView.as_view(), name='delete_comment'),
     url(r'^like/$', LikeView.as_view(), name='like'),
+    url(r'^follow/$', FollowView.as_view(), name='follow'),
+    url(r'^batch/$', BatchView.as_view(), name='batch'),
+    url(r'^events/$', EventStreamView.as_view(), name='events'),
+    url(r'^api/feed/$', FeedApiView.as_view(), name='api_feed'),
+    url(r'^api/explore/$', ExploreApiView.as_view(), name='api_explore'),
+    url(r'^api/sync/$', SyncApiView.as_view(), name='api_sync'),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -1,26 +1,101 @@
 # -*- coding: utf-8 -*-
 
-from django.core.exceptions import ObjectDoesNotExist
+import json
+from collections import defaultdict
+
 from django.core.urlresolvers import reverse
 
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponse
+from django.db import transaction
+from django.http import (
+    Http404, HttpResponse, JsonResponse, StreamingHttpResponse)
 from django.shortcuts import render, redirect, get_object_or_404
+from django.template.loader import render_to_string
+from django.utils import timezone
 from django.utils.decorators import method_decorator
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 from django.views.generic import View
 
+from authentication.models import Profile
+from replicas.router import replica_condition, use_replica
+
+from .api import parse_fields, stream_posts
+from .cards import overlay_viewer, render_cards
+from .conditional import bump_feed_version, feed_etag, feed_last_modified
+from .events import make_filter, publish, stream_events
 from .forms import PostForm, CommentForm
-from .models import Post, Comment, Like
+from .models import Post, Comment, Like, Follow, TimelineEntry, Event
+from .models import liked_posts
+from .pagination import before_cursor, decode_cursor, get_page
+from .shards import MAX_ID, for_ids, shard_for_id, with_authors
+from .sync import (
+    ExpiredToken, decode_token, get_changes, get_settled_last_id,
+    get_start_token)
+from .tasks import fan_out_post, make_image_variants, purge_post
+
+
+def get_post_or_404(post_id):
+    """
+    Returns the post from the database holding it, unless it was deleted
+    """
+    posts = Post.objects.using(shard_for_id(post_id))
+
+    return get_object_or_404(posts.filter(deleted_at__isnull=True), id=post_id)
+
+
+class FeedPageMixin(object):
+    page_url = 'feed:page'
+
+    def get_posts(self, user, cursor, limit):
+        return TimelineEntry.get_home_posts(user, cursor, limit)
+
+    def get_feed_page(self, request, cursor=None):
+        size = settings.FEED_PAGE_SIZE
+        posts = self.get_posts(request.user, cursor, size + 1)
+        post_list, next_cursor = get_page(posts, size)
+        Follow.attach_followed(post_list, request.user.profile)
+        render_cards(request, post_list)
+
+        return {
+            'post_list': post_list,
+            'next_cursor': next_cursor,
+            'page_url': self.page_url,
+        }
+
+
+class ExploreMixin(FeedPageMixin):
+    page_url = 'feed:explore_page'
 
+    def get_posts(self, user, cursor, limit):
+        return Post.get_posts_with_likes(user, cursor, limit)
 
-class FeedView(View):
+
+class FeedView(FeedPageMixin, View):
     template_name = 'feed/feed.html'
+    post_template_name = 'feed/post.html'
 
     @method_decorator(login_required)
+    @method_decorator(cache_control(private=True, no_cache=True))
+    @method_decorator(replica_condition(
+        etag_func=feed_etag, last_modified_func=feed_last_modified))
+    @method_decorator(use_replica())
     def get(self, request):
-        post_list = Post.get_posts_with_likes(request.user)
+        context = self.get_feed_page(request)
+
+        return render(request, self.template_name, context)
+
+    def render_post(self, request, post):
+        """
+        Returns the card of a post just published by the viewer, for the
+        page to insert it without reloading the feed
+        """
+        post.liked = False
+        post.followed = False
+        render_cards(request, [post])
 
-        return render(request, self.template_name, {'post_list': post_list})
+        return render(request, self.post_template_name, {'post': post})
 
     @method_decorator(login_required)
     def post(self, request):
@@ -30,28 +105,146 @@ class FeedView(View):
             post = Post()
             post.text = form.cleaned_data['text']
             post.image = form.cleaned_data['image']
+            if post.image:
+                # Read by the form already, the file is not opened again
+                post.image_width, post.image_height = (
+                    form.cleaned_data['image'].image.size)
             post.author = request.user.profile
 
-            post.save()
+            # The followers' timelines and the image variants are written by
+            # the workers, so publishing does not wait for them
+            with transaction.atomic():
+                post.save()
+                TimelineEntry.add_own(post)
+                publish(Event(kind=Event.POST, post_id=post.id,
+                              author_id=post.author_id))
+                fan_out_post.delay(post_id=post.id)
+
+                if post.image:
+                    make_image_variants.delay(post_id=post.id)
+
+            bump_feed_version()
+
+            if request.is_ajax():
+                return self.render_post(request, post)
+        elif request.is_ajax():
+            return HttpResponse(status=400)
 
         return redirect(reverse('feed:feed'))
 
 
+class FeedPageView(FeedPageMixin, View):
+    template_name = 'feed/post_list.html'
+
+    @method_decorator(login_required)
+    def get(self, request):
+        try:
+            cursor = decode_cursor(request.GET['cursor'])
+        except (KeyError, ValueError):
+            return HttpResponse(status=400)
+
+        context = self.get_feed_page(request, cursor)
+
+        return render(request, self.template_name, context)
+
+
+class ExploreView(ExploreMixin, View):
+    template_name = 'feed/feed.html'
+
+    @method_decorator(login_required)
+    @method_decorator(cache_control(private=True, no_cache=True))
+    @method_decorator(condition(
+        etag_func=feed_etag, last_modified_func=feed_last_modified))
+    def get(self, request):
+        context = self.get_feed_page(request)
+
+        return render(request, self.template_name, context)
+
+
+class ExplorePageView(ExploreMixin, FeedPageView):
+    pass
+
+
+class FeedApiView(FeedPageMixin, View):
+
+    @method_decorator(login_required)
+    def get(self, request):
+        try:
+            cursor = request.GET.get('cursor')
+            cursor = decode_cursor(cursor) if cursor else None
+            limit = int(request.GET.get('limit', settings.FEED_PAGE_SIZE))
+            fields = parse_fields(request.GET.get('fields'))
+        except ValueError:
+            return HttpResponse(status=400)
+
+        if not 0 < limit <= settings.FEED_API_MAX_LIMIT:
+            return HttpResponse(status=400)
+
+        lines = stream_posts(
+            self.get_posts, request.user, cursor, limit, fields,
+            settings.FEED_API_BATCH_SIZE)
+
+        return StreamingHttpResponse(
+            lines, content_type='application/x-ndjson')
+
+
+class ExploreApiView(ExploreMixin, FeedApiView):
+    pass
+
+
+class SyncApiView(View):
+    """
+    Answers what changed in the home feed since the sync token. Without a
+    token, answers the token to start from after reading the whole feed
+    """
+
+    @method_decorator(login_required)
+    def get(self, request):
+        token = request.GET.get('token')
+        if not token:
+            return JsonResponse({'token': get_start_token()})
+
+        try:
+            last_id, _ = decode_token(token)
+            fields = parse_fields(request.GET.get('fields'))
+        except ExpiredToken:
+            return HttpResponse(status=410)
+        except ValueError:
+            return HttpResponse(status=400)
+
+        return JsonResponse(get_changes(request.user, last_id, fields))
+
+
 class PostDeleteView(View):
 
     @method_decorator(login_required)
     def post(self, request):
         post_id = request.POST['post_id']
-        post = get_object_or_404(Post, id=post_id)
+        post = get_post_or_404(post_id)
 
         if post.author.user == request.user:
-            post.delete()
+            # Only marked here, its comments, likes and files are removed
+            # by the job
+            with transaction.atomic():
+                # Zero when a concurrent request deleted it first
+                marked = Post.objects.using(post._state.db).filter(
+                    id=post.id, deleted_at__isnull=True).update(
+                    deleted_at=timezone.now())
+
+                if marked:
+                    publish(Event(kind=Event.POST_DELETED, post_id=post.id,
+                                  author_id=post.author_id))
+                    purge_post.delay(post_id=post.id)
+
+            if marked:
+                bump_feed_version()
             return HttpResponse(status=200)
 
         return HttpResponse(status=401)
 
 
 class CommentView(View):
+    template_name = 'feed/comment.html'
 
     @method_decorator(login_required)
     def post(self, request):
@@ -59,24 +252,113 @@ class CommentView(View):
 
         if form.is_valid():
             author = request.user.profile
-            post = get_object_or_404(Post, id=form.cleaned_data['post'])
+            post_id = form.cleaned_data['post']
+            post = get_post_or_404(post_id)
             text = form.cleaned_data['text']
 
-            Comment.objects.create(text=text, author=author, post=post)
+            with transaction.atomic(using=post._state.db):
+                # Created through the post, on the same database
+                comment = post.comments.create(text=text, author=author)
+                Post.adjust_count(post.id, 'comment_count', 1)
+                publish(Event(kind=Event.COMMENT, post_id=post.id,
+                              comment_id=comment.id,
+                              author_id=post.author_id))
+
+            bump_feed_version()
+
+            # Only the new comment is rendered, the page inserts it in place
+            if request.is_ajax():
+                html = render_to_string(
+                    self.template_name, {'comment': comment}, request=request)
+                return HttpResponse(overlay_viewer(html, request))
+        elif request.is_ajax():
+            return HttpResponse(status=400)
 
         return redirect(reverse('feed:feed'))
 
 
+class CommentListView(View):
+    template_name = 'feed/comment_list.html'
+
+    @method_decorator(login_required)
+    def get(self, request):
+        try:
+            post_id = int(request.GET['post'])
+            cursor = decode_cursor(request.GET['cursor'])
+        except (KeyError, ValueError):
+            return HttpResponse(status=400)
+
+        post = get_post_or_404(post_id)
+
+        size = settings.FEED_COMMENTS_PAGE_SIZE
+        comments = post.comments.filter(deleted_at__isnull=True)
+        comments = comments.select_related('author__user')
+        comments = before_cursor(comments.order_by('-pub_date', '-id'), cursor)
+        comment_list, next_cursor = get_page(
+            with_authors([comments[:size + 1]]), size)
+
+        context = {
+            'post': post,
+            'comment_list': comment_list[::-1],
+            'next_cursor': next_cursor,
+        }
+        html = render_to_string(
+            self.template_name, context, request=request)
+
+        return HttpResponse(overlay_viewer(html, request))
+
+
+class CommentDetailView(View):
+    template_name = 'feed/comment.html'
+
+    @method_decorator(login_required)
+    def get(self, request):
+        try:
+            comment_id = int(request.GET['id'])
+        except (KeyError, ValueError):
+            return HttpResponse(status=400)
+
+        comments = Comment.objects.using(shard_for_id(comment_id))
+        comments = comments.select_related('author__user').filter(
+            id=comment_id, deleted_at__isnull=True)
+        comments = with_authors([comments])
+        if not comments:
+            raise Http404('No comment with the id %d' % comment_id)
+
+        html = render_to_string(
+            self.template_name, {'comment': comments[0]}, request=request)
+
+        return HttpResponse(overlay_viewer(html, request))
+
+
 class CommentDeleteView(View):
 
     @method_decorator(login_required)
     def post(self, request):
         comment_id = request.POST['comment_id']
 
-        comment = get_object_or_404(Comment, id=comment_id)
+        comments = Comment.objects.using(shard_for_id(comment_id))
+        comment = get_object_or_404(
+            comments.select_related('post').filter(deleted_at__isnull=True),
+            id=comment_id)
 
         if comment.author == request.user.profile:
-            comment.delete()
+            with transaction.atomic(using=comment._state.db):
+                # Zero when a concurrent request deleted it first, so the
+                # counter is decremented once
+                marked = Comment.objects.using(comment._state.db).filter(
+                    id=comment.id, deleted_at__isnull=True).update(
+                    deleted_at=timezone.now())
+
+                if marked:
+                    publish(Event(kind=Event.COMMENT_DELETED,
+                                  post_id=comment.post_id,
+                                  comment_id=comment.id,
+                                  author_id=comment.post.author_id))
+                    Post.adjust_count(comment.post_id, 'comment_count', -1)
+
+            if marked:
+                bump_feed_version()
             return HttpResponse(status=200)
 
         return HttpResponse(status=401)
@@ -87,12 +369,200 @@ class LikeView(View):
     @method_decorator(login_required)
     def post(self, request):
         post_id = request.POST['post_id']
-        post = get_object_or_404(Post, id=post_id)
+        post = get_post_or_404(post_id)
+
+        like_count = Like.toggle(post.id, request.user.profile)[1]
+        publish(Event(kind=Event.LIKE, post_id=post.id,
+                      author_id=post.author_id, count=like_count))
+        liked_posts.record(request.user.profile.id, post.id)
+        bump_feed_version()
+
+        return HttpResponse(like_count, status=200)
+
+
+class BatchView(View):
+    """
+    Applies a list of like toggles and comment deletions in one transaction,
+    answering a result for each of them in the same order
+    """
+    ACTIONS = ('like', 'delete_comment')
+
+    @staticmethod
+    def parse_actions(body):
+        """
+        Returns the (type, id) pairs of the actions in the JSON body. Raises
+        ValueError when it is malformed
+        """
+        try:
+            actions = json.loads(body.decode())['actions']
+            actions = [(action['type'], action['id']) for action in actions]
+        except (AttributeError, KeyError, TypeError, UnicodeError):
+            raise ValueError('Malformed actions')
+
+        # JSON integers within the id columns; bool is an int in Python
+        if any(isinstance(object_id, bool) or
+               not isinstance(object_id, int) or
+               not 0 <= object_id <= MAX_ID for _, object_id in actions):
+            raise ValueError('Invalid id')
+
+        if not 0 < len(actions) <= settings.FEED_BATCH_MAX_ACTIONS:
+            raise ValueError('Wrong number of actions: %d' % len(actions))
+
+        if any(kind not in BatchView.ACTIONS for kind, _ in actions):
+            raise ValueError('Unknown action')
+
+        return actions
+
+    @staticmethod
+    def delete_comments(comments, now, counts, events):
+        """
+        Marks the comments deleted, one UPDATE per post. Adds to counts the
+        number of comments each UPDATE marked, leaving out the ones a
+        concurrent request deleted first, and their events to events
+        """
+        by_post = defaultdict(list)
+        # Locked, so a concurrent deletion of the same comments waits and
+        # then finds them deleted
+        rows = comments.select_for_update().values_list(
+            'id', 'post_id', 'post__author_id')
+
+        for comment_id, post_id, author_id in rows:
+            by_post[post_id, author_id].append(comment_id)
+
+        for (post_id, author_id), comment_ids in by_post.items():
+            marked = comments.filter(id__in=comment_ids).update(
+                deleted_at=now)
+            counts[post_id] += marked
+
+            if marked:
+                events.extend(
+                    Event(kind=Event.COMMENT_DELETED, post_id=post_id,
+                          comment_id=comment_id, author_id=author_id)
+                    for comment_id in comment_ids)
 
+    @method_decorator(login_required)
+    def post(self, request):
         try:
-            like = Like.objects.get(post=post, author=request.user.profile)
-            like.delete()
-        except ObjectDoesNotExist:
-            Like.objects.create(post=post, author=request.user.profile)
+            actions = self.parse_actions(request.body)
+        except ValueError:
+            return HttpResponse(status=400)
+
+        profile = request.user.profile
+        post_ids = set(i for kind, i in actions if kind == 'like')
+        comment_ids = set(i for kind, i in actions if kind == 'delete_comment')
+
+        # The authors of the posts, which also tell which posts exist
+        posts = dict(
+            row for shard in for_ids(
+                Post.objects.filter(deleted_at__isnull=True), post_ids)
+            for row in shard.values_list('id', 'author_id'))
+        # The comments and their authors, to authorize every deletion at once
+        comments = dict(
+            row for shard in for_ids(
+                Comment.objects.filter(deleted_at__isnull=True), comment_ids)
+            for row in shard.values_list('id', 'author_id'))
+
+        results = []
+        liked = []
+        deleted = set()
+        events = []
+
+        with transaction.atomic():
+            for kind, object_id in actions:
+                if kind == 'like':
+                    if object_id not in posts:
+                        results.append({'status': 404})
+                        continue
+
+                    state, like_count = Like.toggle(object_id, profile)
+                    liked.append(object_id)
+                    events.append(Event(
+                        kind=Event.LIKE, post_id=object_id,
+                        author_id=posts[object_id], count=like_count))
+                    results.append({
+                        'status': 200, 'liked': state,
+                        'like_count': like_count,
+                    })
+                elif object_id not in comments or object_id in deleted:
+                    results.append({'status': 404})
+                elif comments[object_id] != profile.id:
+                    results.append({'status': 401})
+                else:
+                    deleted.add(object_id)
+                    results.append({'status': 200})
+
+            counts = defaultdict(int)
+            now = timezone.now()
+            for deleted_comments in for_ids(
+                    Comment.objects.filter(deleted_at__isnull=True), deleted):
+                with transaction.atomic(using=deleted_comments.db):
+                    self.delete_comments(deleted_comments, now, counts, events)
+
+            for post_id, count in counts.items():
+                if count:
+                    Post.adjust_count(post_id, 'comment_count', -count)
+
+            if events:
+                publish(*events)
+
+        for post_id in liked:
+            liked_posts.record(profile.id, post_id)
+
+        bump_feed_version()
+
+        return JsonResponse({'results': results})
+
+
+class FollowView(View):
 
-        return HttpResponse(post.likes.count(), status=200)
+    @method_decorator(login_required)
+    def post(self, request):
+        profile_id = request.POST['profile_id']
+        followee = get_object_or_404(Profile, id=profile_id)
+
+        if followee == request.user.profile:
+            return HttpResponse(status=400)
+
+        following, follower_count = Follow.toggle(
+            request.user.profile, followee.id)
+        bump_feed_version()
+
+        return JsonResponse(
+            {'following': following, 'followers': follower_count})
+
+
+class EventStreamView(View):
+    """
+    Pushes the changes to the posts shown by the page as server-sent events,
+    along with the new posts of the followed authors
+    """
+
+    @method_decorator(login_required)
+    def get(self, request):
+        try:
+            post_ids = set(
+                int(post_id)
+                for post_id in request.GET.get('posts', '').split(',')
+                if post_id)
+            last_id = (request.META.get('HTTP_LAST_EVENT_ID') or
+                       request.GET.get('last_id'))
+            last_id = int(last_id) if last_id else get_settled_last_id()
+        except ValueError:
+            return HttpResponse(status=400)
+
+        if len(post_ids) > settings.FEED_EVENTS_MAX_POSTS:
+            return HttpResponse(status=400)
+
+        profile = request.user.profile
+        author_ids = set(Follow.objects.filter(follower=profile).values_list(
+            'followee_id', flat=True))
+        author_ids.add(profile.id)
+
+        response = StreamingHttpResponse(
+            stream_events(last_id, make_filter(post_ids, author_ids)),
+            content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Tells nginx not to buffer the stream
+        response['X-Accel-Buffering'] = 'no'
+
+        return response
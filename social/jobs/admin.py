@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+
+from django.contrib import admin
+
+from .models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('task', 'state', 'attempts', 'run_at', 'locked_by')
+    list_filter = ('state', 'task')
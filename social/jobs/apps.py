@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+
+from django.apps import AppConfig
+from django.utils.module_loading import autodiscover_modules
+
+
+class JobsConfig(AppConfig):
+    name = 'jobs'
+
+    def ready(self):
+        # Tasks are registered by the tasks module of each app
+        autodiscover_modules('tasks')
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+import os
+import signal
+import socket
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from jobs.models import Job
+from jobs.registry import run_job
+
+
+class Command(BaseCommand):
+    help = 'Runs the queued jobs; several workers can run at once'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Exit once there are no jobs due instead of waiting')
+        parser.add_argument(
+            '--batch-size', type=int, default=10,
+            help='Number of jobs claimed at a time')
+
+    def stop(self, signum, frame):
+        # The job being run is finished before exiting
+        self.stopping = True
+
+    def handle(self, *args, **options):
+        worker = '%s:%d' % (socket.gethostname(), os.getpid())
+        self.stopping = False
+        handlers = [
+            (signum, signal.signal(signum, self.stop))
+            for signum in (signal.SIGTERM, signal.SIGINT)
+        ]
+
+        try:
+            succeeded, failed = self.work(worker, options)
+        finally:
+            for signum, handler in handlers:
+                signal.signal(signum, handler)
+
+        self.stdout.write(
+            '%d jobs succeeded, %d failed.' % (succeeded, failed))
+
+    def work(self, worker, options):
+        succeeded = failed = 0
+
+        while not self.stopping:
+            Job.release_stale()
+            jobs = Job.claim(worker, options['batch_size'])
+
+            if not jobs:
+                if options['once']:
+                    break
+                time.sleep(settings.JOBS_POLL_INTERVAL)
+                continue
+
+            for job in jobs:
+                if self.stopping:
+                    # Not started, so it can go back to the queue right away
+                    Job.objects.filter(id=job.id).update(
+                        state=Job.PENDING, locked_at=None, locked_by='',
+                        attempts=job.attempts - 1)
+                elif run_job(job):
+                    succeeded += 1
+                else:
+                    failed += 1
+                    self.stderr.write(
+                        'Job %d (%s) failed.' % (job.id, job.task))
+
+        return succeeded, failed
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+
+import json
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, models
+from django.db.models import F
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """
+    A call to a task deferred to the workers. Jobs run at least once: a job
+    whose worker stopped answering is handed to another worker, so tasks
+    must be safe to run again
+    """
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DEAD = 'dead'
+
+    STATES = (
+        (PENDING, 'Pendente'),
+        (RUNNING, 'Executando'),
+        (DEAD, 'Morto'),
+    )
+
+    task = models.CharField(max_length=200)
+    arguments = models.TextField(default='{}')
+    state = models.CharField(max_length=10, choices=STATES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=1)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=100, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        index_together = [('state', 'run_at')]
+
+    @staticmethod
+    def enqueue(task, arguments=None, max_attempts=None):
+        """
+        Creates a job for the task. Inside a transaction, the workers only
+        see it once the transaction is committed
+        """
+        return Job.objects.create(
+            task=task, arguments=json.dumps(arguments or {}),
+            max_attempts=max_attempts or settings.JOBS_MAX_ATTEMPTS)
+
+    @staticmethod
+    def claim(worker, limit=1):
+        """
+        Marks up to limit jobs that are due as run by the worker and returns
+        them. Concurrent workers never claim the same job
+        """
+        now = timezone.now()
+
+        if connection.vendor == 'postgresql':
+            job_ids = Job.claim_skip_locked(worker, limit, now)
+        else:
+            job_ids = Job.claim_optimistic(worker, limit, now)
+
+        return list(Job.objects.filter(id__in=job_ids).order_by('run_at'))
+
+    @staticmethod
+    def claim_skip_locked(worker, limit, now):
+        """
+        Claims the jobs in a single statement; rows locked by another worker
+        are skipped instead of waited on
+        """
+        sql = (
+            'UPDATE {job} SET state = %s, locked_at = %s, locked_by = %s, '
+            'attempts = attempts + 1 WHERE id IN ('
+            'SELECT id FROM {job} WHERE state = %s AND run_at <= %s '
+            'ORDER BY run_at LIMIT %s FOR UPDATE SKIP LOCKED) RETURNING id'
+        ).format(job=Job._meta.db_table)
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [
+                Job.RUNNING, now, worker, Job.PENDING, now, limit])
+            return [row[0] for row in cursor.fetchall()]
+
+    @staticmethod
+    def claim_optimistic(worker, limit, now):
+        """
+        Claims the jobs one by one with an update that only succeeds while
+        the job is still pending, for databases without SKIP LOCKED
+        """
+        candidates = Job.objects.filter(state=Job.PENDING, run_at__lte=now)
+        candidates = candidates.order_by('run_at')
+        candidates = candidates.values_list('id', flat=True)[:limit]
+        job_ids = []
+
+        for job_id in candidates:
+            claimed = Job.objects.filter(id=job_id, state=Job.PENDING).update(
+                state=Job.RUNNING, locked_at=now, locked_by=worker,
+                attempts=F('attempts') + 1)
+
+            if claimed:
+                job_ids.append(job_id)
+
+        return job_ids
+
+    @staticmethod
+    def release_stale():
+        """
+        Hands the jobs of workers that stopped answering back to the queue,
+        or keeps them as dead after their last attempt, as the job may be
+        what stopped its worker. Returns how many jobs were released
+        """
+        stale = timezone.now() - timedelta(seconds=settings.JOBS_LOCK_TIMEOUT)
+        stale = Job.objects.filter(state=Job.RUNNING, locked_at__lt=stale)
+
+        dead = stale.filter(attempts__gte=F('max_attempts')).update(
+            state=Job.DEAD, locked_at=None, locked_by='',
+            last_error='The worker stopped answering on the last attempt.')
+        pending = stale.filter(attempts__lt=F('max_attempts')).update(
+            state=Job.PENDING, locked_at=None, locked_by='')
+
+        return dead + pending
+
+    @staticmethod
+    def retry_delay(attempts):
+        """
+        Returns the seconds to wait before the next attempt: doubled after
+        every failure, up to a limit, half of it random so jobs that failed
+        together do not retry together
+        """
+        delay = min(settings.JOBS_RETRY_DELAY * 2 ** (attempts - 1),
+                    settings.JOBS_RETRY_MAX_DELAY)
+
+        return delay / 2.0 + random.uniform(0, delay / 2.0)
+
+    def succeed(self):
+        Job.objects.filter(id=self.id, locked_by=self.locked_by).delete()
+
+    def fail(self, error):
+        """
+        Schedules the job to run again after a delay or, after its last
+        attempt, keeps it as dead for inspection. Nothing changes if the job
+        was released as stale meanwhile, it may be another worker's by now
+        """
+        fields = {'last_error': error, 'locked_at': None, 'locked_by': ''}
+
+        if self.attempts >= self.max_attempts:
+            fields['state'] = Job.DEAD
+        else:
+            fields['state'] = Job.PENDING
+            fields['run_at'] = timezone.now() + timedelta(
+                seconds=Job.retry_delay(self.attempts))
+
+        Job.objects.filter(
+            id=self.id, locked_by=self.locked_by, state=Job.RUNNING).update(
+            **fields)
+
+        for name, value in fields.items():
+            setattr(self, name, value)
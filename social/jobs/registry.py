@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+import json
+import traceback
+
+from django.db import transaction
+
+from .models import Job
+
+TASKS = {}
+
+
+def task(func=None, max_attempts=None):
+    """
+    Registers the function as a task run by the workers, named after its
+    module and name. Calling delay(**arguments) on it enqueues a job; the
+    arguments must be serializable to JSON
+    """
+    def register(func):
+        name = '%s.%s' % (func.__module__, func.__name__)
+        TASKS[name] = func
+
+        func.task_name = name
+        func.delay = (
+            lambda **arguments: Job.enqueue(name, arguments, max_attempts))
+
+        return func
+
+    return register(func) if func is not None else register
+
+
+def run_job(job):
+    """
+    Runs the task of a claimed job in a transaction, so a failed attempt
+    leaves nothing behind. Returns whether it succeeded
+    """
+    try:
+        func = TASKS[job.task]
+
+        with transaction.atomic():
+            func(**json.loads(job.arguments))
+    except Exception:
+        job.fail(traceback.format_exc())
+        return False
+
+    job.succeed()
+    return True
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from jobs.models import Job
+from jobs.tests.test_models import create_user, create_user_and_fail
+
+
+class RunJobsCommandTests(TestCase):
+
+    def test_run_jobs_once(self):
+        """
+        run_jobs --once must run every job due and keep the failed ones
+        """
+        create_user.delay(username='first')
+        create_user.delay(username='second')
+        create_user_and_fail.delay(username='third')
+
+        output = StringIO()
+        call_command('run_jobs', once=True, stdout=output, stderr=StringIO())
+
+        self.assertIn('2 jobs succeeded, 1 failed.', output.getvalue())
+        self.assertEqual(
+            sorted(User.objects.values_list('username', flat=True)),
+            ['first', 'second'])
+        self.assertEqual(Job.objects.get().state, Job.PENDING)
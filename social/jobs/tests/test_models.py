@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from jobs.models import Job
+from jobs.registry import TASKS, run_job, task
+
+
+@task
+def create_user(username):
+    User.objects.create(username=username)
+
+
+@task(max_attempts=2)
+def create_user_and_fail(username):
+    User.objects.create(username=username)
+    raise ValueError('Failed after writing')
+
+
+class JobModelTests(TestCase):
+
+    def test_task_registry(self):
+        """
+        task() must register the function by its module and name and give
+        it a delay() that enqueues a job with the arguments
+        """
+        name = 'jobs.tests.test_models.create_user'
+        self.assertIs(TASKS[name], create_user)
+
+        job = create_user.delay(username='worker')
+
+        self.assertEqual(job.task, name)
+        self.assertEqual(job.state, Job.PENDING)
+        self.assertEqual(job.arguments, '{"username": "worker"}')
+
+    def test_claim_by_two_workers(self):
+        """
+        Two workers must never claim the same job
+        """
+        for number in range(3):
+            create_user.delay(username='user_%d' % number)
+
+        first = Job.claim('first', limit=2)
+        second = Job.claim('second', limit=2)
+
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 1)
+        self.assertFalse(
+            set(job.id for job in first) & set(job.id for job in second))
+        self.assertEqual(Job.claim('third', limit=2), [])
+        self.assertEqual(first[0].state, Job.RUNNING)
+        self.assertEqual(first[0].attempts, 1)
+
+    def test_claim_only_due_jobs(self):
+        """
+        A job scheduled to run later must not be claimed before its time
+        """
+        job = create_user.delay(username='later')
+        Job.objects.filter(id=job.id).update(
+            run_at=timezone.now() + timedelta(minutes=1))
+
+        self.assertEqual(Job.claim('worker'), [])
+
+    def test_run_job(self):
+        """
+        A job that succeeds must run its task and leave the queue
+        """
+        create_user.delay(username='worker')
+
+        self.assertTrue(run_job(Job.claim('worker')[0]))
+        self.assertTrue(User.objects.filter(username='worker').exists())
+        self.assertFalse(Job.objects.exists())
+
+    @override_settings(JOBS_RETRY_DELAY=10)
+    def test_failed_job_is_retried_later(self):
+        """
+        A job that fails must roll back what it wrote and be scheduled again
+        after a delay
+        """
+        create_user_and_fail.delay(username='worker')
+        before = timezone.now()
+
+        self.assertFalse(run_job(Job.claim('worker')[0]))
+
+        job = Job.objects.get()
+        self.assertFalse(User.objects.filter(username='worker').exists())
+        self.assertEqual(job.state, Job.PENDING)
+        self.assertIn('Failed after writing', job.last_error)
+        self.assertGreaterEqual(job.run_at, before + timedelta(seconds=5))
+        self.assertEqual(Job.claim('worker'), [])
+
+    def test_failed_job_becomes_dead(self):
+        """
+        A job that failed on its last attempt must be kept as dead
+        """
+        job = create_user_and_fail.delay(username='worker')
+
+        for _ in range(2):
+            Job.objects.filter(id=job.id).update(run_at=timezone.now())
+            run_job(Job.claim('worker')[0])
+
+        job = Job.objects.get()
+        self.assertEqual(job.state, Job.DEAD)
+        self.assertEqual(job.attempts, 2)
+        self.assertEqual(Job.claim('worker'), [])
+
+    def test_unknown_task(self):
+        """
+        A job of a task that is not registered must fail instead of
+        stopping the worker
+        """
+        Job.enqueue('jobs.tests.unknown')
+
+        self.assertFalse(run_job(Job.claim('worker')[0]))
+        self.assertIn('KeyError', Job.objects.get().last_error)
+
+    @override_settings(JOBS_RETRY_DELAY=10, JOBS_RETRY_MAX_DELAY=60)
+    def test_retry_delay(self):
+        """
+        The delay before a retry must double after every attempt up to its
+        limit, with up to half of it random
+        """
+        for attempts, delay in [(1, 10), (2, 20), (3, 40), (4, 60), (9, 60)]:
+            retry_delay = Job.retry_delay(attempts)
+            self.assertGreaterEqual(retry_delay, delay / 2.0)
+            self.assertLessEqual(retry_delay, delay)
+
+    @override_settings(JOBS_LOCK_TIMEOUT=60)
+    def test_release_stale(self):
+        """
+        A running job whose worker stopped answering must return to the
+        queue, and the other running jobs must not
+        """
+        create_user.delay(username='first')
+        create_user.delay(username='second')
+        stale, running = Job.claim('worker', limit=2)
+        Job.objects.filter(id=stale.id).update(
+            locked_at=timezone.now() - timedelta(minutes=2))
+
+        self.assertEqual(Job.release_stale(), 1)
+        self.assertEqual([job.id for job in Job.claim('other')], [stale.id])
+
+    @override_settings(JOBS_LOCK_TIMEOUT=60)
+    def test_release_stale_on_last_attempt(self):
+        """
+        A running job whose worker stopped answering on its last attempt
+        must be kept as dead instead of returning to the queue
+        """
+        job = create_user.delay(username='worker')
+        Job.objects.filter(id=job.id).update(max_attempts=1)
+        Job.claim('worker')
+        Job.objects.filter(id=job.id).update(
+            locked_at=timezone.now() - timedelta(minutes=2))
+
+        self.assertEqual(Job.release_stale(), 1)
+
+        job = Job.objects.get()
+        self.assertEqual(job.state, Job.DEAD)
+        self.assertIn('stopped answering', job.last_error)
+        self.assertEqual(Job.claim('other'), [])
+
+    @override_settings(JOBS_LOCK_TIMEOUT=60)
+    def test_fail_after_release_stale(self):
+        """
+        A job that fails after it was released as stale and claimed by
+        another worker must be left to that worker
+        """
+        create_user_and_fail.delay(username='worker')
+        job = Job.claim('first')[0]
+        Job.objects.filter(id=job.id).update(
+            locked_at=timezone.now() - timedelta(minutes=2))
+        Job.release_stale()
+        Job.claim('second')
+
+        job.fail('Failed late')
+
+        claimed = Job.objects.get()
+        self.assertEqual(claimed.state, Job.RUNNING)
+        self.assertEqual(claimed.locked_by, 'second')
+        self.assertEqual(claimed.attempts, 2)
+        self.assertEqual(claimed.last_error, '')
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+from time import perf_counter
+
+from django.db import connections
+
+from . import registry
+from .recorder import instrument, stats
+
+
+class RequestMetricsMiddleware(object):
+    """
+    Measures the wall time of each request, the number and time of its SQL
+    queries, the time spent rendering templates and the size of the
+    response. Sends them to the client in a Server-Timing header and adds
+    them to the histograms of the view. Must be the first middleware, so
+    the time of the others is counted. The histograms of a streamed
+    response are added once its last byte is sent, while its header can
+    only tell what was spent before the first one
+    """
+
+    def process_request(self, request):
+        # The connections of each thread are created on first use
+        for connection in connections.all():
+            instrument(connection)
+
+        stats.reset()
+        request.metrics_start = perf_counter()
+
+    def process_response(self, request, response):
+        start = getattr(request, 'metrics_start', None)
+        if start is None:
+            return response
+
+        total = perf_counter() - start
+        response['Server-Timing'] = (
+            'total;dur=%.2f, db;dur=%.2f;desc="%d queries", '
+            'template;dur=%.2f' % (
+                total * 1000, stats.db_time * 1000, stats.queries,
+                stats.template_time * 1000))
+
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+
+        if response.streaming:
+            response.streaming_content = self.measure_stream(
+                response.streaming_content, view, start)
+        else:
+            self.observe(view, total, len(response.content))
+
+        return response
+
+    @staticmethod
+    def observe(view, total, size=None):
+        values = {
+            'request_duration_seconds': total,
+            'request_db_duration_seconds': stats.db_time,
+            'request_db_queries': stats.queries,
+            'request_template_duration_seconds': stats.template_time,
+        }
+        if size is not None:
+            values['response_size_bytes'] = size
+
+        registry.observe(view, values)
+        registry.maybe_flush()
+
+    def measure_stream(self, content, view, start):
+        """
+        Yields the content of the streamed response, adding its histograms
+        once it is sent or the client goes away. The server sends it from
+        the thread of the request, so the queries run meanwhile are counted
+        """
+        try:
+            yield from content
+        finally:
+            self.observe(view, perf_counter() - start)
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+import threading
+from time import perf_counter
+
+
+class RequestStats(threading.local):
+    """
+    What the request being handled by the thread spent so far, reset by
+    RequestMetricsMiddleware when it starts
+    """
+    queries = 0
+    db_time = 0.0
+    template_time = 0.0
+    # Nesting of the templates being rendered, only the outer one is timed
+    rendering = 0
+
+    def reset(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+
+
+stats = RequestStats()
+
+
+class TimedCursorWrapper(object):
+    """
+    Adds the number and time of the queries run through the cursor to the
+    stats of the request
+    """
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return self.cursor.__exit__(*exc_info)
+
+    def execute(self, sql, params=None):
+        start = perf_counter()
+        try:
+            return self.cursor.execute(sql, params)
+        finally:
+            stats.queries += 1
+            stats.db_time += perf_counter() - start
+
+    def executemany(self, sql, param_list):
+        start = perf_counter()
+        try:
+            return self.cursor.executemany(sql, param_list)
+        finally:
+            stats.queries += 1
+            stats.db_time += perf_counter() - start
+
+
+def instrument(connection):
+    """
+    Wraps the cursors of the connection, once, so its queries are timed.
+    Django 1.9 has no hook around the execution of the queries, and the
+    debug cursor rounds their time to milliseconds
+    """
+    if getattr(connection, 'timed_cursors', False):
+        return
+
+    make_cursor = connection.make_cursor
+    make_debug_cursor = connection.make_debug_cursor
+
+    connection.make_cursor = (
+        lambda cursor: TimedCursorWrapper(make_cursor(cursor)))
+    connection.make_debug_cursor = (
+        lambda cursor: TimedCursorWrapper(make_debug_cursor(cursor)))
+    connection.timed_cursors = True
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+
+import fcntl
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+PREFIX = 'social_'
+
+SECONDS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Name, help and upper bounds of the buckets of each histogram, by view
+HISTOGRAMS = [
+    ('request_duration_seconds', 'Wall time of the requests.', SECONDS),
+    ('request_db_duration_seconds', 'Time spent running SQL queries.',
+     SECONDS),
+    ('request_db_queries', 'Number of SQL queries run.',
+     (0, 1, 2, 5, 10, 20, 50, 100, 200)),
+    ('request_template_duration_seconds', 'Time spent rendering templates.',
+     SECONDS),
+    ('response_size_bytes', 'Size of the response bodies, streamed ones '
+     'left out.', (256, 1024, 4096, 16384, 65536, 262144, 1048576)),
+]
+
+BOUNDS = {name: bounds for name, _, bounds in HISTOGRAMS}
+
+# The histograms of the processes that exited, summed
+ARCHIVE = 'archive.json'
+
+# The file of a process, named by its pid and the microsecond it started
+PROCESS_FILE = re.compile(r'^(\d+)-(\d+)\.json$')
+
+_lock = threading.Lock()
+# (name, view): the count of each bucket, the last one +Inf, and the sum
+_series = {}
+_flushed_at = 0
+_process = None
+
+
+def observe(view, values):
+    """
+    Adds the values of a request, by histogram name, to the histograms of
+    its view
+    """
+    with _lock:
+        for name, value in values.items():
+            bounds = BOUNDS[name]
+            series = _series.get((name, view))
+            if series is None:
+                series = _series[(name, view)] = [0] * (len(bounds) + 1)
+                series.append(0)
+
+            series[bisect_left(bounds, value)] += 1
+            series[-1] += value
+
+
+def get_process_name():
+    """
+    Returns the name of the file of this process. The start time tells it
+    apart from an exited process that had the same pid
+    """
+    global _process
+
+    pid = os.getpid()
+    # Computed again in a forked worker
+    if _process is None or _process[0] != pid:
+        _process = (pid, '%d-%d.json' % (pid, time.time() * 1000000))
+
+    return _process[1]
+
+
+def write(path, data):
+    """
+    Replaces the file at once, so it is never read half written
+    """
+    directory = os.path.dirname(path)
+    descriptor, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(descriptor, 'w') as temporary_file:
+        json.dump(data, temporary_file)
+    os.replace(temporary, path)
+
+
+def flush():
+    """
+    Writes the histograms of this process to its file in METRICS_DIR, where
+    the metrics view sums the ones of every worker process
+    """
+    global _flushed_at
+
+    with _lock:
+        data = [[name, view, list(series)]
+                for (name, view), series in _series.items()]
+        _flushed_at = time.time()
+
+    directory = settings.METRICS_DIR
+    os.makedirs(directory, exist_ok=True)
+    write(os.path.join(directory, get_process_name()), data)
+
+
+def maybe_flush():
+    """
+    Flushes the histograms once every METRICS_FLUSH_INTERVAL seconds
+    """
+    if time.time() - _flushed_at >= settings.METRICS_FLUSH_INTERVAL:
+        flush()
+
+
+def read(path):
+    try:
+        with open(path) as series_file:
+            return json.load(series_file)
+    except (OSError, ValueError):
+        # Removed in the meantime
+        return []
+
+
+def add(totals, data):
+    for name, view, series in data:
+        # Written with other buckets, before a deploy
+        if len(series) != len(BOUNDS.get(name, ())) + 2:
+            continue
+
+        total = totals.setdefault((name, view), [0] * len(series))
+        for index, value in enumerate(series):
+            total[index] += value
+
+
+def is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+
+    return True
+
+
+def find_exited(names):
+    """
+    Returns the process files of the processes that exited: the ones whose
+    pid is not running, or was taken by a process started later
+    """
+    started = {}
+
+    for name in names:
+        match = PROCESS_FILE.match(name)
+        if match:
+            pid, start = (int(value) for value in match.groups())
+            started.setdefault(pid, []).append((start, name))
+
+    exited = []
+
+    for pid, files in started.items():
+        files.sort()
+        if not is_running(pid):
+            exited.extend(name for _, name in files)
+        else:
+            exited.extend(name for _, name in files[:-1])
+
+    return exited
+
+
+def archive_exited(directory, names):
+    """
+    Adds the histograms of the exited processes to the archive and removes
+    their files, so the totals keep growing while the files do not
+    pile up
+    """
+    exited = find_exited(names)
+    if not exited:
+        return
+
+    archive = os.path.join(directory, ARCHIVE)
+    totals = {}
+    add(totals, read(archive))
+    for name in exited:
+        add(totals, read(os.path.join(directory, name)))
+
+    write(archive, [[name, view, series]
+                    for (name, view), series in totals.items()])
+
+    for name in exited:
+        os.remove(os.path.join(directory, name))
+
+
+def collect():
+    """
+    Returns the histograms of every process, summed, the exited ones
+    included
+    """
+    directory = settings.METRICS_DIR
+    os.makedirs(directory, exist_ok=True)
+
+    # A concurrent collect would archive the same files twice
+    with open(os.path.join(directory, 'archive.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+
+        archive_exited(directory, os.listdir(directory))
+
+        totals = {}
+        for name in os.listdir(directory):
+            if name.endswith('.json'):
+                add(totals, read(os.path.join(directory, name)))
+
+    return totals
+
+
+def escape(value):
+    return (value.replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+def render(totals):
+    """
+    Returns the histograms in the Prometheus text format
+    """
+    lines = []
+
+    for name, help_text, bounds in HISTOGRAMS:
+        metric = PREFIX + name
+        lines.append('# HELP %s %s' % (metric, help_text))
+        lines.append('# TYPE %s histogram' % metric)
+
+        for (series_name, view), series in sorted(totals.items()):
+            if series_name != name:
+                continue
+
+            labels = 'view="%s"' % escape(view)
+            count = 0
+
+            for bound, bucket in zip(bounds + ('+Inf',), series):
+                count += bucket
+                le = bound if bound == '+Inf' else repr(float(bound))
+                lines.append('%s_bucket{%s,le="%s"} %d' % (
+                    metric, labels, le, count))
+
+            lines.append('%s_sum{%s} %r' % (metric, labels, series[-1]))
+            lines.append('%s_count{%s} %d' % (metric, labels, count))
+
+    return '\n'.join(lines) + '\n'
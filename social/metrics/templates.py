@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+
+from time import perf_counter
+
+from django.template.backends import django as django_backend
+
+from .recorder import stats
+
+
+class Template(django_backend.Template):
+
+    def render(self, context=None, request=None):
+        stats.rendering += 1
+        start = perf_counter()
+        try:
+            return super(Template, self).render(context, request)
+        finally:
+            stats.rendering -= 1
+            # The templates rendered by a template are part of its time
+            if not stats.rendering:
+                stats.template_time += perf_counter() - start
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """
+    The Django template backend, adding the time spent rendering to the
+    stats of the request
+    """
+
+    def from_string(self, template_code):
+        template = super(DjangoTemplates, self).from_string(template_code)
+        return Template(template.template, self)
+
+    def get_template(self, template_name, *args, **kwargs):
+        template = super(DjangoTemplates, self).get_template(
+            template_name, *args, **kwargs)
+        return Template(template.template, self)
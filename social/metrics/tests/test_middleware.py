@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import re
+import shutil
+import tempfile
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from authentication.models import Profile
+from metrics import registry
+from metrics.middleware import RequestMetricsMiddleware
+from metrics.recorder import stats
+
+
+class RequestMetricsTests(TestCase):
+
+    @classmethod
+    def setUp(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.settings_override = override_settings(
+            METRICS_DIR=cls.directory, METRICS_FLUSH_INTERVAL=3600)
+        cls.settings_override.enable()
+        registry._series.clear()
+
+        cls.user = User.objects.create(username='measured')
+        Profile.objects.create(user=cls.user)
+
+    @classmethod
+    def tearDown(cls):
+        cls.settings_override.disable()
+        shutil.rmtree(cls.directory)
+        registry._series.clear()
+
+    def write_process_file(self, pid, start, view):
+        series = [['request_duration_seconds', view, [0] * 11 + [1, 0, 9.0]]]
+        name = os.path.join(self.directory, '%d-%d.json' % (pid, start))
+
+        with open(name, 'w') as process_file:
+            json.dump(series, process_file)
+
+    @staticmethod
+    def parse_timing(response):
+        return {
+            name: (float(duration), description)
+            for name, duration, description in re.findall(
+                r'(\w+);dur=([\d.]+)(?:;desc="([^"]*)")?',
+                response['Server-Timing'])
+        }
+
+    def test_server_timing_header(self):
+        """
+        Responses must carry their total, SQL and template times, with the
+        number of queries run
+        """
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('authentication:profile'))
+
+        timing = self.parse_timing(response)
+
+        self.assertEqual(set(timing), {'total', 'db', 'template'})
+        self.assertEqual(timing['db'][1], '%d queries' % len(queries))
+        self.assertGreater(timing['template'][0], 0)
+        self.assertGreaterEqual(
+            timing['total'][0], timing['db'][0] + timing['template'][0])
+
+    def test_histograms_by_view(self):
+        """
+        The metrics endpoint must answer the histograms of each view, summed
+        across the processes
+        """
+        self.client.force_login(self.user)
+        self.client.get(reverse('authentication:profile'))
+        self.client.get(reverse('authentication:profile'))
+
+        # Another worker process, still running, measured the view too
+        self.write_process_file(os.getppid(), 1, 'authentication:profile')
+
+        response = self.client.get(reverse('metrics:metrics'))
+        body = response.content.decode()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('# TYPE social_request_duration_seconds histogram',
+                      body)
+        self.assertIn('social_request_duration_seconds_count'
+                      '{view="authentication:profile"} 3', body)
+        self.assertIn('social_request_duration_seconds_bucket'
+                      '{view="authentication:profile",le="+Inf"} 3', body)
+        self.assertIn('social_request_duration_seconds_bucket'
+                      '{view="authentication:profile",le="10.0"} 3', body)
+        self.assertIn('social_response_size_bytes_count'
+                      '{view="authentication:profile"} 2', body)
+
+    def test_exited_processes_are_archived(self):
+        """
+        The histograms of the exited processes, and of the ones whose pid
+        was taken by a newer process, must still be summed once their files
+        are replaced by the archive
+        """
+        registry.flush()
+        # Beyond the largest pid Linux gives
+        self.write_process_file(2 ** 22 + 1, 1, 'exited')
+        self.write_process_file(os.getpid(), 1, 'exited')
+
+        for _ in range(2):
+            totals = registry.collect()
+            self.assertEqual(
+                sum(totals['request_duration_seconds', 'exited'][:-1]), 2)
+
+        self.assertEqual(
+            sorted(name for name in os.listdir(self.directory)
+                   if name.endswith('.json')),
+            sorted([registry.ARCHIVE, registry.get_process_name()]))
+
+    def test_streamed_response_is_measured_until_its_end(self):
+        """
+        The queries run while a response is streamed must be added to the
+        histograms of its view
+        """
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('feed:api_feed'))
+            header_queries = stats.queries
+            b''.join(response.streaming_content)
+
+        series = registry._series['request_db_queries', 'feed:api_feed']
+
+        self.assertEqual(series[-1], len(queries))
+        self.assertLess(header_queries, len(queries))
+        self.assertNotIn(
+            ('response_size_bytes', 'feed:api_feed'), registry._series)
+
+    def test_metrics_from_other_addresses(self):
+        """
+        Trying to read the metrics from an address not allowed must return
+        a 403 forbidden
+        """
+        response = self.client.get(
+            reverse('metrics:metrics'), REMOTE_ADDR='10.0.0.1')
+
+        self.assertEqual(response.status_code, 403)
+
+    def test_overhead(self):
+        """
+        Measuring requests must run no queries and write the metrics file
+        at most once per flush interval, however many requests there are
+        """
+        middleware = RequestMetricsMiddleware()
+        request = RequestFactory().get('/')
+        request.resolver_match = None
+        response = HttpResponse('content')
+        iterations = 1000
+
+        with patch('metrics.registry.flush', wraps=registry.flush) as flush:
+            with CaptureQueriesContext(connection) as queries:
+                for _ in range(iterations):
+                    middleware.process_request(request)
+                    middleware.process_response(request, response)
+
+        series = registry._series['request_duration_seconds', 'unresolved']
+
+        self.assertEqual(len(queries), 0)
+        self.assertLessEqual(flush.call_count, 1)
+        self.assertEqual(sum(series[:-1]), iterations)
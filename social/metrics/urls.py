@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+
+from django.conf.urls import url
+
+from .views import MetricsView
+
+app_name = 'metrics'
+urlpatterns = [
+    url(r'^metrics$', MetricsView.as_view(), name='metrics'),
+]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.views.generic import View
+
+from . import registry
+
+
+class MetricsView(View):
+    """
+    Answers the request histograms of every worker process in the
+    Prometheus text format, to the addresses in METRICS_ALLOWED_IPS
+    """
+
+    def get(self, request):
+        address = request.META.get('REMOTE_ADDR')
+        if address not in settings.METRICS_ALLOWED_IPS:
+            return HttpResponse(status=403)
+
+        registry.flush()
+
+        return HttpResponse(
+            registry.render(registry.collect()),
+            content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+from django.conf import settings
+
+from .router import has_written, reset
+
+COOKIE_NAME = 'primary_until'
+
+
+class ReplicaPinMiddleware(object):
+    """
+    Keeps the reads of a client on the primary for DATABASE_REPLICA_PIN
+    seconds after it wrote, so it reads its own writes even from a replica
+    that lags. The time is kept in a cookie, which costs no session write
+    """
+
+    def process_request(self, request):
+        try:
+            until = float(request.COOKIES.get(COOKIE_NAME, 0))
+        except ValueError:
+            until = 0
+
+        reset(pinned=until > time.time())
+
+    def process_response(self, request, response):
+        if has_written():
+            pin = settings.DATABASE_REPLICA_PIN
+            response.set_cookie(
+                COOKIE_NAME, int(time.time() + pin), max_age=pin,
+                httponly=True)
+
+        return response
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import random
+import threading
+import time
+from contextlib import ContextDecorator
+from functools import wraps
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.views.decorators import http
+
+PRIMARY = 'default'
+
+# How far a PostgreSQL standby is behind, in seconds. A standby that
+# replayed everything it received is not behind, however old the last
+# transaction is
+POSTGRESQL_LAG = (
+    'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() '
+    'THEN 0 ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) '
+    'END')
+
+# The same before PostgreSQL 10, which renamed the functions
+POSTGRESQL_9_LAG = (
+    'SELECT CASE WHEN pg_last_xlog_receive_location() = '
+    'pg_last_xlog_replay_location() '
+    'THEN 0 ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) '
+    'END')
+
+logger = logging.getLogger(__name__)
+
+_state = threading.local()
+_checks = {}
+
+
+class ReplicaReads(ContextDecorator):
+
+    def __enter__(self):
+        _state.replica = getattr(_state, 'replica', 0) + 1
+        return self
+
+    def __exit__(self, *exc_info):
+        _state.replica -= 1
+        return False
+
+
+def use_replica():
+    """
+    Lets the reads made inside it, or inside the decorated function, go to a
+    replica. The client's reads stay on the primary while it is pinned there
+    after writing, as do the reads that follow a write in the same request
+    """
+    return ReplicaReads()
+
+
+def replica_condition(etag_func=None, last_modified_func=None):
+    """
+    Like the condition decorator of Django, but leaves the validators out of
+    the responses read from a replica. They are taken from the current
+    state, which a lagging replica may not show yet, and a stale page sent
+    with them would be validated until the next change
+    """
+    def decorator(view):
+        conditional = http.condition(etag_func, last_modified_func)(view)
+
+        @wraps(view)
+        def inner(request, *args, **kwargs):
+            response = conditional(request, *args, **kwargs)
+
+            if has_read_replica():
+                del response['ETag']
+                del response['Last-Modified']
+
+            return response
+
+        return inner
+
+    return decorator
+
+
+def reset(pinned=False):
+    """
+    Starts the database state of a request, pinned to the primary or not
+    """
+    _state.pinned = pinned
+    _state.written = False
+    _state.read_replica = False
+
+
+def has_written():
+    return getattr(_state, 'written', False)
+
+
+def has_read_replica():
+    return getattr(_state, 'read_replica', False)
+
+
+def get_lag(alias):
+    """
+    Returns in seconds how far the database is behind the primary. Raises
+    DatabaseError when it does not answer
+    """
+    connection = connections[alias]
+
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(POSTGRESQL_LAG if connection.pg_version >= 100000
+                           else POSTGRESQL_9_LAG)
+            return float(cursor.fetchone()[0] or 0)
+
+        cursor.execute('SELECT 1')
+        return 0.0
+
+
+def is_usable(alias):
+    """
+    Returns whether the replica answers and is at most
+    DATABASE_REPLICA_MAX_LAG seconds behind. The answer is kept for
+    DATABASE_REPLICA_CHECK_INTERVAL seconds
+    """
+    checked_at, usable = _checks.get(alias, (0, False))
+
+    if time.time() - checked_at > settings.DATABASE_REPLICA_CHECK_INTERVAL:
+        try:
+            usable = get_lag(alias) <= settings.DATABASE_REPLICA_MAX_LAG
+        except DatabaseError:
+            # Its reads go to the primary until it answers again
+            logger.warning(
+                'Replica %s is not read, its lag cannot be checked.', alias,
+                exc_info=True)
+            usable = False
+
+        _checks[alias] = (time.time(), usable)
+
+    return usable
+
+
+def get_replica():
+    """
+    Returns a usable replica, or the primary when there is none
+    """
+    replicas = [alias for alias in settings.DATABASE_REPLICAS
+                if is_usable(alias)]
+
+    return random.choice(replicas) if replicas else PRIMARY
+
+
+class ReplicaRouter(object):
+    """
+    Sends the writes to the primary, and the reads made with use_replica to
+    the replicas unless the client must read its own writes
+    """
+
+    def db_for_read(self, model, **hints):
+        if (getattr(_state, 'replica', 0) and
+                not getattr(_state, 'pinned', False) and not has_written()):
+            alias = get_replica()
+            if alias != PRIMARY:
+                _state.read_replica = True
+            return alias
+
+        return PRIMARY
+
+    def db_for_write(self, model, **hints):
+        _state.written = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replicas hold the same rows as the primary
+        return True
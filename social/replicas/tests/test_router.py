@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+from unittest.mock import MagicMock, patch
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.db import DatabaseError, connections
+from django.test import TestCase, override_settings
+
+from authentication.models import Profile
+from feed.models import Post, TimelineEntry
+from replicas import router
+from replicas.middleware import COOKIE_NAME
+from replicas.router import ReplicaRouter, use_replica
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTests(TestCase):
+
+    @classmethod
+    def setUp(cls):
+        router._checks.clear()
+        router.reset()
+
+    @classmethod
+    def tearDown(cls):
+        router._checks.clear()
+        router.reset()
+
+    def read_db(self):
+        return ReplicaRouter().db_for_read(Post)
+
+    @patch('replicas.router.get_lag', return_value=0)
+    def test_reads_go_to_the_replica_only_when_asked(self, get_lag):
+        """
+        Reads must go to the replica inside use_replica only, and writes
+        always to the primary
+        """
+        self.assertEqual(self.read_db(), 'default')
+
+        with use_replica():
+            self.assertEqual(self.read_db(), 'replica')
+            self.assertEqual(ReplicaRouter().db_for_write(Post), 'default')
+
+    @patch('replicas.router.get_lag', return_value=0)
+    def test_reads_after_writing_stay_on_the_primary(self, get_lag):
+        """
+        A pinned client, or one that wrote in the same request, must read
+        from the primary
+        """
+        router.reset(pinned=True)
+        with use_replica():
+            self.assertEqual(self.read_db(), 'default')
+
+        router.reset()
+        with use_replica():
+            ReplicaRouter().db_for_write(Post)
+            self.assertEqual(self.read_db(), 'default')
+
+    @override_settings(DATABASE_REPLICA_MAX_LAG=2)
+    @patch('replicas.router.get_lag', return_value=5)
+    def test_lagging_replica_is_not_read(self, get_lag):
+        """
+        A replica further behind than allowed must not be read from
+        """
+        with use_replica():
+            self.assertEqual(self.read_db(), 'default')
+
+    @patch('replicas.router.get_lag', side_effect=DatabaseError)
+    def test_failing_replica_is_checked_again_later(self, get_lag):
+        """
+        A replica that does not answer must not be read from, nor checked
+        again before the check interval passes
+        """
+        with self.assertLogs('replicas.router', 'WARNING') as logs:
+            with use_replica():
+                self.assertEqual(self.read_db(), 'default')
+                self.assertEqual(self.read_db(), 'default')
+
+        self.assertEqual(get_lag.call_count, 1)
+        self.assertIn('replica', logs.output[0])
+
+    def test_lag_of_postgresql_before_10(self):
+        """
+        The lag of a PostgreSQL standby older than 10 must be read with the
+        functions it has
+        """
+        for version, function in [(90600, 'pg_last_xlog_replay_location'),
+                                  (100000, 'pg_last_wal_replay_lsn')]:
+            connection = MagicMock(vendor='postgresql', pg_version=version)
+            cursor = connection.cursor.return_value.__enter__.return_value
+            cursor.fetchone.return_value = (None,)
+
+            with patch('replicas.router.connections',
+                       {'replica': connection}):
+                self.assertEqual(router.get_lag('replica'), 0)
+
+            self.assertIn(function, cursor.execute.call_args[0][0])
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaViewTests(TestCase):
+    """
+    Reads the feed with a second SQLite database standing in for the
+    replica, holding a different text for the same post
+    """
+
+    multi_db = True
+
+    @classmethod
+    def setUpClass(cls):
+        handle, cls.replica_path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+
+        connections.databases['replica'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': cls.replica_path,
+        }
+        call_command('migrate', database='replica', verbosity=0)
+
+        super(ReplicaViewTests, cls).setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super(ReplicaViewTests, cls).tearDownClass()
+
+        connections['replica'].close()
+        del connections['replica']
+        del connections.databases['replica']
+        os.remove(cls.replica_path)
+
+    @classmethod
+    def setUp(cls):
+        caches['liked'].clear()
+        router._checks.clear()
+
+        cls.user = User.objects.create(
+            username='test_user', password='password')
+        profile = Profile.objects.create(user=cls.user)
+        post = Post.objects.create(text='Primary text', author=profile)
+        TimelineEntry.add_own(post)
+
+        # The replica lags behind: the post has another text and version
+        cls.user.save(using='replica', force_insert=True)
+        profile.save(using='replica', force_insert=True)
+        Post.objects.using('replica').bulk_create([Post(
+            id=post.id, text='Replica text', author=profile, version=7,
+            pub_date=post.pub_date)])
+        TimelineEntry.objects.using('replica').bulk_create(
+            [TimelineEntry.objects.get(post=post)])
+
+    @classmethod
+    def tearDown(cls):
+        router._checks.clear()
+
+    def access_feed(self):
+        return self.client.get(reverse('feed:feed'))
+
+    def test_feed_is_read_from_the_replica(self):
+        """
+        The feed must be read from the replica while the client did not
+        write
+        """
+        self.client.force_login(self.user)
+        response = self.access_feed()
+
+        self.assertContains(response, 'Replica text')
+        self.assertNotIn(COOKIE_NAME, response.cookies)
+
+    def test_feed_read_from_the_replica_is_not_validated(self):
+        """
+        The feed read from the replica, which may lag behind the current
+        feed version, must be sent without validators, and the one read
+        from the primary with them
+        """
+        self.client.force_login(self.user)
+        response = self.access_feed()
+
+        self.assertFalse(response.has_header('ETag'))
+        self.assertFalse(response.has_header('Last-Modified'))
+
+        router._checks.clear()
+        with patch('replicas.router.get_lag', side_effect=DatabaseError):
+            with self.assertLogs('replicas.router', 'WARNING'):
+                response = self.access_feed()
+
+        self.assertContains(response, 'Primary text')
+        self.assertTrue(response.has_header('ETag'))
+
+    def test_feed_is_read_from_the_primary_after_writing(self):
+        """
+        After the client wrote, the feed must be read from the primary
+        until the pin cookie expires
+        """
+        self.client.force_login(self.user)
+        response = self.client.post(
+            reverse('feed:like'), {'post_id': Post.objects.get().id})
+        self.assertEqual(response.cookies[COOKIE_NAME]['max-age'],
+                         settings.DATABASE_REPLICA_PIN)
+
+        self.assertContains(self.access_feed(), 'Primary text')
+
+        self.client.cookies[COOKIE_NAME] = '0'
+        self.assertContains(self.access_feed(), 'Replica text')
+
+    def test_feed_is_read_from_the_primary_when_the_replica_fails(self):
+        """
+        The feed must be read from the primary while the replica does not
+        answer
+        """
+        self.client.force_login(self.user)
+
+        with patch('replicas.router.get_lag', side_effect=DatabaseError):
+            with self.assertLogs('replicas.router', 'WARNING'):
+                response = self.access_feed()
+
+        self.assertContains(response, 'Primary text')
@@ -15,49 +15,290 @@ var deletePost = function(url, id) {
     });
 };
 
-var like = function(url, post_id) {
+var showLike = function(post_id, liked, likes_count) {
+    var icon = $("#like_" + post_id);
+    icon.removeAttr("class");
+
+    if(liked) {
+        icon.addClass("material-icons light-green-text text-accent-4");
+    }
+    else {
+        icon.addClass("material-icons grey-text text-darken-2");
+    }
+
+    $("#" + post_id + "_likes").text(likes_count);
+};
+
+// Likes and comment deletions made in a burst are sent together to the
+// batch endpoint, each with the function that handles its result
+var batchQueue = [];
+var batchTimer = null;
+
+var sendBatch = function() {
+    var queue = batchQueue;
+    batchQueue = [];
+    batchTimer = null;
+
     $.ajaxSetup(getAjaxSettings());
 
-    $.post(url, {'post_id': post_id}, function(likes_count) {
-        icon = $("#like_" + post_id);
-        icon.removeAttr("class");
+    $.ajax({
+        url: $("#feed").data("batch-url"),
+        type: "POST",
+        contentType: "application/json",
+        data: JSON.stringify({"actions": $.map(queue, function(item) {
+            return item.action;
+        })})
+    })
+    .done(function(data) {
+        $.each(data.results, function(index, result) {
+            queue[index].done(result);
+        });
+    })
+    .fail(function() {
+        $.each(queue, function(index, item) {
+            item.done({"status": 500});
+        });
+    });
+};
+
+var queueAction = function(action, done) {
+    batchQueue.push({"action": action, "done": done});
 
-        post_likes_number = $("#" + post_id + "_likes");
+    if(batchTimer === null) {
+        batchTimer = setTimeout(sendBatch, 100);
+    }
+};
 
-        if(Number(likes_count) < Number(post_likes_number.text())) {
-            icon.addClass("material-icons grey-text text-darken-2");
+var like = function(url, post_id) {
+    queueAction({"type": "like", "id": post_id}, function(result) {
+        if(result.status == 200) {
+            showLike(post_id, result.liked, result.like_count);
         }
         else {
-            icon.addClass("material-icons light-green-text text-accent-4");
+            showToastMessage('Não foi possível gostar desta publicação!');
         }
+    });
+};
+
+var follow = function(url, profile_id) {
+    $.ajaxSetup(getAjaxSettings());
 
-        post_likes_number.text(likes_count);
+    $.post(url, {'profile_id': profile_id}, function(data) {
+        var text = data.following ? "Deixar de seguir" : "Seguir";
+
+        $(".follow_" + profile_id).text(text);
     })
     .fail(function() {
-        showToastMessage('Não foi possível gostar desta publicação!');
+        showToastMessage("Não foi possível seguir este perfil!");
     });
 };
 
 var deleteComment = function(url, id) {
+    queueAction({"type": "delete_comment", "id": id}, function(result) {
+        if(result.status == 200) {
+            $("#comment_" + id).fadeOut(function() {
+                $(this).remove();
+            });
+        }
+        else {
+            showToastMessage("Não foi possível remover o comentário!");
+        }
+    });
+};
+
+// Publishing and commenting answer with the new card or comment only, which
+// is inserted in place instead of reloading the whole feed
+var publishPost = function(form) {
     $.ajaxSetup(getAjaxSettings());
 
-    $.post(url, {'comment_id': id}, function(data) {
-        $("#comment_" + id).fadeOut(function() {
-            $(this).remove();
+    $.ajax({
+        url: form.attr("action"),
+        type: "POST",
+        data: new FormData(form[0]),
+        processData: false,
+        contentType: false
+    })
+    .done(function(html) {
+        var card = $($.parseHTML($.trim(html)));
+
+        $("#feed").prepend(card);
+        card.find(".dropdown-button").dropdown();
+        form[0].reset();
+    })
+    .fail(function() {
+        showToastMessage("Não foi possível publicar!");
+    });
+};
+
+var appendComment = function(post_id, html) {
+    var comments = $("#comments_" + post_id);
+
+    if(!comments.length) {
+        comments = $('<ul id="comments_' + post_id + '"></ul>');
+        $("#post_" + post_id + " .comment-form").before(
+            $('<div class="card-content grey-text text-darken-2"></div>')
+                .append(comments), "<hr>");
+    }
+
+    comments.append($.parseHTML($.trim(html)));
+};
+
+var addComment = function(form) {
+    var post_id = form.find("input[name=post]").val();
+
+    $.ajaxSetup(getAjaxSettings());
+
+    $.post(form.attr("action"), form.serialize(), function(html) {
+        appendComment(post_id, html);
+        form[0].reset();
+    })
+    .fail(function() {
+        showToastMessage("Não foi possível comentar!");
+    });
+};
+
+// The changes to the posts on the page arrive as server-sent events. The
+// stream is reopened with the new list whenever more posts are loaded
+var events = null;
+var lastEventId = "";
+
+var removeElement = function(selector) {
+    $(selector).fadeOut(function() {
+        $(this).remove();
+    });
+};
+
+var eventHandlers = {
+    "post": function(data) {
+        if(!$("#post_" + data.post).length && !$(".feed-new").length) {
+            $("#feed").prepend(
+                '<div class="feed-new center"><a href="" class="btn-flat orange-text text-accent-4">Novas publicações</a></div>');
+        }
+    },
+    "post_deleted": function(data) {
+        removeElement("#post_" + data.post);
+    },
+    "like": function(data) {
+        $("#" + data.post + "_likes").text(data.count);
+    },
+    "comment": function(data) {
+        if(!$("#comment_" + data.comment).length) {
+            $.get($("#feed").data("comment-url"), {"id": data.comment}, function(html) {
+                if(!$("#comment_" + data.comment).length) {
+                    appendComment(data.post, html);
+                }
+            });
+        }
+    },
+    "comment_deleted": function(data) {
+        removeElement("#comment_" + data.comment);
+    }
+};
+
+var listenEvents = function() {
+    var feed = $("#feed");
+
+    if(!feed.length || !window.EventSource) {
+        return;
+    }
+
+    if(events !== null) {
+        events.close();
+    }
+
+    var posts = feed.find("[id^=post_]").map(function() {
+        return this.id.substr(5);
+    }).get();
+
+    events = new EventSource(feed.data("events-url") + "?" + $.param({
+        "posts": posts.join(","),
+        "last_id": lastEventId
+    }));
+
+    $.each(eventHandlers, function(kind, handler) {
+        events.addEventListener(kind, function(event) {
+            lastEventId = event.lastEventId;
+            handler(JSON.parse(event.data));
         });
+    });
+};
+
+var loadingPosts = false;
+
+var loadPosts = function() {
+    var next = $(".feed-next");
+
+    if(loadingPosts || !next.length) {
+        return;
+    }
+
+    loadingPosts = true;
+
+    $.get(next.data("url"), function(html) {
+        var page = $($.parseHTML($.trim(html)));
+
+        next.replaceWith(page);
+        page.find(".dropdown-button").dropdown();
+        listenEvents();
     })
     .fail(function() {
-        showToastMessage("Não foi possível remover o comentário!");
+        showToastMessage("Não foi possível carregar as publicações!");
+    })
+    .always(function() {
+        loadingPosts = false;
+    });
+};
+
+var loadComments = function(next) {
+    $.get(next.data("url"), function(html) {
+        next.replaceWith($.parseHTML($.trim(html)));
+    })
+    .fail(function() {
+        showToastMessage("Não foi possível carregar os comentários!");
     });
 };
 
 var init = function() {
-    $(".delete-post").click(function(event) {
+    $(document).on("click", ".delete-post, .like-button, .follow-button", function(event) {
+        event.preventDefault();
+    });
+
+    $(document).on("submit", ".post-form", function(event) {
+        // Without a feed to insert the card into, the page is reloaded
+        if($("#feed").length) {
+            event.preventDefault();
+            publishPost($(this));
+        }
+    });
+
+    $(document).on("submit", ".comment-form", function(event) {
         event.preventDefault();
+        addComment($(this));
     });
 
-    $(".like-button").click(function(event) {
+    $(document).on("click", ".feed-new", function(event) {
         event.preventDefault();
+        window.location.reload();
+    });
+
+    $(document).on("click", ".load-comments", function(event) {
+        event.preventDefault();
+        loadComments($(this).closest(".comments-next"));
+    });
+
+    $(document).on("click", ".load-posts", function(event) {
+        event.preventDefault();
+        loadPosts();
+    });
+
+    listenEvents();
+
+    $(window).scroll(function() {
+        var bottom = $(window).scrollTop() + $(window).height();
+
+        if(bottom > $(document).height() - 400) {
+            loadPosts();
+        }
     });
 };
 